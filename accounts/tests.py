@@ -1,3 +1,40 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from shop.models import Product
+from shop.shopper import SHOPPER_STATE_KEY, load_shopper_state
+
+
+class GuestCartMergeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Merge probe', description='x', price=Decimal('30'), stock_quantity=5, image='products/test.jpg',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.post(reverse('shop:guest_cart_update', args=[self.product.pk]), {'delta': 2})
+
+    def test_register_drops_cached_shopper_state(self):
+        # State cached for the id the new account will get, as a reused id or a racing request would leave it
+        next_id = (get_user_model().objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+        cache.set(SHOPPER_STATE_KEY.format(user_id=next_id), ({}, []))
+        response = self.client.post(reverse('accounts:register'), {
+            'username': 'merge-newcomer', 'email': 'new@example.com',
+            'password1': 'An0ther-secret', 'password2': 'An0ther-secret',
+        })
+        self.assertRedirects(response, reverse('shop:cart_view'), fetch_redirect_response=False)
+        user = get_user_model().objects.get(username='merge-newcomer')
+        self.assertEqual(user.pk, next_id)
+        self.assertEqual(load_shopper_state(user).cart_quantities, {self.product.pk: 2})
 
-# Create your tests here.
+    def test_login_drops_cached_shopper_state(self):
+        user = get_user_model().objects.create_user('merge-returning', password='An0ther-secret')
+        cache.set(SHOPPER_STATE_KEY.format(user_id=user.pk), ({}, []))
+        self.client.post(reverse('accounts:login'), {'username': 'merge-returning', 'password': 'An0ther-secret'})
+        self.assertEqual(load_shopper_state(user).cart_quantities, {self.product.pk: 2})
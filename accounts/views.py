@@ -1,6 +1,9 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout
 from django.urls import reverse
+from shop import metrics as shop_metrics
+from shop.guest_cart import merge_guest_cart, pop_guest_cart
+from shop.shopper import invalidate_shopper_state
 from .forms import RegistrationForm, LoginForm
 
 def register_view(request):
@@ -11,7 +14,13 @@ def register_view(request):
         form = RegistrationForm(request.POST)
         if form.is_valid():
             user = form.save()
+            shop_metrics.record_registration()
+            guest_cart = pop_guest_cart(request)
             login(request, user)
+            if merge_guest_cart(user, guest_cart):
+                shop_metrics.record_cart_mutation(request, 'merge')
+                invalidate_shopper_state(request)
+                return redirect('shop:cart_view')
             return redirect('shop:home')
     else:
         form = RegistrationForm()
@@ -27,12 +36,21 @@ def login_view(request):
     
     if request.method == 'POST':
         form = LoginForm(data=request.POST)
-        if form.is_valid():
+        valid = form.is_valid()
+        shop_metrics.record_login(valid)
+        if valid:
             user = form.get_user()
+            guest_cart = pop_guest_cart(request)
             login(request, user)
+            merged = merge_guest_cart(user, guest_cart)
+            if merged:
+                shop_metrics.record_cart_mutation(request, 'merge')
+                invalidate_shopper_state(request)
             # Redirect based on user type after login
             if user.is_staff:
                 return redirect('customadmin:dashboard')
+            if merged:
+                return redirect('shop:cart_view')
             return redirect('shop:home')
     else:
         form = LoginForm()
@@ -0,0 +1,169 @@
+"""
+Sales reports for the admin analytics page.
+
+Revenue is OrderItem.price * quantity for orders that are not cancelled.
+Rather than scanning OrderItem, each report aggregates DailyProductSales,
+the per-day, per-product rollup kept up to date by shop.rollups, so its
+cost follows days x products sold rather than order volume: one GROUP BY
+day (folded into weeks or months here) and one GROUP BY product, which
+also yields the category shares. The series (at most 30 points) is
+post-processed into moving averages and period-over-period growth.
+Finished reports are cached per window and day for ANALYTICS_CACHE_TTL
+seconds.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from shop.models import DailyProductSales, Product
+
+ANALYTICS_CACHE_TTL = getattr(settings, 'ANALYTICS_CACHE_TTL', 60 * 5)
+TOP_PRODUCTS = 10
+
+# window key -> (label, bucket, number of buckets, moving average periods)
+REPORT_WINDOWS = {
+    '30d': ('Last 30 days, daily', 'day', 30, 7),
+    '12w': ('Last 12 weeks, weekly', 'week', 12, 4),
+    '12m': ('Last 12 months, monthly', 'month', 12, 3),
+}
+DEFAULT_WINDOW = '30d'
+
+UNCATEGORISED = 'Uncategorised'
+
+
+def _bucket_starts(bucket, count, today):
+    """The first local date of each of the last ``count`` buckets, oldest first"""
+    if bucket == 'day':
+        return [today - timedelta(days=offset) for offset in range(count - 1, -1, -1)]
+    if bucket == 'week':
+        monday = today - timedelta(days=today.weekday())
+        return [monday - timedelta(weeks=offset) for offset in range(count - 1, -1, -1)]
+    starts, year, month = [], today.year, today.month
+    for _ in range(count):
+        starts.append(today.replace(year=year, month=month, day=1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+
+def _bucket_of(bucket, day):
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def moving_average(values, periods):
+    """Trailing mean over up to ``periods`` values (shorter at the start of the series)"""
+    averages, running = [], 0.0
+    for index, value in enumerate(values):
+        running += value
+        if index >= periods:
+            running -= values[index - periods]
+        averages.append(running / min(index + 1, periods))
+    return averages
+
+
+def growth_rates(values):
+    """Percent change from the previous period; None where the previous period is zero"""
+    if not values:
+        return []
+    return [None] + [
+        (current - previous) / previous * 100 if previous else None
+        for previous, current in zip(values, values[1:])
+    ]
+
+
+def build_report(window):
+    label, bucket, count, periods = REPORT_WINDOWS[window]
+    buckets = _bucket_starts(bucket, count, timezone.localdate())
+    sales = DailyProductSales.objects.filter(day__gte=buckets[0]).order_by()
+
+    by_period = defaultdict(lambda: [0.0, 0])
+    for day, revenue, units in sales.values('day').annotate(
+        revenue=Sum('revenue'), units=Sum('units')
+    ).values_list('day', 'revenue', 'units'):
+        totals = by_period[_bucket_of(bucket, day)]
+        totals[0] += float(revenue or 0)
+        totals[1] += units or 0
+    revenue = [by_period[day][0] if day in by_period else 0.0 for day in buckets]
+    units = [by_period[day][1] if day in by_period else 0 for day in buckets]
+    averages = moving_average(revenue, periods)
+    growth = growth_rates(revenue)
+    series = [
+        {'period': day, 'revenue': revenue[i], 'units': units[i], 'moving_average': averages[i], 'growth': growth[i]}
+        for i, day in enumerate(buckets)
+    ]
+
+    total_revenue = sum(revenue)
+    per_product = {
+        product_id: (float(product_revenue or 0), product_units or 0)
+        for product_id, product_revenue, product_units in sales.filter(product__isnull=False).values(
+            'product_id'
+        ).annotate(
+            revenue=Sum('revenue'), units=Sum('units')
+        ).values_list('product_id', 'revenue', 'units')
+    }
+    names = {
+        pk: (name, category or UNCATEGORISED)
+        for pk, name, category in Product.objects.filter(pk__in=per_product).values_list('pk', 'name', 'category__name')
+    }
+    # Rows of deleted products have no product_id but keep the names they had
+    for product_name, category_name, product_revenue, product_units in sales.filter(product__isnull=True).values(
+        'product_name', 'category_name'
+    ).annotate(
+        revenue=Sum('revenue'), units=Sum('units')
+    ).values_list('product_name', 'category_name', 'revenue', 'units'):
+        key = ('deleted', product_name, category_name)
+        per_product[key] = (float(product_revenue or 0), product_units or 0)
+        names[key] = (f'{product_name or "Unknown product"} (deleted)', category_name or UNCATEGORISED)
+
+    def describe(key):
+        # A product deleted after the sales query ran
+        return names.get(key, (f'Product #{key}', UNCATEGORISED))
+
+    def share(amount):
+        return amount / total_revenue * 100 if total_revenue else 0
+
+    ranked = sorted(per_product.items(), key=lambda item: item[1][0], reverse=True)
+    top_products = [
+        {
+            'product_id': key if isinstance(key, int) else None, 'name': describe(key)[0],
+            'revenue': amount, 'units': sold, 'share': share(amount),
+        }
+        for key, (amount, sold) in ranked[:TOP_PRODUCTS]
+    ]
+    by_category = defaultdict(float)
+    for key, (amount, _sold) in per_product.items():
+        by_category[describe(key)[1]] += amount
+    categories = [
+        {'name': name, 'revenue': amount, 'share': share(amount)}
+        for name, amount in sorted(by_category.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+    return {
+        'window': window,
+        'label': label,
+        'bucket': bucket,
+        'moving_average_periods': periods,
+        'series': series,
+        'total_revenue': total_revenue,
+        'total_units': sum(units),
+        'top_products': top_products,
+        'categories': categories,
+        'generated_at': timezone.now(),
+    }
+
+
+def sales_report(window):
+    """The report for ``window`` (a REPORT_WINDOWS key), cached per window and day"""
+    key = f'analytics:{window}:{timezone.localdate().isoformat()}'
+    report = cache.get(key)
+    if report is None:
+        report = build_report(window)
+        cache.set(key, report, ANALYTICS_CACHE_TTL)
+    return report
@@ -0,0 +1,131 @@
+"""
+Buffered AdminLog writes.
+
+log_admin_action() queues an entry instead of inserting it. While a
+request is in progress (AuditLogMiddleware) the entries are collected
+and, once the response is built, handed to a background writer thread
+that bulk-inserts whatever has accumulated within AUDIT_LOG_FLUSH_INTERVAL
+seconds, up to AUDIT_LOG_BATCH_SIZE rows per INSERT. With
+AUDIT_LOG_BACKGROUND off, the request's entries are bulk-inserted
+synchronously at request end instead. Outside a request (management
+commands, worker threads) entries are written straight away.
+
+Queued entries live only in the worker's memory. A clean shutdown
+drains them (atexit), but a worker killed outright (gunicorn timeout,
+SIGKILL, the OOM killer) loses what it had not written yet: at most the
+last AUDIT_LOG_FLUSH_INTERVAL seconds of entries, and never more than
+AUDIT_LOG_MAX_PENDING of them, because once that many are waiting a
+request writes its own entries synchronously rather than queue them.
+Turn AUDIT_LOG_BACKGROUND off where no window of loss is acceptable.
+
+An entry recorded inside a transaction is only queued once that
+transaction commits, so a rolled-back change leaves no log row, as with
+a direct insert. The timestamp is taken when the action is recorded,
+not when the row is written.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import AdminLog
+
+AUDIT_LOG_BACKGROUND = getattr(settings, 'AUDIT_LOG_BACKGROUND', True)
+AUDIT_LOG_BATCH_SIZE = getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 500)
+AUDIT_LOG_FLUSH_INTERVAL = getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL', 1.0)
+AUDIT_LOG_MAX_PENDING = getattr(settings, 'AUDIT_LOG_MAX_PENDING', 1000)
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_queue = queue.Queue(maxsize=AUDIT_LOG_MAX_PENDING)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def log_admin_action(user, action, model, record_id):
+    entry = AdminLog(user=user, action=action, model=model, record_id=record_id, timestamp=timezone.now())
+    transaction.on_commit(lambda: _collect(entry))
+
+
+def _collect(entry):
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None:
+        _write([entry])
+    else:
+        buffer.append(entry)
+
+
+def _write(entries):
+    AdminLog.objects.bulk_create(entries, batch_size=AUDIT_LOG_BATCH_SIZE)
+
+
+def begin_request():
+    _local.buffer = []
+
+
+def end_request():
+    entries, _local.buffer = getattr(_local, 'buffer', None), None
+    if not entries:
+        return
+    if not AUDIT_LOG_BACKGROUND:
+        _write(entries)
+        return
+    _start_writer()
+    for i, entry in enumerate(entries):
+        try:
+            _queue.put_nowait(entry)
+        except queue.Full:
+            # The writer is behind; keep what a crash could lose bounded
+            _write(entries[i:])
+            return
+
+
+def flush():
+    """Block until every queued entry has been written"""
+    if _writer is not None:
+        _queue.join()
+
+
+def _start_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            thread = threading.Thread(target=_write_forever, name='admin-log-writer', daemon=True)
+            thread.start()
+            atexit.register(flush)
+            _writer = thread
+
+
+def _next_batch():
+    batch = [_queue.get()]
+    deadline = time.monotonic() + AUDIT_LOG_FLUSH_INTERVAL
+    while len(batch) < AUDIT_LOG_BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _write_forever():
+    while True:
+        batch = _next_batch()
+        try:
+            close_old_connections()
+            _write(batch)
+        except Exception:
+            logger.exception(f"Could not write {len(batch)} admin log entries")
+        finally:
+            for _entry in batch:
+                _queue.task_done()
@@ -1,5 +1,6 @@
 from django import forms
 from shop.models import Product, Category
+from shop.images import schedule_derivatives
 
 class ProductForm(forms.ModelForm):
     class Meta:
@@ -9,10 +10,28 @@ class ProductForm(forms.ModelForm):
             'description': forms.Textarea(attrs={'rows': 3}),
         }
 
+    def save(self, commit=True):
+        product = super().save(commit)
+        if commit and 'image' in self.changed_data:
+            schedule_derivatives(product)
+        return product
+
 class CategoryForm(forms.ModelForm):
     class Meta:
         model = Category
         fields = ['name', 'description']
         widgets = {
             'description': forms.Textarea(attrs={'rows': 3}),
-        }
\ No newline at end of file
+        }
+
+class ProductImportUploadForm(forms.Form):
+    file = forms.FileField(help_text='CSV with a header row, or JSON Lines (.jsonl)')
+    dry_run = forms.BooleanField(required=False, label='Validate only, do not save')
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        fmt = upload.name.rsplit('.', 1)[-1].lower()
+        if fmt not in ('csv', 'jsonl'):
+            raise forms.ValidationError('Upload a .csv or .jsonl file.')
+        self.cleaned_data['format'] = fmt
+        return upload
@@ -0,0 +1,279 @@
+"""
+Bulk product import from CSV or JSONL.
+
+Each row is validated with ProductForm's field rules and upserted by
+product name (the catalog has no SKU), IMPORT_CHUNK_SIZE rows at a time:
+one query loads the existing products of the chunk, then one
+bulk_update, one bulk_create and one AdminLog bulk_create write it, in
+a transaction per chunk. Categories are resolved by name from a single
+lookup map. Bulk writes skip the model signals that keep derived data
+current, so each chunk updates facet counts in its own transaction and,
+once it commits, drops cached fragments, updates the search indexes and
+schedules image derivatives.
+
+Uploads from the admin run on a small thread pool; their progress is
+kept in the cache under the job id for the status page to poll. That
+needs a cache every worker shares (Redis, set by REDIS_URL): with the
+per-process LocMemCache fallback, a poll served by another worker finds
+no job and answers 404.
+"""
+import copy
+import csv
+import io
+import json
+import logging
+import posixpath
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django import forms
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from shop.autocomplete import prefix_index
+from shop.facets import product_facet_keys, update_facet_counts
+from shop.fragments import invalidate_fragments
+from shop.images import schedule_derivatives
+from shop.models import Category, Product
+from shop.search import inverted_index
+
+from .forms import ProductForm
+from .models import AdminLog
+
+IMPORT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 200
+IMPORT_COLUMNS = ['name', 'description', 'price', 'stock_quantity', 'category', 'image']
+UPDATE_FIELDS = ['description', 'price', 'stock_quantity', 'category', 'image', 'updated_at']
+IMPORT_FORMATS = ('csv', 'jsonl')
+IMPORT_UPLOAD_ROOT = 'imports'
+IMPORT_JOB_TTL = 60 * 60 * 24
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='product-import')
+
+
+class InvalidImportFile(ValueError):
+    """The upload as a whole cannot be read"""
+
+
+class ProductImportForm(ProductForm):
+    """
+    ProductForm's rules for one import row. The image is an existing
+    storage path rather than an upload, and may be left out when updating;
+    the category is resolved by the importer from its name.
+    """
+    image = forms.CharField(required=False)
+
+    class Meta(ProductForm.Meta):
+        fields = ['name', 'description', 'price', 'stock_quantity', 'image']
+
+    def clean_image(self):
+        name = self.cleaned_data['image'].strip()
+        if not name:
+            if not self.instance.image:
+                raise forms.ValidationError('An image path is required for new products.')
+            return None  # keep the current image
+        if name != self.instance.image.name and not default_storage.exists(name):
+            raise forms.ValidationError(f'No stored image at "{name}".')
+        return name
+
+
+def read_rows(fileobj, fmt):
+    """Yield (line number, row dict) from a binary CSV or JSONL file"""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        yield from (_csv_rows(text) if fmt == 'csv' else _jsonl_rows(text))
+    except UnicodeDecodeError:
+        raise InvalidImportFile("The file is not UTF-8 text") from None
+
+
+def _csv_rows(text):
+    reader = csv.DictReader(text)
+    try:
+        missing = {'name', 'price', 'stock_quantity'} - set(reader.fieldnames or [])
+        if missing:
+            raise InvalidImportFile(f"Missing CSV columns: {', '.join(sorted(missing))}")
+        for row in reader:
+            yield reader.line_num, row
+    except csv.Error as exc:
+        raise InvalidImportFile(f"Line {reader.line_num} is not valid CSV: {exc}") from None
+
+
+def _jsonl_rows(text):
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except (ValueError, RecursionError) as exc:  # JSONDecodeError, or numbers/nesting past the parser's limits
+            raise InvalidImportFile(f"Line {line_number} is not valid JSON: {getattr(exc, 'msg', exc)}") from None
+        if not isinstance(row, dict):
+            raise InvalidImportFile(f"Line {line_number} is not a JSON object")
+        yield line_number, row
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _row_data(row):
+    return {column: '' if row.get(column) is None else str(row[column]).strip() for column in IMPORT_COLUMNS}
+
+
+def _form_errors(form):
+    return '; '.join(f"{field}: {' '.join(errors)}" for field, errors in form.errors.items())
+
+
+class ProductImporter:
+    """Runs an import and keeps the running totals used for progress reporting"""
+
+    def __init__(self, user, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False, progress=None):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.progress = progress
+        self.processed = self.created = self.updated = self.failed = 0
+        self.errors = []
+        self.category_names = dict(Category.objects.values_list('pk', 'name'))
+        self.categories = {name.lower(): pk for pk, name in self.category_names.items()}
+
+    def summary(self):
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+    def _error(self, line_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, message))
+
+    def run(self, rows):
+        for chunk in _chunks(rows, self.chunk_size):
+            self._import_chunk(chunk)
+            self.processed += len(chunk)
+            if self.progress:
+                self.progress(self.summary())
+        return self.summary()
+
+    def _import_chunk(self, chunk):
+        rows = [(line_number, _row_data(row)) for line_number, row in chunk]
+        existing = {}
+        for product in Product.objects.filter(name__in={data['name'] for _line, data in rows}).select_related('category'):
+            existing.setdefault(product.name, []).append(product)
+
+        pending = {}  # name -> product, so repeated names within a chunk update one row
+        before = {}  # pk -> (facet keys, (pk, updated_at), image name) prior to this import
+        for line_number, data in rows:
+            matches = existing.get(data['name'], [])
+            if len(matches) > 1:
+                self._error(line_number, f'{len(matches)} products are named "{data["name"]}"; update them individually.')
+                continue
+            category_id = None
+            if data['category']:
+                category_id = self.categories.get(data['category'].lower())
+                if category_id is None:
+                    self._error(line_number, f'category: No category named "{data["category"]}".')
+                    continue
+            base = pending.get(data['name']) or (matches[0] if matches else Product())
+            # Validate on a copy: the form writes cleaned values onto its instance even when a later field fails
+            form = ProductImportForm(data=data, instance=copy.copy(base))
+            if not form.is_valid():
+                self._error(line_number, _form_errors(form))
+                continue
+            if base.pk is not None and base.pk not in before:
+                before[base.pk] = (product_facet_keys(base), (base.pk, base.updated_at), base.image.name)
+            form.instance.category_id = category_id
+            pending[data['name']] = form.instance
+
+        to_create = [product for product in pending.values() if product.pk is None]
+        to_update = [product for product in pending.values() if product.pk is not None]
+        if self.dry_run:
+            self.created += len(to_create)
+            self.updated += len(to_update)
+            return
+
+        now = timezone.now()
+        with transaction.atomic():
+            for product in to_update:
+                product.updated_at = now
+            Product.objects.bulk_update(to_update, UPDATE_FIELDS)
+            created = Product.objects.bulk_create(to_create)
+            AdminLog.objects.bulk_create(
+                [AdminLog(user=self.user, action='imported (updated)', model='Product', record_id=p.pk) for p in to_update]
+                + [AdminLog(user=self.user, action='imported (created)', model='Product', record_id=p.pk) for p in created]
+            )
+            update_facet_counts(
+                [key for keys, _revision, _image in before.values() for key in keys],
+                product_facet_keys(*to_update, *created),
+            )
+            # The in-process indexes and the fragment cache are not rolled back with the chunk
+            transaction.on_commit(lambda: self._after_commit(to_update, created, before))
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    def _after_commit(self, updated, created, before):
+        invalidate_fragments(*(revision for _keys, revision, _image in before.values()))
+        for product in [*updated, *created]:
+            prefix_index.add('product', product.pk, product.name)
+            if inverted_index.loaded:
+                inverted_index.index_product(
+                    product.pk, product.name, product.description, self.category_names.get(product.category_id, '')
+                )
+            if product.pk not in before or before[product.pk][2] != product.image.name:
+                schedule_derivatives(product)
+
+
+def import_job_key(job_id):
+    return f'product-import:{job_id}'
+
+
+def import_job(job_id):
+    """The state of a background import, or None once it has expired"""
+    return cache.get(import_job_key(job_id))
+
+
+def _save_job(job_id, state, **details):
+    cache.set(import_job_key(job_id), dict(details, state=state), IMPORT_JOB_TTL)
+
+
+def _run_job(job_id, user_id, path, fmt, dry_run):
+    try:
+        user = get_user_model().objects.get(pk=user_id)
+        importer = ProductImporter(
+            user, dry_run=dry_run, progress=lambda summary: _save_job(job_id, 'running', dry_run=dry_run, **summary)
+        )
+        with default_storage.open(path, 'rb') as fileobj:
+            summary = importer.run(read_rows(fileobj, fmt))
+        _save_job(job_id, 'done', dry_run=dry_run, **summary)
+    except InvalidImportFile as e:
+        _save_job(job_id, 'failed', dry_run=dry_run, message=str(e), **importer.summary())
+    except Exception:
+        logger.exception(f"Product import {job_id} failed")
+        _save_job(job_id, 'failed', dry_run=dry_run, message='The import stopped unexpectedly; see the server log.')
+    finally:
+        default_storage.delete(path)
+        connection.close()
+
+
+def start_import(user, upload, fmt, dry_run=False):
+    """Store ``upload`` and import it in the background; returns the job id"""
+    job_id = uuid.uuid4().hex
+    path = default_storage.save(posixpath.join(IMPORT_UPLOAD_ROOT, f'{job_id}.{fmt}'), upload)
+    _save_job(job_id, 'queued', processed=0, created=0, updated=0, failed=0, errors=[], dry_run=dry_run)
+    _executor.submit(_run_job, job_id, user.pk, path, fmt, dry_run)
+    return job_id
@@ -0,0 +1,74 @@
+import gzip
+import json
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from customadmin.models import AdminLog
+
+ARCHIVE_FIELDS = ['id', 'timestamp', 'user_id', 'user__username', 'action', 'model', 'record_id']
+
+
+class Command(BaseCommand):
+    help = (
+        "Move AdminLog entries older than the retention period to gzipped JSONL files, one per month "
+        "(admin-log-YYYY-MM.jsonl.gz), deleting each chunk once it is written. Re-running after an "
+        "interruption may archive the last chunk twice but never loses entries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'ADMIN_LOG_RETENTION_DAYS', 365),
+                            help="Keep entries newer than this many days")
+        parser.add_argument('--output-dir', default=getattr(settings, 'ADMIN_LOG_ARCHIVE_DIR', 'archive'))
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be archived")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old_entries = AdminLog.objects.filter(timestamp__lt=cutoff)
+        if options['dry_run']:
+            months = Counter(
+                f"{timezone.localtime(timestamp):%Y-%m}" for timestamp in old_entries.values_list('timestamp', flat=True)
+            )
+            for month, count in sorted(months.items()):
+                self.stdout.write(f"{month}: {count}")
+            self.stdout.write(self.style.SUCCESS(f"Would archive {sum(months.values())} entries before {cutoff:%Y-%m-%d}"))
+            return
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+        files = {}
+        archived = 0
+        try:
+            while True:
+                # Each pass takes the oldest remaining entries, so no cursor is needed
+                rows = list(old_entries.order_by('timestamp', 'id').values_list(*ARCHIVE_FIELDS)[:options['chunk_size']])
+                if not rows:
+                    break
+                for row in rows:
+                    record = dict(zip(ARCHIVE_FIELDS, row))
+                    record['username'] = record.pop('user__username')
+                    month = f"{timezone.localtime(record['timestamp']):%Y-%m}"
+                    record['timestamp'] = record['timestamp'].isoformat()
+                    if month not in files:
+                        # Appending adds a gzip member; readers see one continuous stream
+                        path = os.path.join(options['output_dir'], f'admin-log-{month}.jsonl.gz')
+                        files[month] = gzip.open(path, 'at', encoding='utf-8')
+                    files[month].write(json.dumps(record) + '\n')
+                for archive in files.values():
+                    archive.flush()
+                    os.fsync(archive.buffer.fileobj.fileno())
+                with transaction.atomic():
+                    AdminLog.objects.filter(pk__in=[row[0] for row in rows]).delete()
+                archived += len(rows)
+                self.stdout.write(f"Archived {archived} entries")
+        finally:
+            for archive in files.values():
+                archive.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived} entries before {cutoff:%Y-%m-%d} to {options['output_dir']}"
+        ))
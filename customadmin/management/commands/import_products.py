@@ -0,0 +1,49 @@
+import posixpath
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from customadmin.imports import IMPORT_CHUNK_SIZE, IMPORT_FORMATS, InvalidImportFile, ProductImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = "Create or update products from a CSV or JSONL file, matching existing products by name"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file to import")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--user', required=True, help="Staff username recorded in the admin log")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Validate every row without writing")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or posixpath.splitext(options['path'])[1].lstrip('.').lower()
+        if fmt not in IMPORT_FORMATS:
+            raise CommandError("Cannot tell the format from the file name; pass --format")
+        try:
+            user = get_user_model().objects.get(username=options['user'], is_staff=True)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No staff user named {options['user']}")
+
+        importer = ProductImporter(
+            user, chunk_size=options['chunk_size'], dry_run=options['dry_run'], progress=self._progress
+        )
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                summary = importer.run(read_rows(fileobj, fmt))
+        except (OSError, InvalidImportFile) as e:
+            raise CommandError(str(e))
+
+        for line_number, message in summary['errors']:
+            self.stderr.write(f"Line {line_number}: {message}")
+        verb = "Would create" if options['dry_run'] else "Created"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {summary['created']} and {'update' if options['dry_run'] else 'updated'} "
+            f"{summary['updated']} products; {summary['failed']} rows failed"
+        ))
+
+    def _progress(self, summary):
+        self.stdout.write(
+            f"{summary['processed']} rows: {summary['created']} created, "
+            f"{summary['updated']} updated, {summary['failed']} failed"
+        )
@@ -0,0 +1,15 @@
+from .audit import begin_request, end_request
+
+
+class AuditLogMiddleware:
+    """Collect the AdminLog entries of a request and write them in one batch once it is done"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        begin_request()
+        try:
+            return self.get_response(request)
+        finally:
+            end_request()
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -9,7 +10,14 @@ class AdminLog(models.Model):
     action = models.CharField(max_length=255)
     model = models.CharField(max_length=100)
     record_id = models.PositiveIntegerField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the action is recorded; entries are written later in batches (see customadmin.audit)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Log view keyset and retention range scans
+            models.Index(fields=['-timestamp', '-id'], name='adminlog_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} {self.action} {self.model} #{self.record_id}"
\ No newline at end of file
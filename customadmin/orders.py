@@ -0,0 +1,135 @@
+from datetime import datetime, time, timedelta
+from urllib.parse import urlencode
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from shop.models import Order
+from shop.rollups import orders_moved
+
+from .models import AdminLog
+
+ORDER_PAGE_SIZE = 50
+
+# sort key -> (field, descending); every option is backed by an Order index
+ORDER_SORTS = {
+    'newest': ('created_at', True),
+    'oldest': ('created_at', False),
+    'amount_desc': ('total_amount', True),
+    'amount_asc': ('total_amount', False),
+}
+DEFAULT_ORDER_SORT = 'newest'
+
+# Status changes allowed from the bulk action; the order page can still set any status
+ORDER_STATUS_TRANSITIONS = {
+    'pending': ('processing', 'cancelled'),
+    'processing': ('shipped', 'cancelled'),
+    'shipped': ('delivered',),
+    'delivered': (),
+    'cancelled': (),
+}
+MAX_BULK_ORDERS = 500
+
+STATUS_VALUES = {value for value, _label in Order.STATUS_CHOICES}
+COUNTRY_VALUES = {value for value, _label in Order.COUNTRY_CHOICES}
+
+
+def _date_param(params, name):
+    try:
+        return parse_date(params.get(name, ''))
+    except ValueError:
+        return None
+
+
+def _local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def order_filters(params):
+    """Pick the supported order list filters and sort out of a GET QueryDict"""
+    filters = {}
+    if params.get('status') in STATUS_VALUES:
+        filters['status'] = params['status']
+    if params.get('country') in COUNTRY_VALUES:
+        filters['country'] = params['country']
+    for name in ('date_from', 'date_to'):
+        day = _date_param(params, name)
+        if day is not None:
+            filters[name] = day
+    if params.get('sort') in ORDER_SORTS:
+        filters['sort'] = params['sort']
+    return filters
+
+
+def order_queryset(filters):
+    """
+    Orders matching ``filters``. Dates are whole local days and are turned
+    into created_at ranges, so the (status|country, created_at, id)
+    indexes serve filter and sort together.
+    """
+    orders = Order.objects.all()
+    if 'status' in filters:
+        orders = orders.filter(status=filters['status'])
+    if 'country' in filters:
+        orders = orders.filter(country=filters['country'])
+    if 'date_from' in filters:
+        orders = orders.filter(created_at__gte=_local_midnight(filters['date_from']))
+    if 'date_to' in filters:
+        orders = orders.filter(created_at__lt=_local_midnight(filters['date_to'] + timedelta(days=1)))
+    return orders
+
+
+def order_sort(filters):
+    """(field, descending) for the selected sort"""
+    return ORDER_SORTS[filters.get('sort', DEFAULT_ORDER_SORT)]
+
+
+def order_ordering(filters):
+    """order_by() arguments matching the keyset order of the selected sort"""
+    field, descending = order_sort(filters)
+    prefix = '-' if descending else ''
+    return [f'{prefix}{field}', f'{prefix}id']
+
+
+def order_query_string(filters, **changes):
+    """Query string for the current filters with ``changes`` applied (None removes a key)"""
+    params = {key: str(value) for key, value in filters.items()}
+    for key, value in changes.items():
+        if value is None:
+            params.pop(key, None)
+        else:
+            params[key] = value
+    return f"?{urlencode(params)}" if params else '?'
+
+
+def bulk_transition(user, order_ids, new_status):
+    """
+    Move the orders in ``order_ids`` that may go to ``new_status``, with one
+    ``UPDATE ... WHERE id IN (...) AND status = <from>`` per current status
+    and one AdminLog bulk_create. Returns (moved order ids, skipped count).
+    """
+    with transaction.atomic():
+        # Lock the rows so the rollups move the statuses they really had
+        rows = list(
+            Order.objects.select_for_update().filter(pk__in=order_ids).order_by('pk')
+            .values_list('pk', 'created_at', 'status', 'total_amount')
+        )
+        by_status = {}
+        for row in rows:
+            by_status.setdefault(row[2], []).append(row)
+        moved = []
+        now = timezone.now()
+        for old_status, orders in by_status.items():
+            if new_status not in ORDER_STATUS_TRANSITIONS.get(old_status, ()):
+                continue
+            Order.objects.filter(pk__in=[order[0] for order in orders], status=old_status).update(
+                status=new_status, updated_at=now
+            )
+            moved.extend(orders)
+        orders_moved(moved, new_status)
+        AdminLog.objects.bulk_create([
+            AdminLog(user=user, action=f'updated ({new_status})', model='Order status', record_id=order[0])
+            for order in moved
+        ])
+    return [order[0] for order in moved], len(set(order_ids)) - len(moved)
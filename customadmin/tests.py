@@ -1,3 +1,252 @@
+import csv
+import io
+import json
+import os
+import queue
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
 from django.test import TestCase
+from django.urls import reverse
+
+from shop.autocomplete import prefix_index
+from shop.checkout import place_order
+from shop.models import Cart, Category, DailyOrderRollup, DailyProductSales, Order, Product
+from shop.rollups import rebuild_order_rollups
+
+from . import audit
+from .analytics import build_report, growth_rates, moving_average
+from .exports import export_stream
+from .imports import InvalidImportFile, ProductImporter, read_rows
+from .models import AdminLog
+
+
+class SalesReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.staff = User.objects.create_user('report-staff', is_staff=True)
+        customer = User.objects.create_user('report-customer')
+        category = Category.objects.create(name='Audio')
+        cls.product = Product.objects.create(
+            name='Studio monitor', description='Speaker', price=Decimal('250'), stock_quantity=10,
+            image='products/test.jpg', category=category,
+        )
+        Cart.objects.create(user=customer, product=cls.product, quantity=2)
+        place_order(customer, Cart.objects.filter(user=customer).select_related('product'), {})
+
+    def setUp(self):
+        cache.clear()
+
+    def test_deleted_product_keeps_its_revenue(self):
+        self.client.force_login(self.staff)
+        self.client.post(reverse('customadmin:product_delete', args=[self.product.pk]))
+        self.assertFalse(Product.objects.filter(pk=self.product.pk).exists())
+
+        report = build_report('30d')
+        self.assertEqual(report['total_revenue'], 500.0)
+        self.assertEqual(report['top_products'][0]['name'], 'Studio monitor (deleted)')
+        self.assertEqual(report['categories'][0]['name'], 'Audio')
+
+        rebuild_order_rollups()
+        row = DailyProductSales.objects.get()
+        self.assertEqual((row.product_id, row.product_name, row.revenue), (None, 'Studio monitor', Decimal('500')))
+
+    def test_series_helpers(self):
+        self.assertEqual(moving_average([3, 6, 9, 12], 2), [3.0, 4.5, 7.5, 10.5])
+        self.assertEqual(growth_rates([0, 10, 15]), [None, None, 50.0])
+        self.assertEqual(growth_rates([]), [])
+
+
+class OrderBulkStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.staff = User.objects.create_user('bulk-staff', is_staff=True)
+        customer = User.objects.create_user('bulk-customer')
+        product = Product.objects.create(
+            name='Bulk cable', description='Cable', price=Decimal('20'), stock_quantity=50,
+            image='products/test.jpg', category=Category.objects.create(name='Cables'),
+        )
+        cls.orders = []
+        for _ in range(3):
+            Cart.objects.create(user=customer, product=product, quantity=2)
+            cls.orders.append(place_order(customer, Cart.objects.filter(user=customer).select_related('product'), {}))
+        Order.objects.filter(pk=cls.orders[2].pk).update(status='delivered')
+        rebuild_order_rollups()
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def post(self, new_status, orders):
+        return self.client.post(
+            reverse('customadmin:order_bulk_status'),
+            {'status': new_status, 'orders': [order.pk for order in orders]},
+            follow=True,
+        )
+
+    def rollups(self):
+        return {
+            row.status: (row.order_count, row.revenue, row.items_sold)
+            for row in DailyOrderRollup.objects.exclude(order_count=0)
+        }
+
+    def test_disallowed_transitions_are_skipped_and_reported(self):
+        response = self.post('processing', self.orders)
+
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            [statuses[order.pk] for order in self.orders], ['processing', 'processing', 'delivered']
+        )
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['2 orders marked processing.', '1 order could not move to processing from their current status.'],
+        )
+
+    def test_rollups_follow_the_move(self):
+        self.post('processing', self.orders)
+
+        moved = self.rollups()
+        self.assertEqual(moved, {
+            'processing': (2, Decimal('80'), 4),
+            'delivered': (1, Decimal('40'), 2),
+        })
+        rebuild_order_rollups()
+        self.assertEqual(self.rollups(), moved)
+
+    def test_one_log_row_per_changed_order(self):
+        self.post('cancelled', self.orders)
+
+        logs = AdminLog.objects.filter(model='Order status')
+        self.assertEqual(
+            sorted(logs.values_list('record_id', flat=True)), [self.orders[0].pk, self.orders[1].pk]
+        )
+        self.assertEqual(set(logs.values_list('action', 'user')), {('updated (cancelled)', self.staff.pk)})
+
+    def test_selection_over_the_limit_is_refused(self):
+        with mock.patch('customadmin.views.MAX_BULK_ORDERS', 2):
+            response = self.post('processing', self.orders)
+
+        self.assertEqual(
+            [str(message) for message in response.context['messages']], ['Select at most 2 orders at a time.']
+        )
+        self.assertEqual(Order.objects.filter(status='pending').count(), 2)
+        self.assertFalse(AdminLog.objects.exists())
+
+    def test_next_page_link_continues_the_filtered_list(self):
+        list_url = reverse('customadmin:order_list')
+        with mock.patch('customadmin.views.ORDER_PAGE_SIZE', 1):
+            first = self.client.get(list_url, {'status': 'pending'})
+            self.assertEqual(list(first.context['orders']), [self.orders[1]])
+            self.assertContains(first, 'Next page')
+            self.assertIn('status=pending', first.context['next_url'])
+            second = self.client.get(list_url + first.context['next_url'])
+
+        self.assertEqual(list(second.context['orders']), [self.orders[0]])
+        self.assertIsNone(second.context['next_url'])
+        self.assertEqual(second.context['first_page_url'], '?status=pending')
+
+class OrderExportTests(TestCase):
+    def test_csv_cells_cannot_run_formulas(self):
+        customer = get_user_model().objects.create_user('=cmd|calc')
+        product = Product.objects.create(
+            name='@SUM(A1:A9)', description='x', price=Decimal('5'), stock_quantity=5, image='products/test.jpg',
+        )
+        Cart.objects.create(user=customer, product=product, quantity=1)
+        details = {'first_name': '=HYPERLINK("http://example.com")', 'last_name': 'Plain', 'phone': '+911234',
+                   'city': '-2+3', 'email': 'a@example.com'}
+        place_order(customer, Cart.objects.filter(user=customer).select_related('product'), details)
+
+        rows = list(csv.reader(b''.join(export_stream(Order.objects.all(), 'csv')).decode().splitlines()))
+        row = dict(zip(rows[0], rows[1]))
+        self.assertEqual(row['username'], "'=cmd|calc")
+        self.assertEqual(row['first_name'], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(row['phone'], "'+911234")
+        self.assertEqual(row['city'], "'-2+3")
+        self.assertEqual(row['item_product_name'], "'@SUM(A1:A9)")
+        self.assertEqual((row['last_name'], row['email']), ('Plain', 'a@example.com'))
+
+        record = json.loads(b''.join(export_stream(Order.objects.all(), 'jsonl')))
+        self.assertEqual(record['first_name'], '=HYPERLINK("http://example.com")')
+
+
+class ProductImportTests(TestCase):
+    CSV_HEADER = b'name,description,price,stock_quantity,image\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = get_user_model().objects.create_user('import-staff', is_staff=True)
+
+    def rows(self, data, fmt='csv'):
+        return list(read_rows(io.BytesIO(data), fmt))
+
+    def test_unreadable_files_are_reported(self):
+        bad_files = [
+            (self.CSV_HEADER + 'Caf\xe9,x,10,1,products/test.jpg\n'.encode('latin-1'), 'csv'),
+            (self.CSV_HEADER + b'Huge,"' + b'x' * (csv.field_size_limit() + 1) + b'",10,1,products/test.jpg\n', 'csv'),
+            (b'{"name": "\xff"}\n', 'jsonl'),
+            (b'{"price": ' + b'9' * 5000 + b'}\n', 'jsonl'),
+        ]
+        for data, fmt in bad_files:
+            with self.subTest(data=data[:60]), self.assertRaises(InvalidImportFile):
+                self.rows(data, fmt)
+
+    def test_command_reports_unreadable_file(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as upload:
+            upload.write(self.CSV_HEADER + b'\xff\xfe,x,1,1,products/test.jpg\n')
+        self.addCleanup(os.remove, upload.name)
+        with self.assertRaisesMessage(CommandError, 'not UTF-8'):
+            call_command('import_products', upload.name, user='import-staff', stdout=io.StringIO())
+
+    def test_indexes_wait_for_commit(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with self.settings(MEDIA_ROOT=media_root):
+            image = default_storage.save('products/lamp.jpg', ContentFile(b'jpeg'))
+            prefix_index.reset()
+            self.addCleanup(prefix_index.reset)
+            self.assertEqual(prefix_index.complete('import probe'), [])  # loads the index
+            rows = self.rows(self.CSV_HEADER + f'Import probe lamp,Desk lamp,40,3,{image}\n'.encode())
+            with mock.patch('customadmin.imports.schedule_derivatives') as schedule:
+                with self.captureOnCommitCallbacks(execute=True):
+                    summary = ProductImporter(self.staff).run(rows)
+                    self.assertEqual((summary['created'], summary['failed']), (1, 0))
+                    self.assertEqual(prefix_index.complete('import probe'), [])
+                    schedule.assert_not_called()
+        product = Product.objects.get(name='Import probe lamp')
+        self.assertEqual(prefix_index.complete('import probe'), [('product', product.pk, 'Import probe lamp')])
+        schedule.assert_called_once_with(product)
+
+    def test_upload_leaves_the_logging_to_the_job(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.client.force_login(self.staff)
+        upload = ContentFile(self.CSV_HEADER + b'Queued lamp,Desk lamp,40,3,\n', name='products.csv')
+        with self.settings(MEDIA_ROOT=media_root), mock.patch('customadmin.imports._executor') as executor, \
+                mock.patch('customadmin.views.log_admin_action') as log_admin_action:
+            response = self.client.post(reverse('customadmin:product_import'), {'file': upload})
+        self.assertEqual(response.status_code, 302)
+        executor.submit.assert_called_once()
+        log_admin_action.assert_not_called()
+
+
+class AuditLogTests(TestCase):
+    def test_full_queue_writes_synchronously(self):
+        staff = get_user_model().objects.create_user('audit-staff', is_staff=True)
+        pending = queue.Queue(maxsize=2)
+        with mock.patch.object(audit, '_queue', pending), mock.patch.object(audit, '_start_writer'):
+            audit.begin_request()
+            with self.captureOnCommitCallbacks(execute=True):
+                for record_id in range(5):
+                    audit.log_admin_action(staff, 'updated', 'Product', record_id)
+            audit.end_request()
 
-# Create your tests here.
+        self.assertEqual(pending.qsize(), 2)
+        self.assertEqual(list(AdminLog.objects.order_by('record_id').values_list('record_id', flat=True)), [2, 3, 4])
@@ -5,8 +5,12 @@ app_name = 'customadmin'
 
 urlpatterns = [
     path('', views.admin_dashboard, name='dashboard'),
+    path('analytics/', views.analytics, name='analytics'),
+    path('perf/', views.perf_dashboard, name='perf'),
     path('products/', views.product_list, name='product_list'),
     path('products/create/', views.product_create, name='product_create'),
+    path('products/import/', views.product_import, name='product_import'),
+    path('products/import/<str:job_id>/', views.product_import_status, name='product_import_status'),
     path('products/update/<int:pk>/', views.product_update, name='product_update'),
     path('products/delete/<int:pk>/', views.product_delete, name='product_delete'),
     path('categories/', views.category_list, name='category_list'),
@@ -14,6 +18,8 @@ urlpatterns = [
     path('categories/update/<int:pk>/', views.category_update, name='category_update'),
     path('categories/delete/<int:pk>/', views.category_delete, name='category_delete'),
     path('orders/', views.order_list, name='order_list'),
+    path('orders/export/', views.order_export, name='order_export'),
+    path('orders/bulk-status/', views.order_bulk_status, name='order_bulk_status'),
     path('orders/<int:pk>/', views.order_detail, name='order_detail'),
     path('orders/<int:pk>/update-status/', views.order_update_status, name='order_update_status'),
     path('logs/', views.admin_logs, name='admin_logs'),
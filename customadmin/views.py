@@ -1,8 +1,28 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from shop.models import Product, Category
-from .forms import ProductForm, CategoryForm
+from shop.models import Product, Category, OrderItem
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.db import transaction
+from django.db.models import Prefetch
+from datetime import datetime, timezone as dt_timezone
+from shop.category_cache import get_categories
+from shop.facets import category_deleted, facet_counts, product_facet_keys, update_facet_counts
+from shop.rollups import dashboard_metrics, orders_moved
+from shop.pagination import InvalidCursor, estimated_count, keyset_page
+from shop.profiling import read_records, view_stats
+from .audit import log_admin_action
+from .analytics import DEFAULT_WINDOW, REPORT_WINDOWS, sales_report
+from .exports import EXPORT_FORMATS, export_stream
+from .forms import ProductForm, CategoryForm, ProductImportUploadForm
+from .imports import IMPORT_COLUMNS, import_job, start_import
+from .orders import (
+    DEFAULT_ORDER_SORT, MAX_BULK_ORDERS, ORDER_PAGE_SIZE, bulk_transition, order_filters, order_ordering,
+    order_query_string, order_queryset, order_sort,
+)
 from .models import AdminLog
 
 
@@ -22,19 +42,13 @@ def admin_required(view_func):
 def is_admin(user):
     return user.is_authenticated and user.is_staff
 
-def log_admin_action(user, action, model, record_id):
-    AdminLog.objects.create(
-        user=user,
-        action=action,
-        model=model,
-        record_id=record_id
-    )
+ADMIN_LOG_PAGE_SIZE = 100
 
 # Product Views
 @login_required
 @user_passes_test(is_admin)
 def product_list(request):
-    products = Product.objects.all().order_by('-created_at')
+    products = Product.objects.select_related('category').order_by('-created_at')
     return render(request, 'customadmin/products/list.html', {
         'products': products,
         'active': 'products'
@@ -47,6 +61,7 @@ def product_create(request):
         form = ProductForm(request.POST, request.FILES)
         if form.is_valid():
             product = form.save()
+            update_facet_counts([], product_facet_keys(product))
             log_admin_action(request.user, 'created', 'Product', product.id)
             messages.success(request, 'Product created successfully!')
             return redirect('customadmin:product_list')
@@ -64,9 +79,12 @@ def product_create(request):
 def product_update(request, pk):
     product = get_object_or_404(Product, pk=pk)
     if request.method == 'POST':
+        # Snapshot before validation, which copies the posted values onto the instance
+        facet_keys = product_facet_keys(product)
         form = ProductForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
             product = form.save()
+            update_facet_counts(facet_keys, product_facet_keys(product))
             log_admin_action(request.user, 'updated', 'Product', product.id)
             messages.success(request, 'Product updated successfully!')
             return redirect('customadmin:product_list')
@@ -85,7 +103,9 @@ def product_delete(request, pk):
     product = get_object_or_404(Product, pk=pk)
     if request.method == 'POST':
         product_id = product.id
+        facet_keys = product_facet_keys(product)
         product.delete()
+        update_facet_counts(facet_keys, [])
         log_admin_action(request.user, 'deleted', 'Product', product_id)
         messages.success(request, 'Product deleted successfully!')
         return redirect('customadmin:product_list')
@@ -95,6 +115,36 @@ def product_delete(request, pk):
         'active': 'products'
     })
 
+@login_required
+@user_passes_test(is_admin)
+def product_import(request):
+    if request.method == 'POST':
+        form = ProductImportUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            dry_run = form.cleaned_data['dry_run']
+            job_id = start_import(request.user, form.cleaned_data['file'], form.cleaned_data['format'], dry_run)
+            return redirect('customadmin:product_import_status', job_id=job_id)
+    else:
+        form = ProductImportUploadForm()
+
+    return render(request, 'customadmin/products/import.html', {
+        'form': form,
+        'columns': IMPORT_COLUMNS,
+        'active': 'products'
+    })
+
+@login_required
+@user_passes_test(is_admin)
+def product_import_status(request, job_id):
+    job = import_job(job_id)
+    if job is None:
+        raise Http404("No such import")
+    return render(request, 'customadmin/products/import_status.html', {
+        'job': job,
+        'finished': job['state'] in ('done', 'failed'),
+        'active': 'products'
+    })
+
 # Category Views
 @login_required
 @user_passes_test(is_admin)
@@ -151,6 +201,7 @@ def category_delete(request, pk):
     if request.method == 'POST':
         category_id = category.id
         category.delete()
+        category_deleted(category_id)
         log_admin_action(request.user, 'deleted', 'Category', category_id)
         messages.success(request, 'Category deleted successfully!')
         return redirect('customadmin:category_list')
@@ -164,40 +215,174 @@ def category_delete(request, pk):
 @login_required
 @user_passes_test(is_admin)
 def admin_logs(request):
-    logs = AdminLog.objects.all().order_by('-timestamp')
+    cursor = request.GET.get('cursor')
+    try:
+        logs, next_cursor = keyset_page(
+            AdminLog.objects.select_related('user'), cursor, ADMIN_LOG_PAGE_SIZE, field='timestamp'
+        )
+    except InvalidCursor:
+        return redirect('customadmin:admin_logs')
     return render(request, 'customadmin/logs.html', {
         'logs': logs,
+        'first_page_url': '?' if cursor else None,
+        'next_url': f'?cursor={next_cursor}' if next_cursor else None,
         'active': 'logs'
     })
 # customadmin/views.py
 from shop.models import Order
 
+DASHBOARD_DAYS = 14
+
 @login_required
 @user_passes_test(is_admin)
 def admin_dashboard(request):
     products = Product.objects.all().order_by('-created_at')[:5]
-    categories = Category.objects.all()
     orders = Order.objects.all().order_by('-created_at')[:5]
+    product_counts = facet_counts()['stock']
     return render(request, 'customadmin/dashboard.html', {
         'products': products,
-        'categories': categories,
         'orders': orders,
+        'product_total': product_counts['in'] + product_counts['out'],
+        'out_of_stock_total': product_counts['out'],
+        'category_total': len(get_categories()),
+        'metrics': dashboard_metrics(days=DASHBOARD_DAYS),
+        'dashboard_days': DASHBOARD_DAYS,
         'active': 'dashboard'
     })
+@login_required
+@user_passes_test(is_admin)
+def analytics(request):
+    window = request.GET.get('window')
+    if window not in REPORT_WINDOWS:
+        window = DEFAULT_WINDOW
+    return render(request, 'customadmin/analytics.html', {
+        'report': sales_report(window),
+        'windows': [(key, label) for key, (label, *_rest) in REPORT_WINDOWS.items()],
+        'active': 'analytics'
+    })
+
+# window key -> (label, seconds)
+PERF_WINDOWS = {
+    '15m': ('Last 15 minutes', 15 * 60),
+    '1h': ('Last hour', 60 * 60),
+    '24h': ('Last 24 hours', 24 * 60 * 60),
+}
+DEFAULT_PERF_WINDOW = '1h'
+SLOW_REQUESTS_SHOWN = 25
+
+@login_required
+@user_passes_test(is_admin)
+def perf_dashboard(request):
+    window = request.GET.get('window')
+    if window not in PERF_WINDOWS:
+        window = DEFAULT_PERF_WINDOW
+    label, seconds = PERF_WINDOWS[window]
+    records = read_records(seconds)
+    selected_view = request.GET.get('view')
+    slow_requests = sorted(
+        (record for record in records if not selected_view or record['view'] == selected_view),
+        key=lambda record: record['total_ms'], reverse=True,
+    )[:SLOW_REQUESTS_SHOWN]
+    for record in slow_requests:
+        record['time'] = datetime.fromtimestamp(record['ts'], tz=dt_timezone.utc)
+    return render(request, 'customadmin/perf.html', {
+        'stats': view_stats(records),
+        'slow_requests': slow_requests,
+        'record_count': len(records),
+        'window': window,
+        'window_label': label,
+        'windows': [(key, window_label) for key, (window_label, _seconds) in PERF_WINDOWS.items()],
+        'selected_view': selected_view,
+        'active': 'perf'
+    })
+
 # customadmin/views.py
 @login_required
 @user_passes_test(is_admin)
 def order_list(request):
-    orders = Order.objects.all().order_by('-created_at')
+    filters = order_filters(request.GET)
+    field, descending = order_sort(filters)
+    orders = order_queryset(filters)
+    try:
+        page, next_cursor = keyset_page(
+            orders, request.GET.get('cursor'), ORDER_PAGE_SIZE, field=field, descending=descending
+        )
+    except InvalidCursor:
+        return redirect(f"{reverse('customadmin:order_list')}{order_query_string(filters)}")
+    total, total_is_estimate = estimated_count(orders)
+
+    current_sort = filters.get('sort', DEFAULT_ORDER_SORT)
     return render(request, 'customadmin/orders/list.html', {
-        'orders': orders,
+        'orders': page,
+        'filters': filters,
+        'status_choices': Order.STATUS_CHOICES,
+        'country_choices': Order.COUNTRY_CHOICES,
+        'total': total,
+        'total_is_estimate': total_is_estimate,
+        'date_sort_url': order_query_string(filters, sort='oldest' if current_sort == 'newest' else 'newest'),
+        'amount_sort_url': order_query_string(filters, sort='amount_asc' if current_sort == 'amount_desc' else 'amount_desc'),
+        'current_sort': current_sort,
+        'first_page_url': order_query_string(filters) if request.GET.get('cursor') else None,
+        'next_url': order_query_string(filters, cursor=next_cursor) if next_cursor else None,
+        'export_query': order_query_string(filters),
+        'max_bulk_orders': MAX_BULK_ORDERS,
         'active': 'orders'
     })
 
+@login_required
+@user_passes_test(is_admin)
+def order_export(request):
+    """Stream the orders matching the order list filters as CSV or JSONL, optionally gzipped"""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+    compress = request.GET.get('gzip') == '1'
+    filters = order_filters(request.GET)
+    orders = order_queryset(filters).order_by(*order_ordering(filters))
+
+    content_type, extension = EXPORT_FORMATS[fmt]
+    filename = f"orders-{timezone.localtime():%Y%m%d-%H%M}.{extension}"
+    if compress:
+        content_type, filename = 'application/gzip', f"{filename}.gz"
+    response = StreamingHttpResponse(export_stream(orders, fmt, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    log_admin_action(request.user, f'exported ({fmt})', 'Orders', 0)
+    return response
+
+@login_required
+@user_passes_test(is_admin)
+def order_bulk_status(request):
+    next_url = request.POST.get('next')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = reverse('customadmin:order_list')
+    if request.method != 'POST':
+        return redirect(next_url)
+
+    new_status = request.POST.get('status')
+    try:
+        order_ids = [int(pk) for pk in request.POST.getlist('orders')]
+    except ValueError:
+        order_ids = []
+    if new_status not in [choice[0] for choice in Order.STATUS_CHOICES]:
+        messages.error(request, 'Invalid status!')
+    elif not order_ids:
+        messages.error(request, 'Select at least one order.')
+    elif len(order_ids) > MAX_BULK_ORDERS:
+        messages.error(request, f'Select at most {MAX_BULK_ORDERS} orders at a time.')
+    else:
+        moved, skipped = bulk_transition(request.user, order_ids, new_status)
+        if moved:
+            messages.success(request, f"{len(moved)} order{'s' if len(moved) != 1 else ''} marked {new_status}.")
+        if skipped:
+            messages.error(request, f"{skipped} order{'s' if skipped != 1 else ''} could not move to {new_status} from their current status.")
+    return redirect(next_url)
+
 @login_required
 @user_passes_test(is_admin)
 def order_detail(request, pk):
-    order = get_object_or_404(Order, pk=pk)
+    order = get_object_or_404(
+        Order.objects.prefetch_related(Prefetch('items', OrderItem.objects.select_related('product'))), pk=pk
+    )
     return render(request, 'customadmin/orders/detail.html', {
         'order': order,
         'active': 'orders'
@@ -210,8 +395,13 @@ def order_update_status(request, pk):
     if request.method == 'POST':
         new_status = request.POST.get('status')
         if new_status in [choice[0] for choice in Order.STATUS_CHOICES]:
-            order.status = new_status
-            order.save()
+            with transaction.atomic():
+                # Lock the row so the rollups move the status it really had
+                order = Order.objects.select_for_update().get(pk=order.pk)
+                old_status = order.status
+                order.status = new_status
+                order.save()
+                orders_moved([(order.pk, order.created_at, old_status, order.total_amount)], new_status)
             log_admin_action(request.user, 'updated', 'Order status', order.id)
             messages.success(request, 'Order status updated successfully!')
         else:
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,20 +38,25 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shop.middleware.PerfMiddleware',
+    'shop.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'shop.middleware.ThrottledSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shop.middleware.ShopperStateMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'customadmin.middleware.AuditLogMiddleware',
 ]
 
 ROOT_URLCONF = 'electroshop.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to shop.profiling
+        'BACKEND': 'shop.profiling.ProfiledDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -60,6 +66,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'shop.context_processors.categories',  # custom context processor
+                'shop.context_processors.shopper',
             ],
         },
     },
@@ -135,9 +142,69 @@ EMAIL_HOST_USER = 'your-email@gmail.com'
 EMAIL_HOST_PASSWORD = 'your-email-password'
 DEFAULT_FROM_EMAIL = 'ElectroShop <noreply@electroshop.com>'
 
+# Cache Configuration (Redis in production so every worker shares the same entries;
+# product import progress lives here, so LocMemCache only suits a single worker)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'shop.profiling.ProfiledRedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'shop.profiling.ProfiledLocMemCache',
+        }
+    }
+
+# How long a submitted checkout holds the stock of a shopper's cart (seconds);
+# opening the checkout page holds nothing
+STOCK_HOLD_TTL = 600
+
 # Session Settings
 SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds
-SESSION_SAVE_EVERY_REQUEST = True
+# ThrottledSessionMiddleware slides the expiry once this fraction of
+# SESSION_COOKIE_AGE has passed, instead of saving on every request
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_FRACTION = 0.1
+# With a shared cache, read sessions from it and write through to the DB
+SESSION_ENGINE = os.environ.get(
+    'SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if REDIS_URL else 'django.contrib.sessions.backends.db',
+)
+
+# Log views that exceed their shop.querybudget.QUERY_BUDGETS entry or
+# repeat a query N_PLUS_ONE_THRESHOLD times; on in development/staging
+QUERY_BUDGET_ENABLED = DEBUG or os.environ.get('QUERY_BUDGET_ENABLED') == '1'
+N_PLUS_ONE_THRESHOLD = 5
+
+# Request profiling: Server-Timing on every response; PERF_SAMPLE_RATE of
+# requests plus every request slower than PERF_SLOW_MS is stored for the
+# custom admin perf page
+PERF_ENABLED = True
+PERF_SAMPLE_RATE = 0.1
+PERF_SLOW_MS = 500
+# Outside the deployed tree; set PERF_LOG_DIR to keep records across reboots
+PERF_LOG_DIR = os.environ.get('PERF_LOG_DIR', os.path.join(tempfile.gettempdir(), 'electroshop-perf'))
+PERF_RETENTION_DAYS = 7
+
+# Prometheus metrics at /metrics (see shop.metrics, needs prometheus_client);
+# set PROMETHEUS_MULTIPROC_DIR in the environment when running several
+# gunicorn workers. Scrapes must send "Authorization: Bearer <token>"; without
+# a token only signed-in staff can open it. The request, SQL and cache
+# metrics come from PerfMiddleware and stop with PERF_ENABLED = False
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# AdminLog entries are written in batches by a background thread, so a
+# worker killed outright loses up to a second of entries (see
+# customadmin.audit; set False to write them before each response);
+# archive_admin_logs moves entries older than the retention period to
+# gzipped JSONL files, one per month
+AUDIT_LOG_BACKGROUND = True
+ADMIN_LOG_RETENTION_DAYS = 365
+ADMIN_LOG_ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive', 'admin-log')
 
 # Security Settings (for production)
 if not DEBUG:
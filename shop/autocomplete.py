@@ -0,0 +1,106 @@
+import bisect
+import threading
+
+from .models import Category, Product
+
+AUTOCOMPLETE_LIMIT = 8
+
+
+def _normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def _word_suffixes(name):
+    """'galaxy s25 ultra' -> ['galaxy s25 ultra', 's25 ultra', 'ultra']"""
+    words = _normalize(name).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class PrefixIndex:
+    """
+    Sorted array of (key, kind, pk) answering prefix lookups with bisect.
+
+    Every word suffix of a name is a key so typing "s25" finds
+    "Galaxy S25". Built once per worker on first use from two narrow
+    values_list queries, then maintained incrementally by shop.signals.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = []
+        self._labels = {}
+        self._loaded = False
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            entries = []
+            for kind, model in (('category', Category), ('product', Product)):
+                for pk, name in model.objects.values_list('id', 'name').iterator(chunk_size=2000):
+                    self._labels[(kind, pk)] = name
+                    entries.extend((key, kind, pk) for key in _word_suffixes(name))
+            entries.sort()
+            self._entries = entries
+            self._loaded = True
+
+    def _remove(self, kind, pk):
+        name = self._labels.pop((kind, pk), None)
+        if name is None:
+            return
+        for key in _word_suffixes(name):
+            i = bisect.bisect_left(self._entries, (key, kind, pk))
+            if i < len(self._entries) and self._entries[i] == (key, kind, pk):
+                del self._entries[i]
+
+    def add(self, kind, pk, name):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._remove(kind, pk)
+            self._labels[(kind, pk)] = name
+            for key in _word_suffixes(name):
+                bisect.insort(self._entries, (key, kind, pk))
+
+    def remove(self, kind, pk):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._remove(kind, pk)
+
+    def reset(self):
+        with self._lock:
+            self._entries = []
+            self._labels.clear()
+            self._loaded = False
+
+    def complete(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        """Return up to ``limit`` (kind, pk, label) tuples, categories first"""
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+        self._ensure_loaded()
+
+        matches = {'category': [], 'product': []}
+        seen = set()
+        with self._lock:
+            i = bisect.bisect_left(self._entries, (prefix,))
+            while i < len(self._entries) and len(seen) < limit:
+                key, kind, pk = self._entries[i]
+                if not key.startswith(prefix):
+                    break
+                if (kind, pk) not in seen:
+                    seen.add((kind, pk))
+                    matches[kind].append((kind, pk, self._labels[(kind, pk)]))
+                i += 1
+
+        return (matches['category'] + matches['product'])[:limit]
+
+
+prefix_index = PrefixIndex()
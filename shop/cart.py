@@ -0,0 +1,111 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, PositiveIntegerField, Sum, Value, When
+from django.db.models.functions import Greatest, Least
+
+from .models import Cart, Product
+
+# Most units of one product a cart line may hold; also keeps the
+# PositiveIntegerField far from overflowing whatever a client sends
+MAX_LINE_QUANTITY = 99
+
+
+def cart_summary(user):
+    """Item count and subtotal of the user's cart in a single aggregate query"""
+    totals = Cart.objects.filter(user=user).aggregate(
+        item_count=Sum('quantity'),
+        subtotal=Sum(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+    )
+    return {
+        'item_count': totals['item_count'] or 0,
+        'subtotal': totals['subtotal'] or Decimal('0'),
+    }
+
+
+def apply_cart_operations(user, deltas=None, quantities=None):
+    """
+    Apply ``deltas`` ({cart_item_id: +/-n}) and absolute ``quantities``
+    ({cart_item_id: n}) to the user's cart atomically. Quantities are
+    kept between 0 and MAX_LINE_QUANTITY.
+
+    All lines change in one UPDATE whose new values are computed by the
+    database from F('quantity'), so concurrent clicks cannot lose each
+    other's updates; lines that reach zero go in one DELETE. Returns
+    (lines, removed_ids, summary) where ``lines`` are the surviving
+    touched Cart rows with their product.
+    """
+    deltas, quantities = deltas or {}, quantities or {}
+    ids = set(deltas) | set(quantities)
+    if not ids:
+        return [], [], cart_summary(user)
+
+    whens = [
+        When(pk=pk, then=Value(min(max(quantity, 0), MAX_LINE_QUANTITY)))
+        for pk, quantity in quantities.items()
+    ]
+    whens += [
+        When(pk=pk, then=Least(Greatest(F('quantity') + delta, Value(0)), Value(MAX_LINE_QUANTITY)))
+        for pk, delta in deltas.items() if pk not in quantities
+    ]
+    rows = Cart.objects.filter(user=user, pk__in=ids)
+    with transaction.atomic():
+        rows.update(quantity=Case(*whens, default=F('quantity'), output_field=PositiveIntegerField()))
+        removed = list(rows.filter(quantity=0).values_list('pk', flat=True))
+        if removed:
+            Cart.objects.filter(pk__in=removed).delete()
+
+    lines = list(rows.select_related('product'))
+    return lines, removed, cart_summary(user)
+
+
+def _add_to_lines(user, product_ids, quantities):
+    Cart.objects.filter(user=user, product_id__in=product_ids).update(quantity=Case(
+        *(
+            When(product_id=pk, then=Least(F('quantity') + quantities[pk], Value(MAX_LINE_QUANTITY)))
+            for pk in product_ids
+        ),
+        output_field=PositiveIntegerField(),
+    ))
+
+
+def merge_into_cart(user, quantities):
+    """
+    Add ``quantities`` ({product_id: n}) to the user's cart, summing with
+    lines already there, up to MAX_LINE_QUANTITY per line. Products that
+    no longer exist are skipped.
+
+    Lines the user already has are bumped in one CASE UPDATE and the rest
+    are inserted with one bulk INSERT. If a concurrent request adds one
+    of those products first, the INSERT hits unique_together('user',
+    'product'); it is rolled back to its savepoint, the lines that now
+    exist are bumped instead and the remainder is inserted again.
+    """
+    product_ids = set(Product.objects.filter(pk__in=quantities).values_list('pk', flat=True))
+    if not product_ids:
+        return 0
+
+    with transaction.atomic():
+        existing = set(
+            Cart.objects.filter(user=user, product_id__in=product_ids).values_list('product_id', flat=True)
+        )
+        if existing:
+            _add_to_lines(user, existing, quantities)
+        missing = product_ids - existing
+        while missing:
+            try:
+                with transaction.atomic():
+                    Cart.objects.bulk_create([
+                        Cart(user=user, product_id=pk, quantity=min(quantities[pk], MAX_LINE_QUANTITY))
+                        for pk in missing
+                    ])
+                break
+            except IntegrityError:
+                raced = set(
+                    Cart.objects.filter(user=user, product_id__in=missing).values_list('product_id', flat=True)
+                )
+                if not raced:
+                    raise  # not a duplicate line, e.g. the product was deleted meanwhile
+                _add_to_lines(user, raced, quantities)
+                missing -= raced
+    return len(product_ids)
@@ -0,0 +1,91 @@
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlencode
+
+from .facets import PRICE_BAND_RANGES, PRICE_BANDS, facet_counts
+from .models import Product
+
+CATALOG_PAGE_SIZE = 24
+
+
+def _decimal_param(params, name):
+    try:
+        value = Decimal(params.get(name, ''))
+    except InvalidOperation:
+        return None
+    return value if value.is_finite() else None
+
+
+def catalog_filters(params):
+    """Pick the supported catalog filters out of a GET QueryDict"""
+    filters = {}
+    category = params.get('category', '')
+    # isdigit() also accepts superscripts and the like, which int() rejects
+    if category.isdecimal():
+        filters['category'] = int(category)
+    if params.get('price_band') in PRICE_BAND_RANGES:
+        filters['price_band'] = params['price_band']
+    for name in ('min_price', 'max_price'):
+        value = _decimal_param(params, name)
+        if value is not None:
+            filters[name] = value
+    if params.get('stock') == 'all':
+        filters['stock'] = 'all'
+    return filters
+
+
+def catalog_queryset(filters):
+    """
+    Products matching ``filters``. In-stock listings are served by the
+    partial catalog indexes, ``stock=all`` by product_recent_idx.
+    """
+    products = Product.objects.all()
+    if filters.get('stock') != 'all':
+        products = products.filter(stock_quantity__gt=0)
+    if 'category' in filters:
+        products = products.filter(category_id=filters['category'])
+    if 'price_band' in filters:
+        low, high = PRICE_BAND_RANGES[filters['price_band']]
+        if low is not None:
+            products = products.filter(price__gte=low)
+        if high is not None:
+            products = products.filter(price__lt=high)
+    if 'min_price' in filters:
+        products = products.filter(price__gte=filters['min_price'])
+    if 'max_price' in filters:
+        products = products.filter(price__lte=filters['max_price'])
+    return products
+
+
+def _toggle_url(filters, name, value):
+    params = {key: val for key, val in filters.items() if key != name}
+    if filters.get(name) != value:
+        params[name] = value
+    return f"?{urlencode(params)}"
+
+
+def _option(filters, name, value, label, count):
+    return {
+        'label': label,
+        'count': count,
+        'active': filters.get(name) == value,
+        'url': _toggle_url(filters, name, value),
+    }
+
+
+def catalog_facets(filters, categories):
+    """Facet groups for the catalog sidebar, with counts read from the facet store"""
+    counts = facet_counts(include_out_of_stock=filters.get('stock') == 'all')
+    category_options = [
+        _option(filters, 'category', category.pk, category.name, counts['category'].get(str(category.pk), 0))
+        for category in categories
+    ]
+    price_options = [
+        _option(filters, 'price_band', key, label, counts['price'].get(key, 0))
+        for key, label, _low, _high in PRICE_BANDS
+    ]
+    stock_total = counts['stock']['in'] + counts['stock']['out']
+    return [
+        {'title': 'Category', 'options': [o for o in category_options if o['count'] or o['active']]},
+        {'title': 'Price', 'options': [o for o in price_options if o['count'] or o['active']]},
+        {'title': 'Availability', 'options': [_option(filters, 'stock', 'all', 'Include out of stock', stock_total)]},
+    ]
@@ -0,0 +1,59 @@
+import time
+
+from django.core.cache import cache
+
+from .models import Category
+
+VERSION_KEY = 'shop:categories:version'
+SNAPSHOT_KEY = 'shop:categories:{version}'
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+# How long a worker trusts its own copy before re-checking the version key
+MEMO_TTL = 5
+
+_memo = {'entry': None}
+
+
+def category_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def get_categories():
+    """
+    Return the category list used by the navigation.
+
+    Three layers: a per-process memo that is trusted for MEMO_TTL seconds,
+    then a snapshot in Django's cache keyed by the current version, then
+    the database. Steady-state renders therefore run no category query.
+    """
+    now = time.monotonic()
+    memo = _memo['entry']
+    if memo and now - memo['checked_at'] < MEMO_TTL:
+        return memo['categories']
+
+    version = category_version()
+    if memo and memo['version'] == version:
+        memo['checked_at'] = now
+        return memo['categories']
+
+    key = SNAPSHOT_KEY.format(version=version)
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.all())
+        cache.set(key, categories, SNAPSHOT_TIMEOUT)
+
+    _memo['entry'] = {'version': version, 'categories': categories, 'checked_at': now}
+    return categories
+
+
+def invalidate_categories():
+    """Bump the version so every worker rebuilds its snapshot on the next check"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, timeout=None)
+    _memo['entry'] = None
@@ -0,0 +1,136 @@
+import logging
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from .facets import product_facet_keys, update_facet_counts
+from .fragments import invalidate_fragments
+from .models import Cart, Order, OrderItem, Product
+from .rollups import order_placed
+
+logger = logging.getLogger(__name__)
+
+ORDER_FIELDS = [
+    'first_name', 'last_name', 'email', 'phone',
+    'address_line_1', 'address_line_2', 'city', 'state',
+    'postal_code', 'country', 'special_instructions',
+]
+
+
+# Attempts when stock changes between the UPDATE and the short-stock lookup
+PLACE_ORDER_ATTEMPTS = 3
+
+
+class InsufficientStock(Exception):
+    def __init__(self, products):
+        self.products = products
+        super().__init__(', '.join(product.name for product in products))
+
+
+class CheckoutConflict(Exception):
+    pass
+
+
+def _decrement_stock(quantities, now):
+    """
+    Take ``quantities`` ({product_id: qty}) off stock in one UPDATE.
+
+    Each row only matches while it still has enough stock, so a short
+    row is simply not updated; the caller compares the row count and
+    rolls back instead of overselling.
+    """
+    enough_stock = reduce(or_, (
+        Q(pk=product_id, stock_quantity__gte=quantity)
+        for product_id, quantity in quantities.items()
+    ))
+    new_stock = Case(*(
+        When(pk=product_id, then=F('stock_quantity') - quantity)
+        for product_id, quantity in quantities.items()
+    ))
+    return Product.objects.filter(enough_stock).update(stock_quantity=new_stock, updated_at=now)
+
+
+def _facet_keys_of_rows(rows, quantities):
+    """(before, after) facet keys of the rows just decremented, read back inside the transaction"""
+    before, after = [], []
+    for row in rows:
+        after.extend(product_facet_keys(row))
+        row.stock_quantity += quantities[row.pk]
+        before.extend(product_facet_keys(row))
+    return before, after
+
+
+def _apply_stock_change(stale, facet_keys):
+    invalidate_fragments(*stale)
+    update_facet_counts(*facet_keys)
+
+
+def _attempt_order(user, cart_items, quantities, details):
+    """The order, or None and the products that are short when the stock UPDATE misses a row"""
+    now = timezone.now()
+    with transaction.atomic():
+        order = Order.objects.create(
+            user=user,
+            total_amount=sum(item.product.price * item.quantity for item in cart_items),
+            status='pending',
+            **{field: details.get(field, '') for field in ORDER_FIELDS},
+        )
+        if _decrement_stock(quantities, now) != len(quantities):
+            # Roll back the order; the lookup below runs after the rollback
+            transaction.set_rollback(True)
+            order = None
+        else:
+            # Our UPDATE holds these rows until commit, so this is their real
+            # stock, not the copy the cart was loaded with
+            rows = Product.objects.filter(pk__in=quantities).only('pk', 'category_id', 'price', 'stock_quantity')
+            facet_keys = _facet_keys_of_rows(rows, quantities)
+            lines = OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=item.product_id, price=item.product.price, quantity=item.quantity)
+                for item in cart_items
+            ])
+            Cart.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+            order_placed(order, lines)
+            stale = [(item.product_id, item.product.updated_at) for item in cart_items]
+            transaction.on_commit(lambda: _apply_stock_change(stale, facet_keys))
+
+    if order is not None:
+        return order, []
+    return None, list(Product.objects.filter(
+        reduce(or_, (Q(pk=pk, stock_quantity__lt=qty) for pk, qty in quantities.items()))
+    ))
+
+
+def place_order(user, cart_items, details):
+    """
+    Turn ``cart_items`` (Cart rows with select_related('product')) into an
+    Order inside one transaction: one INSERT for the order, one UPDATE for
+    all stock, one SELECT of the updated rows, one bulk INSERT for the
+    items, one DELETE for the cart and a fixed number of rollup upserts,
+    however many lines the cart has. Facet counts and cached fragments are
+    updated once the transaction commits.
+
+    Raises InsufficientStock, with nothing written, if any line can no
+    longer be fulfilled. If the stock UPDATE misses a row that has enough
+    stock again by the time the short products are looked up (restocked
+    in between), the order is retried; CheckoutConflict is raised when
+    that keeps happening.
+    """
+    cart_items = list(cart_items)
+    quantities = {}
+    for item in cart_items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    for _attempt in range(PLACE_ORDER_ATTEMPTS):
+        order, short = _attempt_order(user, cart_items, quantities, details)
+        if order is not None:
+            break
+        if short:
+            raise InsufficientStock(short)
+    else:
+        raise CheckoutConflict(f"stock kept changing during {PLACE_ORDER_ATTEMPTS} attempts")
+
+    logger.info(f"Order #{order.id} placed by {user.username}: {len(cart_items)} lines, total {order.total_amount}")
+    return order
@@ -0,0 +1,75 @@
+"""
+ETag / Last-Modified validators for the anonymous catalog pages.
+
+Each validator is computed from narrow values_list() queries and memoised
+on the request so the etag and last-modified callbacks share one lookup.
+Signed-in shoppers see per-user state (cart and wishlist buttons, the
+account menu), and so do guests with a session cart (the cart badge and
+"View Cart" buttons), so the callbacks return None for them and those
+responses carry no validators at all.
+"""
+import hashlib
+
+from .catalog import CATALOG_PAGE_SIZE, catalog_filters, catalog_queryset
+from .category_cache import category_version
+from .guest_cart import GUEST_CART_SESSION_KEY
+from .models import FacetCount, Product
+
+
+def _digest(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _personalised(request):
+    return request.user.is_authenticated or bool(request.session.get(GUEST_CART_SESSION_KEY))
+
+
+def _memoised(request, name, compute):
+    cache = request.__dict__.setdefault('_catalog_validators', {})
+    if name not in cache:
+        cache[name] = compute()
+    return cache[name]
+
+
+def _home_meta(request):
+    filters = catalog_filters(request.GET)
+    rows = list(
+        catalog_queryset(filters)
+        .order_by('-created_at', '-id')
+        .values_list('id', 'updated_at')[:CATALOG_PAGE_SIZE + 1]
+    )
+    facets = list(FacetCount.objects.order_by('id').values_list('id', 'count'))
+    etag = _digest('home', sorted(filters.items()), rows, facets, category_version())
+    last_modified = max((updated_at for _pk, updated_at in rows), default=None)
+    return etag, last_modified
+
+
+def _product_meta(pk):
+    updated_at = Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None, None
+    return _digest('product', pk, updated_at.timestamp(), category_version()), updated_at
+
+
+def home_etag(request):
+    if _personalised(request):
+        return None
+    return _memoised(request, 'home', lambda: _home_meta(request))[0]
+
+
+def home_last_modified(request):
+    if _personalised(request):
+        return None
+    return _memoised(request, 'home', lambda: _home_meta(request))[1]
+
+
+def product_etag(request, pk):
+    if _personalised(request):
+        return None
+    return _memoised(request, 'product', lambda: _product_meta(pk))[0]
+
+
+def product_last_modified(request, pk):
+    if _personalised(request):
+        return None
+    return _memoised(request, 'product', lambda: _product_meta(pk))[1]
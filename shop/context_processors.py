@@ -1,6 +1,14 @@
-from .models import Category
+from .category_cache import get_categories
+from .shopper import attach_shopper_state
 
 def categories(request):
     return {
-        'categories': Category.objects.all()
+        'categories': get_categories()
+    }
+
+def shopper(request):
+    if not hasattr(request, 'shopper'):
+        attach_shopper_state(request)
+    return {
+        'shopper': request.shopper
     }
\ No newline at end of file
@@ -0,0 +1,115 @@
+from collections import Counter
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import FacetCount, Product
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = [
+    ('under-1000', 'Under ₹1,000', None, Decimal('1000')),
+    ('1000-5000', '₹1,000 - ₹5,000', Decimal('1000'), Decimal('5000')),
+    ('5000-20000', '₹5,000 - ₹20,000', Decimal('5000'), Decimal('20000')),
+    ('20000-50000', '₹20,000 - ₹50,000', Decimal('20000'), Decimal('50000')),
+    ('50000-plus', 'Over ₹50,000', Decimal('50000'), None),
+]
+PRICE_BAND_RANGES = {key: (low, high) for key, _label, low, high in PRICE_BANDS}
+
+NO_CATEGORY = 'none'
+
+
+def price_band(price):
+    for key, _label, low, high in PRICE_BANDS:
+        if (low is None or price >= low) and (high is None or price < high):
+            return key
+    return PRICE_BANDS[-1][0]
+
+
+def product_facet_keys(*products):
+    """The (facet, value, in_stock) rows each saved product contributes one count to"""
+    keys = []
+    for product in products:
+        if product.pk is None:
+            continue
+        in_stock = product.stock_quantity > 0
+        category = str(product.category_id) if product.category_id else NO_CATEGORY
+        keys.append(('category', category, in_stock))
+        keys.append(('price', price_band(product.price), in_stock))
+    return keys
+
+
+def _add_to_count(key, delta):
+    facet, value, in_stock = key
+    rows = FacetCount.objects.filter(facet=facet, value=value, in_stock=in_stock)
+    if rows.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            FacetCount.objects.create(facet=facet, value=value, in_stock=in_stock, count=delta)
+    except IntegrityError:
+        rows.update(count=F('count') + delta)
+
+
+def update_facet_counts(before, after):
+    """
+    Apply the difference between two product_facet_keys() snapshots.
+
+    Capture ``before`` prior to mutating the products (an empty list for
+    new products) and ``after`` once the change is saved (an empty list
+    for deleted products). Unchanged keys cost no queries.
+    """
+    deltas = Counter(after)
+    deltas.subtract(Counter(before))
+    changed = sorted((key, delta) for key, delta in deltas.items() if delta)
+    if not changed:
+        return
+    with transaction.atomic():
+        for key, delta in changed:
+            _add_to_count(key, delta)
+
+
+def category_deleted(category_id):
+    """Products of a deleted category fall back to NULL; move their counts to NO_CATEGORY"""
+    with transaction.atomic():
+        rows = FacetCount.objects.filter(facet='category', value=str(category_id))
+        for in_stock, count in rows.values_list('in_stock', 'count'):
+            if count:
+                _add_to_count(('category', NO_CATEGORY, in_stock), count)
+        rows.delete()
+
+
+def rebuild_facet_counts():
+    """Recompute every facet count from Product; used to seed or repair the store"""
+    rows = Counter()
+    products = Product.objects.values_list('category_id', 'price', 'stock_quantity').iterator(chunk_size=5000)
+    for category_id, price, stock_quantity in products:
+        in_stock = stock_quantity > 0
+        rows[('category', str(category_id) if category_id else NO_CATEGORY, in_stock)] += 1
+        rows[('price', price_band(price), in_stock)] += 1
+
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create([
+            FacetCount(facet=facet, value=value, in_stock=in_stock, count=count)
+            for (facet, value, in_stock), count in rows.items()
+        ])
+    return len(rows)
+
+
+def facet_counts(include_out_of_stock=False):
+    """
+    Return {'category': {value: n}, 'price': {value: n}, 'stock': {...}}.
+
+    Counts are global per facet value (not narrowed by the other selected
+    facets), which is what lets them come straight from the store.
+    """
+    counts = {'category': Counter(), 'price': Counter(), 'stock': Counter()}
+    for facet, value, in_stock, count in FacetCount.objects.values_list('facet', 'value', 'in_stock', 'count'):
+        if facet not in counts:
+            continue
+        if facet == 'category':
+            counts['stock']['in' if in_stock else 'out'] += count
+        if in_stock or include_out_of_stock:
+            counts[facet][value] += count
+    return counts
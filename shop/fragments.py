@@ -0,0 +1,56 @@
+import time
+
+from django.core.cache import cache
+
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+FRAGMENT_NAMES = ('card', 'detail')
+
+# Stampede protection: one renderer holds the lock, the rest wait briefly for its result
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 0.5
+LOCK_POLL = 0.02
+
+
+def fragment_key(name, product_pk, updated_at):
+    return f'shop:fragment:{name}:{product_pk}:{updated_at.timestamp()}'
+
+
+def get_or_render(name, product, render):
+    """
+    Return the cached ``name`` fragment for ``product`` or build it with
+    ``render()``. The key includes updated_at so an edit moves readers to
+    a fresh key; only the request that wins the lock renders it, the
+    others poll for up to LOCK_WAIT before rendering uncached themselves.
+    """
+    key = fragment_key(name, product.pk, product.updated_at)
+    html = cache.get(key)
+    if html is not None:
+        return html
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            html = render()
+            cache.set(key, html, FRAGMENT_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return html
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        html = cache.get(key)
+        if html is not None:
+            return html
+    return render()
+
+
+def invalidate_fragments(*revisions):
+    """Drop the fragments of each (product pk, updated_at) revision in one cache call"""
+    keys = [
+        fragment_key(name, product_pk, updated_at)
+        for product_pk, updated_at in revisions if updated_at is not None
+        for name in FRAGMENT_NAMES
+    ]
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,60 @@
+"""
+Cart for shoppers who have not signed in yet.
+
+The cart lives in the session as {product_id: quantity} (string keys, as
+the JSON serializer stores them), so browsing and adding items writes no
+Cart rows. When the shopper logs in or registers, merge_guest_cart()
+folds it into their Cart in a fixed number of queries.
+"""
+from .cart import MAX_LINE_QUANTITY, merge_into_cart
+
+GUEST_CART_SESSION_KEY = 'guest_cart'
+MAX_GUEST_LINES = 50
+
+
+def guest_cart_quantities(request):
+    """{product_id: quantity} for the anonymous shopper; never creates a session"""
+    stored = request.session.get(GUEST_CART_SESSION_KEY) or {}
+    # Sessions written before quantities were capped may hold larger values
+    return {int(product_id): min(quantity, MAX_LINE_QUANTITY) for product_id, quantity in stored.items()}
+
+
+def _store(request, quantities):
+    stored = {str(product_id): quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if stored:
+        request.session[GUEST_CART_SESSION_KEY] = stored
+    else:
+        request.session.pop(GUEST_CART_SESSION_KEY, None)
+
+
+def add_to_guest_cart(request, product_id, delta=1):
+    """
+    Change one line by ``delta``, keeping it within MAX_LINE_QUANTITY; a
+    line that reaches zero is dropped. Returns the new quantity.
+    """
+    quantities = guest_cart_quantities(request)
+    if product_id not in quantities and len(quantities) >= MAX_GUEST_LINES:
+        return 0
+    quantities[product_id] = min(max(quantities.get(product_id, 0) + delta, 0), MAX_LINE_QUANTITY)
+    _store(request, quantities)
+    return quantities[product_id]
+
+
+def remove_from_guest_cart(request, product_id):
+    quantities = guest_cart_quantities(request)
+    quantities.pop(product_id, None)
+    _store(request, quantities)
+
+
+def pop_guest_cart(request):
+    """Take the guest cart out of the session; call before login() rotates it"""
+    quantities = guest_cart_quantities(request)
+    request.session.pop(GUEST_CART_SESSION_KEY, None)
+    return quantities
+
+
+def merge_guest_cart(user, quantities):
+    """Add a popped guest cart to the user's Cart; returns the number of lines merged"""
+    if not quantities:
+        return 0
+    return merge_into_cart(user, quantities)
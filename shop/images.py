@@ -0,0 +1,142 @@
+import base64
+import logging
+import os
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (320, 640, 960)
+DERIVATIVE_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+DERIVATIVE_ROOT = 'products/derivatives'
+LQIP_SIZE = (16, 16)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-derivatives')
+
+
+def derivative_dir(source_name):
+    """Every upload gets its own directory, so cleanup never needs the DB record"""
+    return posixpath.join(DERIVATIVE_ROOT, posixpath.basename(source_name).replace('.', '_'))
+
+
+def _encode(image, fmt, options):
+    buffer = BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def generate_derivatives(product_id, source_name):
+    """
+    Build the resized WebP/JPEG copies and the LQIP data URI for one
+    upload and record them in Product.image_variants. The update is
+    conditional on the image still being ``source_name`` so a slow job
+    cannot overwrite the variants of a newer upload.
+    """
+    with default_storage.open(source_name) as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image = image.convert('RGB')
+
+    directory = derivative_dir(source_name)
+    variants = {'source': source_name, 'width': image.width, 'webp': {}, 'jpeg': {}}
+    written = set()
+    for width in DERIVATIVE_WIDTHS:
+        if width >= image.width:
+            break
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        for ext, fmt, options in DERIVATIVE_FORMATS:
+            target = posixpath.join(directory, f'{width}w.{ext}')
+            # Replace the copy of an earlier run; save() would otherwise pick a suffixed name
+            default_storage.delete(target)
+            name = default_storage.save(target, ContentFile(_encode(resized, fmt, options)))
+            variants[ext][str(width)] = name
+            written.add(posixpath.basename(name))
+    # Files of earlier runs this one did not replace (suffixed copies, dropped widths)
+    _delete_files(directory, keep=written)
+    if not written:
+        _remove_directory(directory)
+
+    placeholder = image.copy()
+    placeholder.thumbnail(LQIP_SIZE)
+    data = _encode(placeholder, 'JPEG', {'quality': 40})
+    variants['lqip'] = f"data:image/jpeg;base64,{base64.b64encode(data).decode()}"
+
+    # Bumping updated_at moves cached fragments and ETags onto the srcset markup
+    updated = Product.objects.filter(pk=product_id, image=source_name).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    if not updated:
+        delete_derivatives(source_name)
+    return variants
+
+
+def _delete_files(directory, keep=()):
+    try:
+        _dirs, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in files:
+        if name not in keep:
+            default_storage.delete(posixpath.join(directory, name))
+
+
+def _remove_directory(directory):
+    try:
+        os.rmdir(default_storage.path(directory))
+    except NotImplementedError:
+        pass  # storages without real directories (S3 and the like) have nothing left behind
+    except OSError:
+        pass  # already gone, or a newer job has written into it again
+
+
+def delete_derivatives(source_name):
+    directory = derivative_dir(source_name)
+    _delete_files(directory)
+    _remove_directory(directory)
+
+
+def _run(product_id, source_name):
+    try:
+        generate_derivatives(product_id, source_name)
+    except Exception:
+        logger.exception(f"Could not build image derivatives for product {product_id} ({source_name})")
+    finally:
+        connection.close()
+
+
+def schedule_derivatives(product):
+    """Queue derivative generation once the current transaction commits"""
+    product_id, source_name = product.pk, product.image.name
+    transaction.on_commit(lambda: _executor.submit(_run, product_id, source_name))
+
+
+def image_sources(product):
+    """Template-ready srcset data for a product image, or plain src if not built yet"""
+    variants = product.image_variants or {}
+    sources = {'src': product.image.url, 'webp_srcset': '', 'jpeg_srcset': '', 'lqip': ''}
+    if variants.get('source') != product.image.name:
+        return sources
+
+    original = f"{product.image.url} {variants['width']}w"
+    for ext in ('webp', 'jpeg'):
+        candidates = [
+            f"{default_storage.url(name)} {width}w"
+            for width, name in sorted(variants.get(ext, {}).items(), key=lambda item: int(item[0]))
+        ]
+        if ext == 'jpeg':
+            candidates.append(original)
+        sources[f'{ext}_srcset'] = ', '.join(candidates)
+    sources['lqip'] = variants.get('lqip', '')
+    return sources
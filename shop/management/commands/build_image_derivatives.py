@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from shop.images import generate_derivatives
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = "Build responsive image derivatives for products that are missing them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild even if derivatives exist")
+
+    def handle(self, *args, **options):
+        built = 0
+        products = Product.objects.exclude(image='').only('id', 'image', 'image_variants')
+        for product in products.iterator(chunk_size=200):
+            if not options['force'] and (product.image_variants or {}).get('source') == product.image.name:
+                continue
+            try:
+                generate_derivatives(product.pk, product.image.name)
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"Product #{product.pk}: {e}")
+                continue
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f"Built derivatives for {built} products"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shop.facets import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+    help = "Recompute the catalog facet counts from the Product table"
+
+    def handle(self, *args, **options):
+        rows = rebuild_facet_counts()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} facet count rows"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shop.rollups import rebuild_order_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the dashboard's daily order rollups from Order history"
+
+    def handle(self, *args, **options):
+        rows = rebuild_order_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily order rollup rows"))
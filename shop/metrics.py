@@ -0,0 +1,154 @@
+"""
+Prometheus metrics.
+
+Business counters are recorded where things happen: checkout outcomes,
+latency and cart sizes in shop.views.checkout, cart changes in the cart
+views, logins and registrations in accounts.views. Per-request runtime
+figures (duration, SQL statements and time, cache hits and misses) come
+from the request profile PerfMiddleware already keeps, so PERF_ENABLED =
+False turns them off as well; database connections are counted through
+the connection_created signal (see shop.signals). Request series are
+labelled by URL name and HTTP method; unmatched paths and methods
+outside REQUEST_METHODS share one label each, so the series count
+stays bounded whatever clients send. The shop metrics view serves them
+all in the Prometheus text format at /metrics.
+
+Each gunicorn worker has its own counters. To export one total across
+workers, point PROMETHEUS_MULTIPROC_DIR at an empty directory that every
+worker can write to before gunicorn starts (and clear it on every
+deploy); each worker then keeps its values in memory-mapped files there
+and the view merges them all, whichever worker serves the scrape. Add to
+the gunicorn config so the files of exited workers are merged correctly:
+
+    from prometheus_client import multiprocess
+
+    def child_exit(server, worker):
+        multiprocess.mark_process_dead(worker.pid)
+
+prometheus_client is optional; without it every recording function does
+nothing and /metrics answers 503. Scrapes must send an "Authorization:
+Bearer <METRICS_TOKEN>" header; while METRICS_TOKEN is unset only staff
+signed in to the shop can open /metrics.
+"""
+import os
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess
+except ImportError:  # optional; the shop runs the same without metrics
+    prometheus_client = None
+
+CHECKOUT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CART_SIZE_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55)
+ORDER_VALUE_BUCKETS = (500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+REQUEST_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+if prometheus_client is not None:
+    ORDERS_PLACED = Counter('shop_orders_placed_total', "Orders placed through checkout")
+    ORDER_VALUE = Histogram('shop_order_value', "Total amount of placed orders", buckets=ORDER_VALUE_BUCKETS)
+    CHECKOUT_DURATION = Histogram(
+        'shop_checkout_duration_seconds', "Time taken by checkout form submissions",
+        ['outcome'], buckets=CHECKOUT_BUCKETS,
+    )
+    CHECKOUT_CART_LINES = Histogram(
+        'shop_checkout_cart_lines', "Distinct products in the cart at checkout", buckets=CART_SIZE_BUCKETS,
+    )
+    CHECKOUT_CART_UNITS = Histogram(
+        'shop_checkout_cart_units', "Units in the cart at checkout", buckets=CART_SIZE_BUCKETS,
+    )
+    CHECKOUT_STOCK_FAILURES = Counter(
+        'shop_checkout_stock_failures_total', "Checkouts turned back for lack of stock", ['reason'],
+    )
+    CART_MUTATIONS = Counter('shop_cart_mutations_total', "Cart changes", ['action', 'shopper'])
+    LOGIN_ATTEMPTS = Counter('accounts_login_attempts_total', "Login form submissions", ['result'])
+    REGISTRATIONS = Counter('accounts_registrations_total', "Accounts created through the register form")
+
+    REQUEST_DURATION = Histogram('http_request_duration_seconds', "Time to respond", ['view', 'method'])
+    RESPONSES = Counter('http_responses_total', "Responses by status class", ['view', 'status'])
+    REQUEST_QUERIES = Histogram(
+        'db_queries_per_request', "SQL statements run by one request", ['view'], buckets=QUERY_COUNT_BUCKETS,
+    )
+    DB_QUERY_SECONDS = Counter('db_query_seconds_total', "Time spent in SQL statements", ['view'])
+    DB_CONNECTIONS = Counter('db_connections_opened_total', "Database connections opened", ['alias'])
+    CACHE_LOOKUPS = Counter('cache_lookups_total', "Cache lookups made while serving requests", ['result'])
+
+
+def enabled():
+    return prometheus_client is not None
+
+
+def _shopper(request):
+    return 'customer' if request.user.is_authenticated else 'guest'
+
+
+def record_checkout(outcome, seconds, cart_items=None, order=None):
+    """
+    One checkout submission: ``outcome`` is placed, out_of_stock,
+    reserved (stock held by other shoppers) or error
+    """
+    if prometheus_client is None:
+        return
+    CHECKOUT_DURATION.labels(outcome).observe(seconds)
+    if outcome in ('out_of_stock', 'reserved'):
+        CHECKOUT_STOCK_FAILURES.labels(outcome).inc()
+    if order is not None:
+        ORDERS_PLACED.inc()
+        ORDER_VALUE.observe(float(order.total_amount))
+        CHECKOUT_CART_LINES.observe(len(cart_items))
+        CHECKOUT_CART_UNITS.observe(sum(item.quantity for item in cart_items))
+
+
+def record_cart_mutation(request, action, count=1):
+    """``action`` is add, remove, quantity or merge"""
+    if prometheus_client is None:
+        return
+    CART_MUTATIONS.labels(action, _shopper(request)).inc(count)
+
+
+def record_login(success):
+    if prometheus_client is None:
+        return
+    LOGIN_ATTEMPTS.labels('success' if success else 'failure').inc()
+
+
+def record_registration():
+    if prometheus_client is None:
+        return
+    REGISTRATIONS.inc()
+
+
+def record_request(request, response, profile, total_seconds):
+    """Runtime figures of one request, from its shop.profiling.RequestProfile"""
+    if prometheus_client is None:
+        return
+    match = request.resolver_match
+    # Unmatched paths share one label so scanners cannot blow up the series count
+    view = match.view_name if match else 'unresolved'
+    method = request.method if request.method in REQUEST_METHODS else 'other'
+    REQUEST_DURATION.labels(view, method).observe(total_seconds)
+    RESPONSES.labels(view, f'{response.status_code // 100}xx').inc()
+    REQUEST_QUERIES.labels(view).observe(profile.sql_count)
+    if profile.sql_seconds:
+        DB_QUERY_SECONDS.labels(view).inc(profile.sql_seconds)
+    if profile.cache_hits:
+        CACHE_LOOKUPS.labels('hit').inc(profile.cache_hits)
+    if profile.cache_misses:
+        CACHE_LOOKUPS.labels('miss').inc(profile.cache_misses)
+
+
+def record_connection_opened(alias):
+    if prometheus_client is None:
+        return
+    DB_CONNECTIONS.labels(alias).inc()
+
+
+def render_metrics():
+    """(body, content type) of the current metrics, merged across workers in multiprocess mode"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # A fresh registry per scrape that reads the files of every worker
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,140 @@
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import FileResponse
+
+from .metrics import record_request
+from .profiling import build_record, end_profile, queue_record, start_profile
+from .querybudget import QueryCounter, is_unbounded, query_budget
+from .shopper import attach_shopper_state
+
+logger = logging.getLogger(__name__)
+
+SESSION_REFRESHED_KEY = '_session_refreshed_at'
+
+
+class ShopperStateMiddleware:
+    """Attach a lazily loaded ShopperState as ``request.shopper``"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        attach_shopper_state(request)
+        return self.get_response(request)
+
+
+class ThrottledSessionMiddleware(SessionMiddleware):
+    """
+    Drop-in replacement for SessionMiddleware that keeps sessions sliding
+    without writing them on every request.
+
+    Instead of SESSION_SAVE_EVERY_REQUEST, the expiry is pushed forward
+    only once SESSION_REFRESH_FRACTION of SESSION_COOKIE_AGE has passed
+    since the last refresh, so a session expires at most that fraction
+    earlier than it would with a write per request. Requests without a
+    session cookie are left alone, so anonymous browsing never creates
+    a session.
+    """
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        if session is not None and settings.SESSION_COOKIE_NAME in request.COOKIES:
+            self._refresh_if_due(session)
+        return super().process_response(request, response)
+
+    def _refresh_if_due(self, session):
+        if session.is_empty() or session.get_expire_at_browser_close():
+            return
+        now = int(time.time())
+        interval = settings.SESSION_COOKIE_AGE * getattr(settings, 'SESSION_REFRESH_FRACTION', 0.1)
+        refreshed_at = session.get(SESSION_REFRESHED_KEY)
+        if session.modified or refreshed_at is None or now - refreshed_at >= interval:
+            # Setting the key marks the session modified; SessionMiddleware
+            # then saves it and re-issues the cookie with a fresh expiry.
+            session[SESSION_REFRESHED_KEY] = now
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the queries of every request and log a warning when the view
+    exceeds its QUERY_BUDGETS entry or repeats a statement often enough to
+    look like an N+1. Only installed when QUERY_BUDGET_ENABLED (default:
+    DEBUG); put it first so session and auth queries are counted too.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        match = request.resolver_match
+        view_name = match.view_name if match else request.path
+        response['X-Query-Count'] = str(counter.count)
+        if is_unbounded(view_name):
+            return response
+        budget = query_budget(view_name, request.method)
+        if budget is not None and counter.count > budget:
+            logger.warning(f"{view_name} ran {counter.count} queries, over its budget of {budget}")
+        for shape, times in counter.repeated():
+            logger.warning(f"{view_name} ran the same query {times} times (possible N+1): {shape[:300]}")
+        return response
+
+
+class PerfMiddleware:
+    """
+    Profile every request (SQL, template and cache time, see shop.profiling),
+    send the breakdown as a Server-Timing header and store sampled and slow
+    requests for the admin perf page. Put it first so it sees the whole
+    request. Also feeds the request metrics of shop.metrics. Disabled with
+    PERF_ENABLED = False, which stops those metrics too.
+
+    The body of a streamed response (the order export) runs its queries
+    while it is sent, so the profile stays open until the stream ends and
+    the metrics and stored record cover it. Its Server-Timing header has
+    already gone out by then and covers the view only.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERF_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = start_profile()
+        try:
+            with connection.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            end_profile()
+        response['Server-Timing'] = profile.server_timing(time.perf_counter() - profile.started)
+        # Files stream without queries; wrapping them would lose the server's sendfile path
+        if response.streaming and not response.is_async and not isinstance(response, FileResponse):
+            response.streaming_content = self._profile_stream(response.streaming_content, request, response, profile)
+        else:
+            self._record(request, response, profile)
+        return response
+
+    def _profile_stream(self, content, request, response, profile):
+        start_profile(profile)
+        try:
+            with connection.execute_wrapper(profile):
+                yield from content
+        finally:
+            end_profile()
+            self._record(request, response, profile)
+
+    def _record(self, request, response, profile):
+        total_seconds = time.perf_counter() - profile.started
+        record_request(request, response, profile, total_seconds)
+        record = build_record(profile, request, response, total_seconds)
+        if record is not None:
+            queue_record(record)
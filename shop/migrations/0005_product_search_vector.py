@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:14
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+FORWARD_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION shop_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(
+                (SELECT name FROM shop_category WHERE id = NEW.category_id), '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER shop_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description, category_id, search_vector ON shop_product
+    FOR EACH ROW EXECUTE FUNCTION shop_product_search_vector_update();
+    """,
+    # Renaming a category re-weights every product filed under it
+    """
+    CREATE OR REPLACE FUNCTION shop_category_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.name IS DISTINCT FROM OLD.name THEN
+            UPDATE shop_product SET search_vector = NULL WHERE category_id = NEW.id;
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER shop_category_search_vector_trigger
+    AFTER UPDATE OF name ON shop_category
+    FOR EACH ROW EXECUTE FUNCTION shop_category_search_vector_update();
+    """,
+    "CREATE INDEX product_search_vector_gin ON shop_product USING gin (search_vector);",
+    "UPDATE shop_product SET search_vector = NULL;",
+]
+
+REVERSE_SQL = [
+    "DROP INDEX IF EXISTS product_search_vector_gin;",
+    "DROP TRIGGER IF EXISTS shop_category_search_vector_trigger ON shop_category;",
+    "DROP FUNCTION IF EXISTS shop_category_search_vector_update();",
+    "DROP TRIGGER IF EXISTS shop_product_search_vector_trigger ON shop_product;",
+    "DROP FUNCTION IF EXISTS shop_product_search_vector_update();",
+]
+
+
+def _run_on_postgres(statements):
+    # Other backends (SQLite in development) search through the
+    # in-process inverted index in shop.search instead.
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(_run_on_postgres(FORWARD_SQL), _run_on_postgres(REVERSE_SQL)),
+    ]
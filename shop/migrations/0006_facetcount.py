@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:16
+
+from collections import Counter
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Frozen copies of shop.facets as of this migration, so later changes to
+# the live bands cannot change what this migration does
+NO_CATEGORY = 'none'
+PRICE_BANDS = [
+    ('under-1000', Decimal('1000')),
+    ('1000-5000', Decimal('5000')),
+    ('5000-20000', Decimal('20000')),
+    ('20000-50000', Decimal('50000')),
+    ('50000-plus', None),
+]
+
+
+def price_band(price):
+    for key, upper in PRICE_BANDS:
+        if upper is None or price < upper:
+            return key
+
+
+def seed_facet_counts(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    FacetCount = apps.get_model('shop', 'FacetCount')
+    rows = Counter()
+    for category_id, price, stock_quantity in Product.objects.values_list('category_id', 'price', 'stock_quantity').iterator():
+        in_stock = stock_quantity > 0
+        rows[('category', str(category_id) if category_id else NO_CATEGORY, in_stock)] += 1
+        rows[('price', price_band(price), in_stock)] += 1
+    FacetCount.objects.bulk_create([
+        FacetCount(facet=facet, value=value, in_stock=in_stock, count=count)
+        for (facet, value, in_stock), count in rows.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=50)),
+                ('in_stock', models.BooleanField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', '-id'], name='product_recent_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='facetcount',
+            unique_together={('facet', 'value', 'in_stock')},
+        ),
+        migrations.RunPython(seed_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:30
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def seed_order_rollups(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    DailyOrderRollup = apps.get_model('shop', 'DailyOrderRollup')
+    tz = timezone.get_current_timezone()
+    rows = defaultdict(lambda: [0, Decimal('0'), 0])
+    orders = (
+        Order.objects.order_by().annotate(day=TruncDate('created_at', tzinfo=tz))
+        .values('day', 'status').annotate(orders=Count('id'), revenue=Sum('total_amount'))
+    )
+    for row in orders:
+        rows[(row['day'], row['status'])][:2] = [row['orders'], row['revenue'] or Decimal('0')]
+    items = (
+        OrderItem.objects.order_by().annotate(day=TruncDate('order__created_at', tzinfo=tz))
+        .values('day', 'order__status').annotate(units=Sum('quantity'))
+    )
+    for row in items:
+        rows[(row['day'], row['order__status'])][2] = row['units'] or 0
+    DailyOrderRollup.objects.bulk_create([
+        DailyOrderRollup(day=day, status=status, order_count=orders, revenue=revenue, items_sold=units)
+        for (day, status), (orders, revenue, units) in rows.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_order_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('items_sold', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day', 'status'],
+                'unique_together': {('day', 'status')},
+            },
+        ),
+        migrations.RunPython(seed_order_rollups, migrations.RunPython.noop),
+    ]
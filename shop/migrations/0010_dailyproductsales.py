@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def seed_product_sales(apps, schema_editor):
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    DailyProductSales = apps.get_model('shop', 'DailyProductSales')
+    revenue = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    rows = (
+        OrderItem.objects.exclude(order__status='cancelled').order_by()
+        .annotate(day=TruncDate('order__created_at', tzinfo=timezone.get_current_timezone()))
+        .values('day', 'product_id').annotate(units=Sum('quantity'), revenue=Sum(revenue))
+    )
+    DailyProductSales.objects.bulk_create(
+        (DailyProductSales(day=row['day'], product_id=row['product_id'], units=row['units'], revenue=row['revenue'])
+         for row in rows.iterator()),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_dailyorderrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shop.product')),
+            ],
+            options={
+                'unique_together': {('day', 'product')},
+            },
+        ),
+        migrations.RunPython(seed_product_sales, migrations.RunPython.noop),
+    ]
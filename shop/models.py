@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 
 User = get_user_model()
 
@@ -20,7 +21,28 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+    # Maintained by a database trigger on PostgreSQL (see migration 0005)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Resized WebP/JPEG copies and LQIP placeholder, filled in by shop.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the storefront catalog (newest first, in stock only)
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(stock_quantity__gt=0),
+                name='product_catalog_idx',
+            ),
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                condition=models.Q(stock_quantity__gt=0),
+                name='product_catalog_category_idx',
+            ),
+            # Same ordering when the shopper includes out-of-stock products
+            models.Index(fields=['-created_at', '-id'], name='product_recent_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -90,6 +112,14 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pages of the admin order list: (created_at, id) for the
+            # default sort, prefixed by the filter column when one is set
+            models.Index(fields=['-created_at', '-id'], name='order_recent_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_recent_idx'),
+            models.Index(fields=['country', '-created_at', '-id'], name='order_country_recent_idx'),
+            models.Index(fields=['-total_amount', '-id'], name='order_amount_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.first_name} {self.last_name}"
@@ -117,4 +147,69 @@ class OrderItem(models.Model):
     
     @property
     def total_price(self):
-        return self.quantity * self.price
\ No newline at end of file
+        return self.quantity * self.price
+
+
+class FacetCount(models.Model):
+    """
+    Precomputed number of products per catalog facet value, split by stock
+    state so the storefront can show counts without a GROUP BY over Product.
+    Maintained incrementally by shop.facets and rebuilt by the
+    ``rebuild_facet_counts`` management command.
+    """
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=50)
+    in_stock = models.BooleanField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('facet', 'value', 'in_stock')
+
+    def __str__(self):
+        return f"{self.facet}={self.value} ({'in' if self.in_stock else 'out of'} stock): {self.count}"
+
+
+class DailyOrderRollup(models.Model):
+    """
+    Orders, revenue and items sold per local day and order status, so the
+    admin dashboard reads a few rows per day instead of scanning Order.
+    Maintained incrementally by shop.rollups at checkout and on status
+    changes, and rebuilt by the ``rebuild_order_rollups`` management command.
+    """
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    items_sold = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('day', 'status')
+        ordering = ['-day', 'status']
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.order_count} orders, ₹{self.revenue}"
+
+
+class DailyProductSales(models.Model):
+    """
+    Units and revenue (OrderItem.price * quantity) per local day and
+    product, for orders that are not cancelled. Feeds the admin sales
+    reports; maintained alongside DailyOrderRollup by shop.rollups.
+
+    Deleting a product keeps its rows: product becomes NULL and
+    product_name/category_name keep what the product was called (see
+    shop.signals), so past revenue stays in the reports.
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
+    product_name = models.CharField(max_length=200, blank=True)
+    category_name = models.CharField(max_length=100, blank=True)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('day', 'product')
+
+    def __str__(self):
+        product = f"product #{self.product_id}" if self.product_id else f"{self.product_name} (deleted)"
+        return f"{self.day} {product}: {self.units} units, ₹{self.revenue}"
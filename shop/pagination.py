@@ -0,0 +1,83 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+ESTIMATE_CAP = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk):
+    """Encode the (ordering value, pk) of the last row on a page as an opaque token"""
+    value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+    raw = f"{value}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a token produced by encode_cursor back into (value string, pk)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        return value, int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+
+
+def keyset_page(queryset, cursor=None, page_size=24, field='created_at', descending=True):
+    """
+    Return one page of ``queryset`` ordered by (field, id), newest or
+    largest first unless ``descending`` is False.
+
+    Instead of OFFSET, the page starts strictly after the row the cursor
+    points at, so every page is a single index range scan no matter how
+    deep the shopper has scrolled. Returns (items, next_cursor) where
+    next_cursor is None on the last page.
+    """
+    direction, after = ('-', 'lt') if descending else ('', 'gt')
+    queryset = queryset.order_by(f'{direction}{field}', f'{direction}id')
+    if cursor:
+        raw, pk = decode_cursor(cursor)
+        try:
+            value = queryset.model._meta.get_field(field).to_python(raw)
+        except ValidationError:
+            raise InvalidCursor(cursor)
+        if value is None:
+            raise InvalidCursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'id__{after}': pk})
+        )
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return items, next_cursor
+
+
+def estimated_count(queryset, cap=ESTIMATE_CAP):
+    """
+    Approximate row count for ``queryset`` without a full COUNT(*).
+
+    On PostgreSQL this is the planner's row estimate from EXPLAIN. Other
+    databases count at most ``cap`` rows. Returns (count, approximate);
+    approximate is True when the real number may differ.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), True
+    count = queryset.order_by()[:cap + 1].count()
+    return min(count, cap), count > cap
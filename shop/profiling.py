@@ -0,0 +1,297 @@
+"""
+Request profiling.
+
+PerfMiddleware opens a RequestProfile for each request. SQL is timed
+through a connection execute wrapper, templates through
+ProfiledDjangoTemplates (the TEMPLATES backend) and cache lookups
+through the Profiled*Cache backends (CACHES), all of which add to the
+profile of the current thread. Each response carries a Server-Timing
+header. A PERF_SAMPLE_RATE share of requests, plus every request slower
+than PERF_SLOW_MS, is appended as one JSON line to a per-day file in
+PERF_LOG_DIR by a background thread, off the request path. Percentiles
+are computed from the uniformly sampled records only, so always keeping
+slow requests does not skew them.
+
+PERF_LOG_DIR defaults to a directory under the system temp dir, outside
+the deployed code; point it at persistent storage to keep the records
+across reboots.
+"""
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from .querybudget import sql_shape
+
+PERF_SAMPLE_RATE = getattr(settings, 'PERF_SAMPLE_RATE', 0.1)
+PERF_SLOW_MS = getattr(settings, 'PERF_SLOW_MS', 500)
+PERF_LOG_DIR = getattr(settings, 'PERF_LOG_DIR', os.path.join(tempfile.gettempdir(), 'electroshop-perf'))
+PERF_RETENTION_DAYS = getattr(settings, 'PERF_RETENTION_DAYS', 7)
+TOP_SQL = 5
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='perf-log')
+_MISSING = object()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.sql = defaultdict(lambda: [0, 0.0])  # statement -> [count, seconds]
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.sql_count += 1
+            self.sql_seconds += elapsed
+            entry = self.sql[sql]
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def top_sql(self, limit=TOP_SQL):
+        # Shapes are only worked out for stored requests, keeping the per-query cost down
+        shapes = defaultdict(lambda: [0, 0.0])
+        for sql, (count, seconds) in self.sql.items():
+            entry = shapes[sql_shape(sql)]
+            entry[0] += count
+            entry[1] += seconds
+        ranked = sorted(shapes.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [{'sql': shape[:1000], 'count': count, 'ms': round(seconds * 1000, 2)} for shape, (count, seconds) in ranked]
+
+    def server_timing(self, total_seconds):
+        ms = lambda seconds: f'{seconds * 1000:.1f}'
+        app = max(total_seconds - self.sql_seconds - self.template_seconds, 0)
+        return ', '.join([
+            f'db;dur={ms(self.sql_seconds)};desc="{self.sql_count} queries"',
+            f'tpl;dur={ms(self.template_seconds)}',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'app;dur={ms(app)}',
+            f'total;dur={ms(total_seconds)}',
+        ])
+
+
+def start_profile(profile=None):
+    """Open a new profile for this thread, or carry on with ``profile``"""
+    _local.profile = profile or RequestProfile()
+    return _local.profile
+
+
+def end_profile():
+    _local.profile = None
+
+
+def current_profile():
+    return getattr(_local, 'profile', None)
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        profile = current_profile()
+        if profile is None:
+            return super().render(context, request)
+        # Only the outermost render is timed; templates rendered from within it are part of it
+        profile.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_seconds += time.perf_counter() - started
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates whose templates add their render time to the request profile"""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class ProfiledCacheMixin:
+    """Counts get/get_many hits and misses into the request profile"""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        profile = current_profile()
+        if profile is not None and not profile.cache_depth:
+            if value is _MISSING:
+                profile.cache_misses += 1
+            else:
+                profile.cache_hits += 1
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        profile = current_profile()
+        if profile is None:
+            return super().get_many(keys, version=version)
+        # The default get_many calls get() per key; count the batch once
+        profile.cache_depth += 1
+        try:
+            values = super().get_many(keys, version=version)
+        finally:
+            profile.cache_depth -= 1
+        if not profile.cache_depth:
+            profile.cache_hits += len(values)
+            profile.cache_misses += len(keys) - len(values)
+        return values
+
+
+class ProfiledLocMemCache(ProfiledCacheMixin, LocMemCache):
+    pass
+
+
+class ProfiledRedisCache(ProfiledCacheMixin, RedisCache):
+    pass
+
+
+def _log_path(day):
+    return os.path.join(PERF_LOG_DIR, f'perf-{day}.jsonl')
+
+
+def _utc_day(timestamp):
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+
+
+def _prune(today):
+    cutoff = _utc_day(time.time() - PERF_RETENTION_DAYS * 86400)
+    for name in os.listdir(PERF_LOG_DIR):
+        if name.startswith('perf-') and name.endswith('.jsonl') and name[5:15] < cutoff and name[5:15] != today:
+            try:
+                os.remove(os.path.join(PERF_LOG_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+def store_record(record):
+    """Append one record; files are per UTC day and pruned after PERF_RETENTION_DAYS"""
+    day = _utc_day(record['ts'])
+    path = _log_path(day)
+    if not os.path.exists(path):
+        os.makedirs(PERF_LOG_DIR, exist_ok=True)
+        _prune(day)
+    # One short write per line; O_APPEND keeps lines from different processes whole
+    with open(path, 'a', encoding='utf-8') as log:
+        log.write(json.dumps(record) + '\n')
+
+
+def _store_logged(record):
+    try:
+        store_record(record)
+    except OSError:
+        logger.exception("Could not store the request profile")
+
+
+def queue_record(record):
+    """Store ``record`` from the writer thread so the request does not wait on the disk"""
+    _writer.submit(_store_logged, record)
+
+
+def build_record(profile, request, response, total_seconds):
+    total_ms = total_seconds * 1000
+    sampled = random.random() < PERF_SAMPLE_RATE
+    if not sampled and total_ms < PERF_SLOW_MS:
+        return None
+    match = request.resolver_match
+    return {
+        'id': uuid.uuid4().hex[:12],
+        'ts': time.time(),
+        'view': match.view_name if match else 'unresolved',
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'sampled': sampled,
+        'total_ms': round(total_ms, 2),
+        'sql_count': profile.sql_count,
+        'sql_ms': round(profile.sql_seconds * 1000, 2),
+        'template_ms': round(profile.template_seconds * 1000, 2),
+        'cache_hits': profile.cache_hits,
+        'cache_misses': profile.cache_misses,
+        'top_sql': profile.top_sql(),
+    }
+
+
+def read_records(window_seconds):
+    """Stored records of the last ``window_seconds``, oldest first"""
+    now = time.time()
+    since = now - window_seconds
+    days = sorted({_utc_day(since), _utc_day(now)})
+    records = []
+    for day in days:
+        try:
+            with open(_log_path(day), encoding='utf-8') as log:
+                for line in log:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    if record['ts'] >= since:
+                        records.append(record)
+        except FileNotFoundError:
+            continue
+    records.sort(key=lambda record: record['ts'])
+    return records
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def view_stats(records):
+    """Per-view request count, p50/p95/p99 and averages from the sampled records, slowest p95 first"""
+    by_view = defaultdict(list)
+    for record in records:
+        if record['sampled']:
+            by_view[record['view']].append(record)
+    stats = []
+    for view, rows in by_view.items():
+        durations = sorted(row['total_ms'] for row in rows)
+        lookups = sum(row['cache_hits'] + row['cache_misses'] for row in rows)
+        stats.append({
+            'view': view,
+            'samples': len(rows),
+            'p50': percentile(durations, 50),
+            'p95': percentile(durations, 95),
+            'p99': percentile(durations, 99),
+            'sql_count': sum(row['sql_count'] for row in rows) / len(rows),
+            'sql_ms': sum(row['sql_ms'] for row in rows) / len(rows),
+            'template_ms': sum(row['template_ms'] for row in rows) / len(rows),
+            'cache_hit_rate': sum(row['cache_hits'] for row in rows) / lookups * 100 if lookups else None,
+        })
+    stats.sort(key=lambda row: row['p95'], reverse=True)
+    return stats
@@ -0,0 +1,202 @@
+"""
+Short time-to-live stock holds for checkout.
+
+When a shopper submits checkout, each cart line is held against the
+product's stock in an atomic counter store (Django's cache in production,
+LocalCounterStore in tests). Competing shoppers are turned away by the
+counters instead of queueing on the Product rows, which are then written
+exactly once when the order is placed.
+
+Held units are counted per product in expiry buckets of BUCKET_SECONDS:
+a hold placed at t lands in the bucket that closes just after t + TTL,
+and each bucket key expires with its bucket. Holds that are never
+released therefore disappear on their own, without a sweeper.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+HOLD_TTL = getattr(settings, 'STOCK_HOLD_TTL', 60 * 10)
+BUCKET_SECONDS = 60
+
+COUNTER_KEY = 'shop:reserved:{product_id}:{bucket}'
+HOLD_KEY = 'shop:hold:{user_id}'
+
+
+class ReservationFailed(Exception):
+    def __init__(self, products):
+        self.products = products
+        super().__init__(', '.join(product.name for product in products))
+
+
+class CacheCounterStore:
+    """Counters in Django's cache; incr/decr are atomic on Redis and LocMem"""
+
+    def __init__(self, backend=cache):
+        self.backend = backend
+
+    def incr(self, key, delta, timeout):
+        try:
+            return self.backend.incr(key, delta)
+        except ValueError:
+            if self.backend.add(key, delta, timeout):
+                return delta
+            return self.backend.incr(key, delta)
+
+    def decr(self, key, delta):
+        try:
+            self.backend.decr(key, delta)
+        except ValueError:
+            pass  # the bucket already expired
+
+    def get_many(self, keys):
+        return self.backend.get_many(keys)
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, timeout):
+        self.backend.set(key, value, timeout)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+
+class LocalCounterStore:
+    """In-process stand-in for CacheCounterStore, used by tests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def _live(self, key):
+        value, expires_at = self._data.get(key, (None, 0))
+        if expires_at and expires_at < time.time():
+            self._data.pop(key, None)
+            return None
+        return value
+
+    def incr(self, key, delta, timeout):
+        with self._lock:
+            value = self._live(key)
+            if value is None:
+                self._data[key] = (delta, time.time() + timeout)
+                return delta
+            self._data[key] = (value + delta, self._data[key][1])
+            return value + delta
+
+    def decr(self, key, delta):
+        with self._lock:
+            value = self._live(key)
+            if value is not None:
+                self._data[key] = (value - delta, self._data[key][1])
+
+    def get_many(self, keys):
+        with self._lock:
+            return {key: value for key in keys if (value := self._live(key)) is not None}
+
+    def get(self, key):
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.time() + timeout)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+store = CacheCounterStore()
+
+
+def use_store(new_store):
+    global store
+    store = new_store
+
+
+def _hold_bucket(now):
+    return math.ceil((now + HOLD_TTL) / BUCKET_SECONDS)
+
+
+def _live_buckets(now):
+    """Buckets that can still contain unexpired holds"""
+    return range(math.floor(now / BUCKET_SECONDS) + 1, _hold_bucket(now) + 1)
+
+
+def held_quantity(product_id, now=None):
+    now = now or time.time()
+    keys = [COUNTER_KEY.format(product_id=product_id, bucket=b) for b in _live_buckets(now)]
+    return sum(store.get_many(keys).values())
+
+
+def _acquire(product_id, quantity, stock, bucket, now):
+    key = COUNTER_KEY.format(product_id=product_id, bucket=bucket)
+    timeout = bucket * BUCKET_SECONDS - now + BUCKET_SECONDS
+    in_bucket = store.incr(key, quantity, timeout)
+    # Read the other buckets after our increment so two shoppers writing to
+    # neighbouring buckets always see each other.
+    others = [
+        COUNTER_KEY.format(product_id=product_id, bucket=b)
+        for b in _live_buckets(now) if b != bucket
+    ]
+    if in_bucket + sum(store.get_many(others).values()) <= stock:
+        return True
+    store.decr(key, quantity)
+    return False
+
+
+def release_hold(user):
+    """Give back whatever the user holds; safe to call when nothing is held"""
+    hold_key = HOLD_KEY.format(user_id=user.pk)
+    hold = store.get(hold_key)
+    if not hold:
+        return
+    store.delete(hold_key)
+    # Decrementing an expired bucket is a no-op, and expired buckets are never reused
+    for product_id, quantity in hold['items'].items():
+        store.decr(COUNTER_KEY.format(product_id=product_id, bucket=hold['bucket']), quantity)
+
+
+def current_hold(user, cart_items):
+    """The user's live hold if it still matches ``cart_items`` exactly"""
+    hold = store.get(HOLD_KEY.format(user_id=user.pk))
+    if not hold or hold['expires_at'] <= time.time():
+        return None
+    wanted = {item.product_id: item.quantity for item in cart_items}
+    return hold if hold['items'] == wanted else None
+
+
+def reserve_cart(user, cart_items):
+    """
+    Hold every line of ``cart_items`` (Cart rows with their product) for
+    HOLD_TTL seconds. Resubmitting checkout with the same cart keeps the
+    existing hold; a changed cart replaces it. Raises ReservationFailed
+    naming the products other shoppers currently hold, with nothing held.
+    """
+    hold = current_hold(user, cart_items)
+    if hold:
+        return hold
+    release_hold(user)
+
+    now = time.time()
+    bucket = _hold_bucket(now)
+    acquired, short = {}, []
+    for item in cart_items:
+        if _acquire(item.product_id, item.quantity, item.product.stock_quantity, bucket, now):
+            acquired[item.product_id] = item.quantity
+        else:
+            short.append(item.product)
+
+    if short:
+        for product_id, quantity in acquired.items():
+            store.decr(COUNTER_KEY.format(product_id=product_id, bucket=bucket), quantity)
+        raise ReservationFailed(short)
+
+    hold = {'bucket': bucket, 'items': acquired, 'expires_at': now + HOLD_TTL}
+    store.set(HOLD_KEY.format(user_id=user.pk), hold, HOLD_TTL + BUCKET_SECONDS)
+    return hold
@@ -0,0 +1,237 @@
+"""
+Incrementally maintained order metrics for the admin dashboard and
+sales reports.
+
+Every order contributes to exactly one DailyOrderRollup row: the local
+day it was placed on and its current status. Its lines also contribute
+to one DailyProductSales row per product while the order is not
+cancelled. Checkout adds the order and a status change moves it, both
+inside the transaction that writes the Order, so the rollups never
+disagree with committed orders. rebuild_order_rollups() recomputes
+everything from history; use it to seed or repair the tables (e.g.
+after orders are deleted along with their user).
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, Sum, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyOrderRollup, DailyProductSales, Order, OrderItem
+
+REVENUE_EXCLUDED_STATUSES = ('cancelled',)
+
+LINE_REVENUE = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def _zero():
+    return [0, Decimal('0'), 0]
+
+
+def _apply(deltas):
+    """Add {(day, status): [orders, revenue, items]} to the rollup rows"""
+    for (day, status), (orders, revenue, items) in sorted(deltas.items()):
+        if not (orders or revenue or items):
+            continue
+        rows = DailyOrderRollup.objects.filter(day=day, status=status)
+        changes = {
+            'order_count': F('order_count') + orders,
+            'revenue': F('revenue') + revenue,
+            'items_sold': F('items_sold') + items,
+        }
+        if rows.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                DailyOrderRollup.objects.create(
+                    day=day, status=status, order_count=orders, revenue=revenue, items_sold=items
+                )
+        except IntegrityError:
+            rows.update(**changes)
+
+
+def _apply_product_sales(deltas):
+    """
+    Add {(day, product_id): [units, revenue]} to DailyProductSales: one
+    CASE UPDATE for the rows that exist and one bulk INSERT for the rest.
+    """
+    deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+    if not deltas:
+        return
+    days = {day for day, _product_id in deltas}
+    product_ids = {product_id for _day, product_id in deltas}
+    existing = set(
+        DailyProductSales.objects.filter(day__in=days, product_id__in=product_ids)
+        .values_list('day', 'product_id')
+    ) & set(deltas)
+    if existing:
+        whens = {'units': [], 'revenue': []}
+        for day, product_id in existing:
+            units, revenue = deltas[(day, product_id)]
+            whens['units'].append(When(day=day, product_id=product_id, then=F('units') + units))
+            whens['revenue'].append(When(day=day, product_id=product_id, then=F('revenue') + revenue))
+        DailyProductSales.objects.filter(day__in=days, product_id__in=product_ids).update(
+            units=Case(*whens['units'], default=F('units'), output_field=IntegerField()),
+            revenue=Case(*whens['revenue'], default=F('revenue'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+    missing = [key for key in deltas if key not in existing]
+    if missing:
+        try:
+            with transaction.atomic():
+                DailyProductSales.objects.bulk_create([
+                    DailyProductSales(day=day, product_id=product_id, units=deltas[(day, product_id)][0],
+                                      revenue=deltas[(day, product_id)][1])
+                    for day, product_id in missing
+                ])
+        except IntegrityError:
+            # A concurrent checkout created one of the rows first; fall back to per-row upserts
+            for key in missing:
+                _upsert_product_sales(key, *deltas[key])
+
+
+def _upsert_product_sales(key, units, revenue):
+    day, product_id = key
+    rows = DailyProductSales.objects.filter(day=day, product_id=product_id)
+    changes = {'units': F('units') + units, 'revenue': F('revenue') + revenue}
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyProductSales.objects.create(day=day, product_id=product_id, units=units, revenue=revenue)
+    except IntegrityError:
+        rows.update(**changes)
+
+
+def order_placed(order, lines):
+    """
+    Count a new order with ``lines`` (OrderItem instances or anything with
+    product_id, quantity and price); call inside the transaction that
+    creates it.
+    """
+    day = timezone.localdate(order.created_at)
+    _apply({(day, order.status): [1, order.total_amount, sum(line.quantity for line in lines)]})
+    if order.status not in REVENUE_EXCLUDED_STATUSES:
+        sales = defaultdict(lambda: [0, Decimal('0')])
+        for line in lines:
+            sales[(day, line.product_id)][0] += line.quantity
+            sales[(day, line.product_id)][1] += line.price * line.quantity
+        _apply_product_sales(sales)
+
+
+def orders_moved(orders, new_status):
+    """
+    Move ``orders`` (iterables of (order_id, created_at, old_status,
+    total_amount)) to ``new_status``; call inside the transaction that
+    updates them. One query reads their lines, then one UPDATE per touched
+    (day, status) row and at most three statements for product sales.
+    """
+    moved = [order for order in orders if order[2] != new_status]
+    if not moved:
+        return
+    lines = defaultdict(list)
+    for order_id, product_id, quantity, price in OrderItem.objects.filter(
+        order_id__in=[order[0] for order in moved]
+    ).values_list('order_id', 'product_id', 'quantity', 'price'):
+        lines[order_id].append((product_id, quantity, price))
+
+    deltas = defaultdict(_zero)
+    sales = defaultdict(lambda: [0, Decimal('0')])
+    for order_id, created_at, old_status, total_amount in moved:
+        day = timezone.localdate(created_at)
+        units = sum(quantity for _product_id, quantity, _price in lines[order_id])
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            row = deltas[(day, status)]
+            row[0] += sign
+            row[1] += sign * total_amount
+            row[2] += sign * units
+        was_counted = old_status not in REVENUE_EXCLUDED_STATUSES
+        is_counted = new_status not in REVENUE_EXCLUDED_STATUSES
+        if was_counted != is_counted:
+            sign = 1 if is_counted else -1
+            for product_id, quantity, price in lines[order_id]:
+                sales[(day, product_id)][0] += sign * quantity
+                sales[(day, product_id)][1] += sign * price * quantity
+    _apply(deltas)
+    _apply_product_sales(sales)
+
+
+def rebuild_order_rollups():
+    """Recompute every rollup row from Order and OrderItem; returns the number of daily order rows"""
+    tz = timezone.get_current_timezone()
+    rows = defaultdict(_zero)
+    orders = (
+        Order.objects.order_by()
+        .annotate(day=TruncDate('created_at', tzinfo=tz))
+        .values('day', 'status')
+        .annotate(orders=Count('id'), revenue=Sum('total_amount'))
+    )
+    for row in orders:
+        rows[(row['day'], row['status'])][:2] = [row['orders'], row['revenue'] or Decimal('0')]
+    items = (
+        OrderItem.objects.order_by()
+        .annotate(day=TruncDate('order__created_at', tzinfo=tz))
+        .values('day', 'order__status')
+        .annotate(units=Sum('quantity'))
+    )
+    for row in items:
+        rows[(row['day'], row['order__status'])][2] = row['units'] or 0
+
+    sales = (
+        OrderItem.objects.exclude(order__status__in=REVENUE_EXCLUDED_STATUSES).order_by()
+        .annotate(day=TruncDate('order__created_at', tzinfo=tz))
+        .values('day', 'product_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(LINE_REVENUE))
+    )
+
+    with transaction.atomic():
+        DailyOrderRollup.objects.all().delete()
+        DailyOrderRollup.objects.bulk_create([
+            DailyOrderRollup(day=day, status=status, order_count=orders, revenue=revenue, items_sold=units)
+            for (day, status), (orders, revenue, units) in rows.items()
+        ])
+        # Rows of deleted products cannot be rebuilt (their order items went with them)
+        DailyProductSales.objects.filter(product__isnull=False).delete()
+        DailyProductSales.objects.bulk_create(
+            (DailyProductSales(day=row['day'], product_id=row['product_id'], units=row['units'], revenue=row['revenue'])
+             for row in sales.iterator()),
+            batch_size=5000,
+        )
+    return len(rows)
+
+
+def dashboard_metrics(days=30):
+    """
+    All-time totals by status plus a per-day series for the last ``days``
+    days, read from the rollup table only. Revenue leaves out cancelled
+    orders.
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    by_status = {value: {'label': label, 'orders': 0, 'revenue': Decimal('0')} for value, label in Order.STATUS_CHOICES}
+    totals = {'orders': 0, 'revenue': Decimal('0'), 'items_sold': 0}
+    daily = defaultdict(lambda: {'orders': 0, 'revenue': Decimal('0'), 'items_sold': 0})
+
+    all_time = DailyOrderRollup.objects.order_by().values('status').annotate(
+        orders=Sum('order_count'), revenue=Sum('revenue'), items=Sum('items_sold'),
+    )
+    for row in all_time:
+        entry = by_status.setdefault(row['status'], {'label': row['status'], 'orders': 0, 'revenue': Decimal('0')})
+        entry['orders'], entry['revenue'] = row['orders'], row['revenue']
+        totals['orders'] += row['orders']
+        if row['status'] not in REVENUE_EXCLUDED_STATUSES:
+            totals['revenue'] += row['revenue']
+            totals['items_sold'] += row['items']
+
+    recent = DailyOrderRollup.objects.filter(day__gte=since).exclude(status__in=REVENUE_EXCLUDED_STATUSES)
+    for day, orders, revenue, items in recent.values_list('day', 'order_count', 'revenue', 'items_sold'):
+        daily[day]['orders'] += orders
+        daily[day]['revenue'] += revenue
+        daily[day]['items_sold'] += items
+
+    return {
+        'totals': totals,
+        'by_status': [dict(entry, status=status) for status, entry in by_status.items()],
+        'daily': [dict(daily[day], day=day) for day in sorted(daily, reverse=True)],
+    }
@@ -0,0 +1,178 @@
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+
+from .models import Product
+
+SEARCH_PAGE_SIZE = 24
+# Deeper pages are served as this one; keeps OFFSET (and the ranked heap) bounded
+MAX_SEARCH_PAGE = 100
+
+# Field weights, mirroring the A/B/C weights of the PostgreSQL trigger
+NAME_WEIGHT = 3.0
+CATEGORY_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class InvertedIndex:
+    """
+    In-process inverted index used when the database has no full-text
+    search (SQLite in development). Postings map a term to the weighted
+    term frequency per product, and queries are AND-ed starting from the
+    rarest term so the candidate set shrinks as fast as possible.
+    Single-term queries, where the idf is the same for every match, page
+    through a ranked copy of the posting that is kept until the term
+    changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)
+        self._terms = {}
+        self._ranked = {}
+        self._loaded = False
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            rows = Product.objects.values_list(
+                'id', 'name', 'description', 'category__name'
+            ).iterator(chunk_size=2000)
+            for product_id, name, description, category_name in rows:
+                self._add(product_id, name, description, category_name)
+            self._loaded = True
+
+    def _add(self, product_id, name, description, category_name):
+        weights = defaultdict(float)
+        for text, weight in (
+            (name, NAME_WEIGHT),
+            (category_name, CATEGORY_WEIGHT),
+            (description, DESCRIPTION_WEIGHT),
+        ):
+            for term in tokenize(text):
+                weights[term] += weight
+        for term, weight in weights.items():
+            self._postings[term][product_id] = weight
+            self._ranked.pop(term, None)
+        self._terms[product_id] = tuple(weights)
+
+    def _remove(self, product_id):
+        for term in self._terms.pop(product_id, ()):
+            self._ranked.pop(term, None)
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def index_product(self, product_id, name, description, category_name):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._remove(product_id)
+            self._add(product_id, name, description, category_name)
+
+    def remove_product(self, product_id):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._remove(product_id)
+
+    def reset(self):
+        with self._lock:
+            self._postings.clear()
+            self._terms.clear()
+            self._ranked.clear()
+            self._loaded = False
+
+    def search(self, query, offset=0, limit=SEARCH_PAGE_SIZE):
+        """Return ranked product ids matching every term of ``query``"""
+        self._ensure_loaded()
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+            if len(postings) == 1:
+                return self._ranked_ids(terms.pop(), postings[0])[offset:offset + limit]
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+                if not candidates:
+                    return []
+
+            total = len(self._terms) or 1
+            idf = [math.log(1 + total / len(posting)) for posting in postings]
+            scored = heapq.nlargest(
+                offset + limit,
+                ((sum(posting[pid] * weight for posting, weight in zip(postings, idf)), pid)
+                 for pid in candidates),
+            )
+
+        return [pid for _score, pid in scored[offset:]]
+
+    def _ranked_ids(self, term, posting):
+        ranked = self._ranked.get(term)
+        if ranked is None:
+            # Same order as the scored path: weight, then newest id first
+            ranked = [pid for _weight, pid in sorted(((weight, pid) for pid, weight in posting.items()), reverse=True)]
+            self._ranked[term] = ranked
+        return ranked
+
+
+inverted_index = InvertedIndex()
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def search_products(query, page=1, page_size=SEARCH_PAGE_SIZE):
+    """
+    Ranked full-text search over product name, category name and description.
+
+    Returns (products, has_next). PostgreSQL ranks against the trigger
+    maintained ``search_vector`` column; other databases use the in-process
+    inverted index and load only the ids on the requested page.
+    """
+    query = (query or '').strip()
+    if not query:
+        return [], False
+    offset = (page - 1) * page_size
+
+    if uses_postgres():
+        search_query = SearchQuery(query, search_type='websearch', config='english')
+        products = list(
+            Product.objects.filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .order_by('-rank', '-id')[offset:offset + page_size + 1]
+        )
+    else:
+        ids = inverted_index.search(query, offset=offset, limit=page_size + 1)
+        by_id = Product.objects.in_bulk(ids)
+        products = [by_id[pk] for pk in ids if pk in by_id]
+
+    return products[:page_size], len(products) > page_size
@@ -0,0 +1,76 @@
+from django.core.cache import cache
+from django.db.models import CharField, IntegerField, Value
+from django.utils.functional import SimpleLazyObject
+
+from .guest_cart import guest_cart_quantities
+from .models import Cart, Wishlist
+
+SHOPPER_STATE_KEY = 'shop:shopper:{user_id}'
+SHOPPER_STATE_TIMEOUT = 60 * 15
+
+
+class ShopperState:
+    """
+    Cart and wishlist membership for one user, for O(1) template checks:
+
+        {% if product.pk in shopper.cart_ids %} ... {% endif %}
+    """
+
+    def __init__(self, cart_quantities=None, wishlist_ids=()):
+        self.cart_quantities = dict(cart_quantities or {})
+        self.cart_ids = frozenset(self.cart_quantities)
+        self.wishlist_ids = frozenset(wishlist_ids)
+
+    @property
+    def cart_count(self):
+        return sum(self.cart_quantities.values())
+
+    def quantity(self, product_id):
+        return self.cart_quantities.get(product_id, 0)
+
+
+def _load_from_db(user_id):
+    kind = Value('cart', output_field=CharField())
+    cart = Cart.objects.filter(user_id=user_id).annotate(kind=kind).values_list('kind', 'product_id', 'quantity')
+    wishlist = Wishlist.objects.filter(user_id=user_id).annotate(
+        kind=Value('wishlist', output_field=CharField()),
+        qty=Value(0, output_field=IntegerField()),
+    ).values_list('kind', 'product_id', 'qty')
+
+    cart_quantities, wishlist_ids = {}, []
+    for row_kind, product_id, quantity in cart.union(wishlist, all=True):
+        if row_kind == 'cart':
+            cart_quantities[product_id] = quantity
+        else:
+            wishlist_ids.append(product_id)
+    return cart_quantities, wishlist_ids
+
+
+def load_shopper_state(user):
+    """Return the user's ShopperState from cache, or from a single UNION ALL query"""
+    if not user.is_authenticated:
+        return ShopperState()
+    key = SHOPPER_STATE_KEY.format(user_id=user.pk)
+    cached = cache.get(key)
+    if cached is None:
+        cached = _load_from_db(user.pk)
+        cache.set(key, cached, SHOPPER_STATE_TIMEOUT)
+    return ShopperState(*cached)
+
+
+def _request_state(request):
+    if request.user.is_authenticated:
+        return load_shopper_state(request.user)
+    return ShopperState(guest_cart_quantities(request))
+
+
+def attach_shopper_state(request):
+    """Set ``request.shopper``; nothing is loaded until a view or template reads it"""
+    request.shopper = SimpleLazyObject(lambda: _request_state(request))
+
+
+def invalidate_shopper_state(request):
+    """Drop the cached state after a cart or wishlist change"""
+    if request.user.is_authenticated:
+        cache.delete(SHOPPER_STATE_KEY.format(user_id=request.user.pk))
+    attach_shopper_state(request)
@@ -0,0 +1,73 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django_cleanup.signals import cleanup_post_delete
+
+from .autocomplete import prefix_index
+from .category_cache import invalidate_categories
+from .fragments import invalidate_fragments
+from .images import delete_derivatives
+from .metrics import record_connection_opened
+from .models import Category, DailyProductSales, Product
+from .search import inverted_index
+
+
+@receiver(pre_save, sender=Product)
+def drop_product_fragments(sender, instance, **kwargs):
+    # updated_at still holds the revision the cached fragments were keyed on
+    if instance.pk is not None:
+        invalidate_fragments((instance.pk, instance.updated_at))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    prefix_index.add('product', instance.pk, instance.name)
+    if not inverted_index.loaded:
+        return
+    category_name = instance.category.name if instance.category_id else ''
+    inverted_index.index_product(instance.pk, instance.name, instance.description, category_name)
+
+
+@receiver(pre_delete, sender=Product)
+def keep_sales_history(sender, instance, **kwargs):
+    # The rows outlive the product (SET_NULL); keep what it was called
+    DailyProductSales.objects.filter(product=instance).update(
+        product_name=instance.name,
+        category_name=instance.category.name if instance.category_id else '',
+    )
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    invalidate_fragments((instance.pk, instance.updated_at))
+    prefix_index.remove('product', instance.pk)
+    inverted_index.remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, created, **kwargs):
+    invalidate_categories()
+    prefix_index.add('category', instance.pk, instance.name)
+    if created or not inverted_index.loaded:
+        return
+    rows = Product.objects.filter(category=instance).values_list('id', 'name', 'description')
+    for product_id, name, description in rows:
+        inverted_index.index_product(product_id, name, description, instance.name)
+
+
+@receiver(post_delete, sender=Category)
+def unindex_category(sender, instance, **kwargs):
+    invalidate_categories()
+    prefix_index.remove('category', instance.pk)
+
+
+@receiver(cleanup_post_delete, sender=Product)
+def drop_image_derivatives(sender, field_name, file_name, **kwargs):
+    # django_cleanup removed a replaced or orphaned upload; its derivatives go with it
+    if field_name == 'image':
+        delete_derivatives(file_name)
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    record_connection_opened(connection.alias)
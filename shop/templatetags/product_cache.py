@@ -0,0 +1,36 @@
+from django import template
+
+from shop.fragments import FRAGMENT_NAMES, get_or_render
+
+register = template.Library()
+
+
+class ProductCacheNode(template.Node):
+    def __init__(self, nodelist, name, product):
+        self.nodelist = nodelist
+        self.name = name
+        self.product = product
+
+    def render(self, context):
+        product = self.product.resolve(context)
+        return get_or_render(self.name, product, lambda: self.nodelist.render(context))
+
+
+@register.tag(name='productcache')
+def productcache(parser, token):
+    """
+    Cache the enclosed block per product revision:
+
+        {% productcache "card" product %} ... {% endproductcache %}
+
+    Keep anything that depends on the current user outside the block.
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name and a product")
+    name = bits[1].strip('"\'')
+    if name not in FRAGMENT_NAMES:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' fragment name must be one of {FRAGMENT_NAMES}")
+    nodelist = parser.parse(('endproductcache',))
+    parser.delete_first_token()
+    return ProductCacheNode(nodelist, name, parser.compile_filter(bits[2]))
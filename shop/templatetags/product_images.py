@@ -0,0 +1,18 @@
+from django import template
+
+from shop.images import image_sources
+
+register = template.Library()
+
+
+@register.inclusion_tag('shop/includes/product_image.html')
+def product_image(product, sizes='100vw', css_class='', style='', lazy=True):
+    """Render a product image as <picture> with WebP/JPEG srcsets and an LQIP background"""
+    return {
+        'product': product,
+        'sizes': sizes,
+        'css_class': css_class,
+        'style': style,
+        'lazy': lazy,
+        **image_sources(product),
+    }
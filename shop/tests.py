@@ -1,3 +1,1047 @@
-from django.test import TestCase
+import json
+import os
+import posixpath
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from PIL import Image
+
+import accounts.urls
+import customadmin.urls
+from customadmin.models import AdminLog
+
+from . import checkout, metrics, reservations
+from . import urls as shop_urls
+from .autocomplete import AUTOCOMPLETE_LIMIT, PrefixIndex, prefix_index
+from .cart import MAX_LINE_QUANTITY, apply_cart_operations, merge_into_cart
+from .category_cache import _memo as category_memo
+from .checkout import CheckoutConflict, InsufficientStock, place_order
+from .fragments import FRAGMENT_NAMES, fragment_key, get_or_render
+from .guest_cart import GUEST_CART_SESSION_KEY
+from .images import delete_derivatives, derivative_dir, generate_derivatives
+from .models import Cart, Category, FacetCount, Order, OrderItem, Product, Wishlist
+from .querybudget import N_PLUS_ONE_THRESHOLD, QueryCounter, is_unbounded, query_budget
+from .reservations import LocalCounterStore, ReservationFailed, held_quantity, release_hold, reserve_cart, use_store
+from .search import MAX_SEARCH_PAGE, inverted_index, search_products
+from .shopper import load_shopper_state
+from .views import MAX_CART_OPERATIONS
+
+SEARCH_CATALOG_SIZE = 200_000
+SEARCH_BUDGET_SECONDS = 0.05
+AUTOCOMPLETE_BUDGET_SECONDS = 0.001
+
+BRANDS = ['acme', 'volta', 'nimbus', 'zenith', 'orbit', 'pulse', 'quanta', 'lumen', 'vertex', 'nova']
+KINDS = ['phone', 'laptop', 'tablet', 'headphones', 'speaker', 'camera', 'monitor', 'charger', 'router', 'watch']
+TRAITS = ['wireless', 'portable', 'gaming', 'compact', 'rugged', 'slim', 'smart', 'pro', 'mini', 'ultra']
+SPECS = ['4gb', '8gb', '16gb', '32gb', '64gb', '128gb', '256gb', '512gb', '1tb', '2tb']
+
+
+def synthetic_products(size, categories, seed=0):
+    rng = random.Random(seed)
+    for i in range(size):
+        brand, kind, trait, spec = rng.choice(BRANDS), rng.choice(KINDS), rng.choice(TRAITS), rng.choice(SPECS)
+        yield Product(
+            name=f'{brand.title()} {trait} {kind} {spec} model{i}',
+            description=f'A {trait} {kind} with {spec} of storage by {brand}, {rng.choice(TRAITS)} design.',
+            price=Decimal(rng.randint(500, 150000)),
+            stock_quantity=rng.randint(0, 50),
+            image='products/test.jpg',
+            category=categories[KINDS.index(kind)],
+        )
+
+
+class SearchTests(TestCase):
+    """Ranked search over a 200k-product synthetic catalog"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([Category(name=kind.title()) for kind in KINDS])
+        Product.objects.bulk_create(synthetic_products(SEARCH_CATALOG_SIZE, categories), batch_size=5000)
+        inverted_index.reset()
+        cls.addClassCleanup(inverted_index.reset)
+        search_products('warm up')  # loads the inverted index when the database has no full-text search
+
+    def assertFast(self, query, page=1):
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            products, _has_next = search_products(query, page=page)
+            timings.append(time.perf_counter() - started)
+        median = statistics.median(timings)
+        self.assertLess(median, SEARCH_BUDGET_SECONDS, f"{query!r} page {page} took {median * 1000:.1f} ms")
+        return products
+
+    def test_common_term_is_fast(self):
+        products = self.assertFast('wireless')
+        self.assertTrue(products)
+        self.assertTrue(all('wireless' in f'{p.name} {p.description}'.lower() for p in products))
+
+    def test_multi_term_query_is_fast(self):
+        products = self.assertFast('acme gaming laptop')
+        self.assertTrue(products)
+        for product in products:
+            text = f'{product.name} {product.description}'.lower()
+            self.assertTrue(all(term in text for term in ('acme', 'gaming', 'laptop')))
+
+    def test_category_name_matches(self):
+        products = self.assertFast('router 1tb')
+        self.assertTrue(products)
+
+    def test_deep_page_is_fast(self):
+        self.assertFast('phone', page=MAX_SEARCH_PAGE)
+
+    def test_name_ranks_above_description(self):
+        # 'model7' only appears in one product name
+        products, _has_next = search_products('model7')
+        self.assertEqual([product.name.split()[-1] for product in products], ['model7'])
+
+    def test_unparseable_page_falls_back_to_first(self):
+        for page in ('²', '-1', 'x', '0'):
+            response = self.client.get(reverse('shop:search_api'), {'q': 'phone', 'page': page})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['page'], 1)
+
+    def test_huge_page_is_capped(self):
+        response = self.client.get(reverse('shop:search_api'), {'q': 'phone', 'page': '9' * 30})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['page'], MAX_SEARCH_PAGE)
+
+    def test_autocomplete_is_fast(self):
+        index = PrefixIndex()
+        index.complete('warm up')  # builds the index
+        prefixes = [word[:length] for word in BRANDS + KINDS + TRAITS + SPECS for length in (1, 2, 3)]
+        timings = []
+        for prefix in prefixes * 5:
+            started = time.perf_counter()
+            index.complete(prefix)
+            timings.append(time.perf_counter() - started)
+        p99 = statistics.quantiles(timings, n=100)[98]
+        self.assertLess(p99, AUTOCOMPLETE_BUDGET_SECONDS, f"p99 autocomplete lookup took {p99 * 1000:.2f} ms")
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = Category.objects.create(name='Phones')
+        cls.galaxy = Product.objects.create(
+            name='Galaxy S25 Ultra', description='x', price=Decimal('900'), stock_quantity=1,
+            image='products/test.jpg', category=cls.phones,
+        )
+        cls.pixel = Product.objects.create(
+            name='Pixel 9 Pro', description='x', price=Decimal('800'), stock_quantity=1,
+            image='products/test.jpg', category=cls.phones,
+        )
+
+    def setUp(self):
+        prefix_index.reset()
+        self.addCleanup(prefix_index.reset)
+
+    def labels(self, prefix):
+        return [label for _kind, _pk, label in prefix_index.complete(prefix)]
+
+    def test_any_word_of_a_name_matches(self):
+        self.assertEqual(self.labels('s25'), ['Galaxy S25 Ultra'])
+        self.assertEqual(self.labels('ULT'), ['Galaxy S25 Ultra'])
+        self.assertEqual(self.labels('pro'), ['Pixel 9 Pro'])
+        self.assertEqual(self.labels('  pixel   9 '), ['Pixel 9 Pro'])
+
+    def test_categories_rank_first(self):
+        Product.objects.create(
+            name='Phone stand', description='x', price=Decimal('10'), stock_quantity=1, image='products/test.jpg',
+        )
+        self.assertEqual(prefix_index.complete('phon'), [
+            ('category', self.phones.pk, 'Phones'), ('product', Product.objects.get(name='Phone stand').pk, 'Phone stand'),
+        ])
+
+    def test_limit(self):
+        Product.objects.bulk_create([
+            Product(name=f'Cable {i}', description='x', price=Decimal('5'), stock_quantity=1, image='products/test.jpg')
+            for i in range(AUTOCOMPLETE_LIMIT + 3)
+        ])
+        self.assertEqual(len(prefix_index.complete('cable')), AUTOCOMPLETE_LIMIT)
+        self.assertEqual(len(prefix_index.complete('cable', limit=2)), 2)
+
+    def test_empty_and_blank_queries(self):
+        for query in ('', '   ', None):
+            self.assertEqual(prefix_index.complete(query), [])
+        self.assertFalse(prefix_index.loaded)  # nothing to look up, so the index is not built
+        self.assertEqual(self.labels('x'), [])
+        response = self.client.get(reverse('shop:autocomplete'))
+        self.assertEqual(response.json(), {'success': True, 'suggestions': []})
+
+    def test_single_letter_query(self):
+        self.assertEqual(self.labels('g'), ['Galaxy S25 Ultra'])
+        response = self.client.get(reverse('shop:autocomplete'), {'q': 'p'})
+        self.assertEqual([s['label'] for s in response.json()['suggestions']], ['Phones', 'Pixel 9 Pro'])
+        self.assertEqual(response.json()['suggestions'][1]['url'], reverse('shop:product_detail', args=[self.pixel.pk]))
+
+    def test_signals_keep_the_index_current(self):
+        self.assertEqual(self.labels('galaxy'), ['Galaxy S25 Ultra'])  # loads the index
+        self.galaxy.name = 'Galaxy S26 Edge'
+        self.galaxy.save()
+        self.assertEqual(self.labels('s25'), [])
+        self.assertEqual(self.labels('edge'), ['Galaxy S26 Edge'])
+
+        Product.objects.create(
+            name='Nothing Phone 3', description='x', price=Decimal('500'), stock_quantity=1, image='products/test.jpg',
+        )
+        self.assertEqual(self.labels('nothing'), ['Nothing Phone 3'])
+        self.pixel.delete()
+        self.assertEqual(self.labels('pixel'), [])
+
+        self.phones.name = 'Smartphones'
+        self.phones.save()
+        self.assertEqual(self.labels('smart'), ['Smartphones'])
+        self.phones.delete()
+        self.assertEqual(self.labels('smart'), [])
+
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Fragment probe', description='Cached card', price=Decimal('120'), stock_quantity=3,
+            image='products/test.jpg',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def detail(self):
+        return self.client.get(reverse('shop:product_detail', args=[self.product.pk])).content.decode()
+
+    def test_save_moves_readers_to_a_fresh_fragment(self):
+        self.assertIn('₹120', self.detail())
+        # A write that skips updated_at keeps the cached revision...
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal('150'))
+        self.assertIn('₹120', self.detail())
+        # ...a save bumps it, so the next render is fresh
+        self.product.refresh_from_db()
+        self.product.price = Decimal('175')
+        self.product.save()
+        self.assertIn('₹175', self.detail())
+
+    def test_card_follows_saves(self):
+        home = lambda: self.client.get(reverse('shop:home')).content.decode()
+        self.assertIn('3 in stock', home())
+        self.product.stock_quantity = 0
+        self.product.save()
+        self.assertNotIn('3 in stock', home())
+
+    def test_cached_fragments_are_well_formed(self):
+        self.detail()
+        self.client.get(reverse('shop:home'))
+        for name in FRAGMENT_NAMES:
+            with self.subTest(fragment=name):
+                html = cache.get(fragment_key(name, self.product.pk, self.product.updated_at))
+                self.assertIsNotNone(html)
+                self.assertEqual(html.count('<div'), html.count('</div>'))
+
+    def test_waiters_reuse_the_lock_holders_render(self):
+        key = fragment_key('card', self.product.pk, self.product.updated_at)
+        cache.add(f'{key}:lock', 1)  # another renderer is busy
+        threading.Timer(0.05, cache.set, (key, '<p>rendered once</p>')).start()
+        render = mock.Mock(return_value='<p>rendered twice</p>')
+        self.assertEqual(get_or_render('card', self.product, render), '<p>rendered once</p>')
+        render.assert_not_called()
+
+    def test_waiters_give_up_after_lock_wait(self):
+        key = fragment_key('card', self.product.pk, self.product.updated_at)
+        cache.add(f'{key}:lock', 1)
+        render = mock.Mock(return_value='<p>uncached</p>')
+        with mock.patch('shop.fragments.LOCK_WAIT', 0.05):
+            self.assertEqual(get_or_render('card', self.product, render), '<p>uncached</p>')
+        render.assert_called_once()
+        self.assertIsNone(cache.get(key))  # the lock holder still owns the write
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Validator probe', description='x', price=Decimal('80'), stock_quantity=5, image='products/test.jpg',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = [reverse('shop:home'), reverse('shop:product_detail', args=[self.product.pk])]
+
+    def etag(self, url):
+        return self.client.get(url).headers.get('ETag')
+
+    def test_anonymous_repeat_gets_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Last-Modified', response.headers)
+                repeat = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(repeat.status_code, 304)
+                repeat = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(repeat.status_code, 304)
+
+    def assertNoValidators(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('ETag', response.headers)
+                self.assertNotIn('Last-Modified', response.headers)
+
+    def test_signed_in_shoppers_get_no_validators(self):
+        self.client.force_login(get_user_model().objects.create_user('validator-customer'))
+        self.assertNoValidators()
+
+    def test_guests_with_a_cart_get_no_validators(self):
+        self.client.get(reverse('shop:add_to_cart', args=[self.product.pk]))
+        self.assertNoValidators()
+
+    def test_etag_changes_with_price_and_stock(self):
+        before = [self.etag(url) for url in self.urls]
+        self.product.price = Decimal('85')
+        self.product.save()
+        after_price = [self.etag(url) for url in self.urls]
+
+        buyer = get_user_model().objects.create_user('validator-buyer')
+        Cart.objects.create(user=buyer, product=self.product, quantity=2)
+        place_order(buyer, Cart.objects.filter(user=buyer).select_related('product'), {})
+        after_stock = [self.etag(url) for url in self.urls]
+
+        for url, etags in zip(self.urls, zip(before, after_price, after_stock)):
+            with self.subTest(url=url):
+                self.assertEqual(len(set(etags)), 3)
+
+
+class ShopperStateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('shopper-state')
+        cls.product, cls.other = Product.objects.bulk_create([
+            Product(name=f'State probe {i}', description='x', price=Decimal('20'), stock_quantity=9,
+                    image='products/test.jpg')
+            for i in range(2)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def state(self):
+        return load_shopper_state(self.user)
+
+    def test_state_is_cached(self):
+        Cart.objects.create(user=self.user, product=self.product, quantity=3)
+        Wishlist.objects.create(user=self.user, product=self.other)
+        with self.assertNumQueries(1):
+            state = self.state()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.state().cart_quantities, state.cart_quantities)
+        self.assertEqual((state.cart_quantities, state.wishlist_ids), ({self.product.pk: 3}, {self.other.pk}))
+        self.assertEqual(state.cart_count, 3)
+
+    def test_cart_changes_invalidate(self):
+        self.assertEqual(self.state().cart_ids, set())  # cached empty
+        self.client.get(reverse('shop:add_to_cart', args=[self.product.pk]))
+        self.assertEqual(self.state().cart_quantities, {self.product.pk: 1})
+
+        item = Cart.objects.get(user=self.user)
+        self.client.post(reverse('shop:increase_quantity', args=[item.pk]))
+        self.assertEqual(self.state().quantity(self.product.pk), 2)
+        self.client.post(reverse('shop:ajax_cart_batch'), json.dumps({'operations': {str(item.pk): {'quantity': 5}}}),
+                         content_type='application/json')
+        self.assertEqual(self.state().quantity(self.product.pk), 5)
+        self.client.get(reverse('shop:remove_from_cart', args=[item.pk]))
+        self.assertEqual(self.state().cart_ids, set())
+
+    def test_wishlist_changes_invalidate(self):
+        self.assertEqual(self.state().wishlist_ids, set())
+        self.client.get(reverse('shop:add_to_wishlist', args=[self.other.pk]))
+        self.assertEqual(self.state().wishlist_ids, {self.other.pk})
+        item = Wishlist.objects.get(user=self.user)
+        self.client.get(reverse('shop:remove_from_wishlist', args=[item.pk]))
+        self.assertEqual(self.state().wishlist_ids, set())
+
+    def test_checkout_empties_the_cached_cart(self):
+        Cart.objects.create(user=self.user, product=self.product, quantity=1)
+        self.assertEqual(self.state().cart_count, 1)
+        self.client.post(reverse('shop:checkout'), {'first_name': 'State', 'last_name': 'Probe'})
+        self.assertEqual(self.state().cart_count, 0)
+
+
+class SessionRefreshTests(TestCase):
+    """ThrottledSessionMiddleware writes a sliding session once per refresh interval"""
+
+    REQUESTS = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Session probe', description='x', price=Decimal('15'), stock_quantity=5, image='products/test.jpg',
+        )
+
+    def setUp(self):
+        self.now = time.time()
+        clock = mock.patch('shop.middleware.time.time', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        # A guest with a cart; the first request that sends the cookie stamps the refresh time
+        self.client.post(reverse('shop:guest_cart_update', args=[self.product.pk]), {'delta': 1})
+        self.browse()
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        save = mock.patch.object(store, 'save', autospec=True, side_effect=store.save)
+        self.save = save.start()
+        self.addCleanup(save.stop)
+        self.interval = settings.SESSION_COOKIE_AGE * settings.SESSION_REFRESH_FRACTION
+
+    def browse(self, requests=1):
+        for _ in range(requests):
+            self.assertEqual(self.client.get(reverse('shop:about_us')).status_code, 200)
+
+    def test_requests_inside_the_interval_do_not_write(self):
+        self.now += self.interval / 2
+        self.browse(self.REQUESTS)
+        self.assertEqual(self.save.call_count, 0)
+
+    def test_first_request_after_the_interval_writes_once(self):
+        self.now += self.interval + 1
+        self.browse(self.REQUESTS)
+        self.assertEqual(self.save.call_count, 1)
+        self.assertIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+
+    def test_modified_session_is_saved_at_once(self):
+        self.client.post(reverse('shop:guest_cart_update', args=[self.product.pk]), {'delta': 1})
+        self.assertEqual(self.save.call_count, 1)
+        self.browse(self.REQUESTS)
+        self.assertEqual(self.save.call_count, 1)
+
+
+class CategoryCacheTests(TestCase):
+    """Steady-state storefront renders run no category query"""
+
+    # Conditional-GET ETag, facet revision, the product page and the facet counts
+    WARM_HOME_QUERIES = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([Category(name=kind.title()) for kind in KINDS])
+        Product.objects.bulk_create(synthetic_products(60, categories))
+        call_command('rebuild_facet_counts', stdout=open(os.devnull, 'w'))
+
+    def setUp(self):
+        cache.clear()
+        category_memo['entry'] = None
+        self.addCleanup(category_memo.__setitem__, 'entry', None)
+
+    def category_queries(self, queries):
+        return [query for query in queries if '"shop_category"' in query['sql']]
+
+    def test_cold_render_loads_categories_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('shop:home'))
+        self.assertEqual(len(self.category_queries(queries)), 1)
+
+    def test_warm_home_render(self):
+        self.client.get(reverse('shop:home'))
+        with self.assertNumQueries(self.WARM_HOME_QUERIES) as queries:
+            response = self.client.get(reverse('shop:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.category_queries(queries), [])
+
+    def test_warm_catalog_page(self):
+        self.client.get(reverse('shop:home'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('shop:catalog_page'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_worker_reads_the_shared_snapshot(self):
+        self.client.get(reverse('shop:home'))
+        category_memo['entry'] = None  # a worker without its own copy yet
+        with self.assertNumQueries(self.WARM_HOME_QUERIES) as queries:
+            self.client.get(reverse('shop:home'))
+        self.assertEqual(self.category_queries(queries), [])
+
+    def test_saving_a_category_invalidates(self):
+        self.client.get(reverse('shop:home'))
+        category = Category.objects.first()
+        category.name = 'Renamed category'
+        category.save()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('shop:home'))
+        self.assertEqual(len(self.category_queries(queries)), 1)
+        self.assertContains(response, 'Renamed category')
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), 'teal').save(buffer, 'JPEG')
+        source_name = default_storage.save('products/sample.jpg', ContentFile(buffer.getvalue()))
+        self.product = Product.objects.create(
+            name='Sample', description='Sample', price=Decimal('10'), stock_quantity=1, image=source_name,
+        )
+        self.directory = derivative_dir(source_name)
+
+    def files(self):
+        return sorted(default_storage.listdir(self.directory)[1])
+
+    def test_regenerating_replaces_files_in_place(self):
+        first = generate_derivatives(self.product.pk, self.product.image.name)
+        expected = self.files()
+        self.assertEqual(len(expected), 6)
+        default_storage.save(posixpath.join(self.directory, '320w_AbCdEfG.webp'), ContentFile(b'orphan'))
+
+        second = generate_derivatives(self.product.pk, self.product.image.name)
+        self.assertEqual(self.files(), expected)
+        self.assertEqual(second['webp'], first['webp'])
+        self.assertEqual(second['jpeg'], first['jpeg'])
+
+    def test_delete_removes_the_directory(self):
+        generate_derivatives(self.product.pk, self.product.image.name)
+        delete_derivatives(self.product.image.name)
+        self.assertFalse(os.path.exists(default_storage.path(self.directory)))
+
+
+
+class CheckoutTests(TestCase):
+    # SAVEPOINT, order INSERT, stock UPDATE, updated rows SELECT, items
+    # INSERT, cart DELETE, rollup UPDATE, product sales SELECT + SAVEPOINT
+    # + INSERT + RELEASE, RELEASE; the same for any cart size
+    PLACE_ORDER_QUERIES = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = Category.objects.bulk_create([Category(name=kind.title()) for kind in KINDS])
+
+    def cart(self, size, stock=10, quantity=2):
+        user = get_user_model().objects.create_user(f'shopper-{get_user_model().objects.count()}')
+        products = Product.objects.bulk_create(synthetic_products(size, self.categories, seed=size))
+        Product.objects.filter(pk__in=[product.pk for product in products]).update(stock_quantity=stock)
+        Cart.objects.bulk_create([Cart(user=user, product=product, quantity=quantity) for product in products])
+        return user, list(Cart.objects.filter(user=user).select_related('product'))
+
+    def test_query_count_is_flat(self):
+        place_order(*self.cart(1), {})  # the first order of the day creates the rollup rows
+        for size in (1, 5, 20, 50):
+            user, items = self.cart(size)
+            with self.subTest(lines=size), self.assertNumQueries(self.PLACE_ORDER_QUERIES):
+                place_order(user, items, {'first_name': 'Test'})
+
+    def test_stock_is_decremented(self):
+        user, items = self.cart(3, stock=5, quantity=2)
+        order = place_order(user, items, {})
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual(set(Product.objects.filter(pk__in=[i.product_id for i in items]).values_list(
+            'stock_quantity', flat=True)), {3})
+        self.assertFalse(Cart.objects.filter(user=user).exists())
+
+    def test_insufficient_stock_writes_nothing(self):
+        user, items = self.cart(3, stock=5, quantity=2)
+        short = items[1].product
+        Product.objects.filter(pk=short.pk).update(stock_quantity=1)
+        with self.assertRaises(InsufficientStock) as raised:
+            place_order(user, items, {})
+        self.assertEqual([product.pk for product in raised.exception.products], [short.pk])
+        self.assertFalse(Order.objects.filter(user=user).exists())
+        self.assertEqual(Cart.objects.filter(user=user).count(), 3)
+        self.assertEqual(Product.objects.get(pk=items[0].product_id).stock_quantity, 5)
+
+    def test_facet_counts_follow_the_committed_stock(self):
+        user, items = self.cart(4, stock=2, quantity=2)  # every line sells out
+        call_command('rebuild_facet_counts', stdout=open(os.devnull, 'w'))
+        # The cart copy says plenty of stock; the rows are what counts
+        for item in items:
+            item.product.stock_quantity = 100
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(user, items, {})
+        counts = set(FacetCount.objects.exclude(count=0).values_list('facet', 'value', 'in_stock', 'count'))
+        call_command('rebuild_facet_counts', stdout=open(os.devnull, 'w'))
+        self.assertEqual(counts, set(FacetCount.objects.exclude(count=0).values_list('facet', 'value', 'in_stock', 'count')))
+
+    def test_facets_wait_for_commit(self):
+        user, items = self.cart(2, stock=2, quantity=2)
+        with mock.patch.object(checkout, 'update_facet_counts') as update_facet_counts:
+            with self.captureOnCommitCallbacks() as callbacks:
+                place_order(user, items, {})
+            update_facet_counts.assert_not_called()
+            for callback in callbacks:
+                callback()
+            update_facet_counts.assert_called_once()
+
+    def test_restock_between_update_and_lookup_is_retried(self):
+        user, items = self.cart(2)
+        real_decrement = checkout._decrement_stock
+        calls = []
+
+        def short_once(quantities, now):
+            calls.append(quantities)
+            return 0 if len(calls) == 1 else real_decrement(quantities, now)
+
+        with mock.patch.object(checkout, '_decrement_stock', side_effect=short_once):
+            order = place_order(user, items, {})
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(Order.objects.filter(user=user).get(), order)
+
+    def test_conflict_when_stock_keeps_changing(self):
+        user, items = self.cart(2)
+        with mock.patch.object(checkout, '_decrement_stock', return_value=0):
+            with self.assertRaises(CheckoutConflict):
+                place_order(user, items, {})
+        self.assertFalse(Order.objects.filter(user=user).exists())
+
+
+class CheckoutReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Hold probe', description='x', price=Decimal('40'), stock_quantity=2, image='products/test.jpg',
+        )
+        cls.user = get_user_model().objects.create_user('hold-shopper')
+        Cart.objects.create(user=cls.user, product=cls.product, quantity=2)
+
+    def setUp(self):
+        self.addCleanup(use_store, reservations.store)
+        use_store(LocalCounterStore())
+        self.client.force_login(self.user)
+
+    def test_opening_checkout_holds_nothing(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('shop:checkout')).status_code, 200)
+        self.assertEqual(held_quantity(self.product.pk), 0)
+        self.assertIsNone(reservations.current_hold(self.user, Cart.objects.filter(user=self.user)))
+
+    def test_submit_is_turned_back_by_other_holds(self):
+        rival = get_user_model().objects.create_user('hold-rival')
+        reserve_cart(rival, [Cart(user=rival, product=self.product, quantity=1)])
+        response = self.client.post(reverse('shop:checkout'), {'first_name': 'Hold', 'last_name': 'Probe'})
+        self.assertRedirects(response, reverse('shop:cart_view'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.filter(user=self.user).exists())
+
+    def test_submit_places_the_order_and_releases_the_hold(self):
+        self.client.post(reverse('shop:checkout'), {'first_name': 'Hold', 'last_name': 'Probe'})
+        self.assertTrue(Order.objects.filter(user=self.user).exists())
+        self.assertEqual(held_quantity(self.product.pk), 0)
+
+
+class ReservationStressTests(TestCase):
+    """Hundreds of buyers racing for a few units through the reservation counters"""
+
+    BUYERS = 300
+    UNITS = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Launch edition', description='Flash sale', price=Decimal('999'),
+            stock_quantity=cls.UNITS, image='products/test.jpg',
+        )
+        User = get_user_model()
+        User.objects.bulk_create([User(username=f'buyer-{i}') for i in range(cls.BUYERS)])
+        cls.buyers = list(User.objects.filter(username__startswith='buyer-'))
+
+    def setUp(self):
+        self.addCleanup(use_store, reservations.store)
+        use_store(LocalCounterStore())
+
+    def race(self):
+        """Every buyer enters checkout at once with one unit; returns the buyers holding one"""
+        start = threading.Barrier(50)
+
+        def enter_checkout(buyer):
+            cart_item = Cart(pk=buyer.pk, user=buyer, product=self.product, quantity=1)
+            try:
+                start.wait(timeout=5)
+            except threading.BrokenBarrierError:
+                pass  # the last few buyers start without a full barrier
+            try:
+                reserve_cart(buyer, [cart_item])
+                return buyer
+            except ReservationFailed:
+                return None
+
+        with ThreadPoolExecutor(max_workers=50) as pool:
+            return [buyer for buyer in pool.map(enter_checkout, self.buyers) if buyer]
+
+    def test_no_overselling(self):
+        winners = self.race()
+        self.assertLessEqual(len(winners), self.UNITS)
+        self.assertEqual(held_quantity(self.product.pk), len(winners))
+
+        # Buyers turned away while counters briefly overshot can still get the rest
+        for buyer in self.buyers:
+            if held_quantity(self.product.pk) == self.UNITS:
+                break
+            if buyer not in winners:
+                try:
+                    reserve_cart(buyer, [Cart(pk=buyer.pk, user=buyer, product=self.product, quantity=1)])
+                    winners.append(buyer)
+                except ReservationFailed:
+                    pass
+        self.assertEqual(len(winners), self.UNITS)
+        self.assertEqual(held_quantity(self.product.pk), self.UNITS)
+
+    def test_holds_are_released_after_orders(self):
+        winners = self.race()
+        for buyer in winners:
+            Cart.objects.create(user=buyer, product=self.product, quantity=1)
+            cart_items = list(Cart.objects.filter(user=buyer).select_related('product'))
+            place_order(buyer, cart_items, {})
+            release_hold(buyer)
+        self.assertEqual(held_quantity(self.product.pk), 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, self.UNITS - len(winners))
+        self.assertEqual(Order.objects.filter(user__in=winners).count(), len(winners))
+
+    def test_abandoned_holds_expire(self):
+        winners = self.race()
+        self.assertTrue(winners)
+        later = time.time() + reservations.HOLD_TTL + 2 * reservations.BUCKET_SECONDS
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(held_quantity(self.product.pk), 0)
+            buyer = next(buyer for buyer in self.buyers if buyer not in winners)
+            hold = reserve_cart(buyer, [Cart(pk=buyer.pk, user=buyer, product=self.product, quantity=self.UNITS)])
+        self.assertEqual(hold['items'], {self.product.pk: self.UNITS})
+
+
+class CartQuantityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('cart-owner', password='secret-pass-1')
+        cls.product = Product.objects.create(
+            name='Cable', description='Cable', price=Decimal('10'), stock_quantity=5, image='products/test.jpg',
+        )
+
+    def setUp(self):
+        self.line = Cart.objects.create(user=self.user, product=self.product, quantity=2)
+        self.client.force_login(self.user)
+
+    def batch(self, operation):
+        return self.client.post(
+            reverse('shop:ajax_cart_batch'), json.dumps({'operations': {str(self.line.pk): operation}}),
+            content_type='application/json',
+        )
+
+    def test_batch_rejects_out_of_range_values(self):
+        for operation in ({'quantity': 10 ** 12}, {'quantity': -1}, {'delta': 10 ** 12}, {'delta': -10 ** 12}):
+            with self.subTest(operation=operation):
+                response = self.batch(operation)
+                self.assertEqual(response.status_code, 400)
+        self.line.refresh_from_db()
+        self.assertEqual(self.line.quantity, 2)
+
+    def test_oversized_batch_is_rejected_before_parsing(self):
+        operations = {str(i): {'quantity': 'not a number'} for i in range(MAX_CART_OPERATIONS + 1)}
+        with mock.patch('shop.views.apply_cart_operations') as apply:
+            response = self.client.post(
+                reverse('shop:ajax_cart_batch'), json.dumps({'operations': operations}), content_type='application/json',
+            )
+        self.assertEqual((response.status_code, response.json()['error']), (400, 'Too many operations'))
+        apply.assert_not_called()
+
+    def test_batch_accepts_the_maximum(self):
+        response = self.batch({'quantity': MAX_LINE_QUANTITY})
+        self.assertEqual(response.json()['items'][0]['quantity'], MAX_LINE_QUANTITY)
+
+    def test_deltas_stop_at_the_maximum(self):
+        apply_cart_operations(self.user, quantities={self.line.pk: MAX_LINE_QUANTITY - 1})
+        lines, _removed, _summary = apply_cart_operations(self.user, deltas={self.line.pk: MAX_LINE_QUANTITY})
+        self.assertEqual(lines[0].quantity, MAX_LINE_QUANTITY)
+
+    def test_merge_adds_to_a_line_inserted_concurrently(self):
+        rival_product = Product.objects.create(
+            name='Adapter', description='Adapter', price=Decimal('4'), stock_quantity=9, image='products/test.jpg',
+        )
+        atomic, blocks = transaction.atomic, []
+
+        def racing_atomic(*args, **kwargs):
+            blocks.append(args)
+            if len(blocks) == 2:
+                # Another request adds the same product between the lookup and the INSERT's savepoint
+                Cart.objects.create(user=self.user, product=rival_product, quantity=3)
+            return atomic(*args, **kwargs)
+
+        with mock.patch('shop.cart.transaction.atomic', side_effect=racing_atomic):
+            merge_into_cart(self.user, {rival_product.pk: 2, self.product.pk: 1})
+        self.assertEqual(dict(Cart.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+                         {rival_product.pk: 5, self.product.pk: 3})
+
+    def test_update_cart_clamps_and_ignores_garbage(self):
+        url = reverse('shop:update_cart', args=[self.line.pk])
+        self.assertEqual(self.client.post(url, {'quantity': 'lots'}).status_code, 302)
+        self.client.post(url, {'quantity': str(10 ** 12)})
+        self.line.refresh_from_db()
+        self.assertEqual(self.line.quantity, MAX_LINE_QUANTITY)
+
+
+class GuestCartQuantityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('returning-shopper', password='secret-pass-1')
+        cls.product = Product.objects.create(
+            name='Adapter', description='Adapter', price=Decimal('10'), stock_quantity=5, image='products/test.jpg',
+        )
+
+    def guest_quantity(self):
+        return self.client.session.get(GUEST_CART_SESSION_KEY, {}).get(str(self.product.pk))
+
+    def test_update_clamps_the_session_quantity(self):
+        url = reverse('shop:guest_cart_update', args=[self.product.pk])
+        self.client.post(url, {'delta': str(10 ** 12)})
+        self.assertEqual(self.guest_quantity(), MAX_LINE_QUANTITY)
+        self.client.post(url, {'delta': '5'})
+        self.assertEqual(self.guest_quantity(), MAX_LINE_QUANTITY)
+
+    def test_update_of_an_unknown_product_is_404(self):
+        response = self.client.post(reverse('shop:guest_cart_update', args=[10 ** 9]), {'delta': '1'})
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(self.client.session.get(GUEST_CART_SESSION_KEY))
+
+    def test_login_merges_within_the_maximum(self):
+        Cart.objects.create(user=self.user, product=self.product, quantity=MAX_LINE_QUANTITY - 1)
+        session = self.client.session
+        session[GUEST_CART_SESSION_KEY] = {str(self.product.pk): 10 ** 12}  # stored before the cap
+        session.save()
+        response = self.client.post(
+            reverse('accounts:login'), {'username': 'returning-shopper', 'password': 'secret-pass-1'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Cart.objects.get(user=self.user, product=self.product).quantity, MAX_LINE_QUANTITY)
+
+    def test_merge_clamps_new_lines(self):
+        merge_into_cart(self.user, {self.product.pk: 10 ** 12})
+        self.assertEqual(Cart.objects.get(user=self.user, product=self.product).quantity, MAX_LINE_QUANTITY)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every shop, accounts and custom-admin view, as each kind of user it
+    serves, against seeded data with cold caches: it must have a budget in
+    shop.querybudget, stay within it and not repeat a statement like an
+    N+1. The POST cases cover sign-in and sign-up, with and without a guest
+    cart to merge, and the cart, checkout and admin form submissions.
+    """
+    # More rows than N_PLUS_ONE_THRESHOLD, so a lookup per row in any list shows up
+    SAMPLE_SIZE = 12
+    URL_MODULES = (('shop', shop_urls), ('accounts', accounts.urls), ('customadmin', customadmin.urls))
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.staff = User.objects.create_user('budget-staff', is_staff=True)
+        cls.customer = User.objects.create_user('budget-customer')
+        cls.buyer = User.objects.create_user('budget-buyer')
+        cls.shopper = User.objects.create_user('budget-shopper', password='budget-pass-1')
+        categories = Category.objects.bulk_create([
+            Category(name=f'Budget category {i}') for i in range(cls.SAMPLE_SIZE)
+        ])
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Budget product {i}', description='Query budget sample', price=Decimal(100 + i),
+                stock_quantity=(i % 3) * 5, image='products/budget.jpg', category=categories[i],
+            )
+            for i in range(cls.SAMPLE_SIZE)
+        ])
+        cls.cart = Cart.objects.bulk_create([Cart(user=cls.customer, product=p, quantity=2) for p in products])
+        Cart.objects.bulk_create([Cart(user=cls.buyer, product=p, quantity=1) for p in products if p.stock_quantity])
+        # Half of a guest cart of every product merges into existing lines, half inserts
+        Cart.objects.bulk_create([Cart(user=cls.shopper, product=p, quantity=1) for p in products[::2]])
+        cls.guest_cart = [p.pk for p in products]
+        wishlist = Wishlist.objects.bulk_create([Wishlist(user=cls.customer, product=p) for p in products])
+        cls.orders = Order.objects.bulk_create([
+            Order(
+                user=cls.customer, first_name='Budget', last_name='Customer', email='budget@example.com', phone='0',
+                city='City', state='State', postal_code='000000', total_amount=Decimal(200 * cls.SAMPLE_SIZE),
+            )
+            for _ in range(cls.SAMPLE_SIZE)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=2, price=product.price)
+            for order in cls.orders for product in products
+        ])
+        AdminLog.objects.bulk_create([
+            AdminLog(user=cls.staff, action='updated', model='Product', record_id=p.pk) for p in products
+        ])
+        cls.samples = {
+            'product': products[0].pk,
+            'category': categories[0].pk,
+            'order': cls.orders[0].pk,
+            'cart_item_id': cls.cart[0].pk,
+            'wishlist_item_id': wishlist[0].pk,
+            'job_id': 'unknown',
+        }
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def url(self, view_name, params):
+        kwargs = {}
+        for param in params:
+            if param == 'pk':
+                kwargs[param] = self.samples[next(kind for kind in ('category', 'order', 'product') if kind in view_name)]
+            else:
+                kwargs[param] = self.samples[param.removesuffix('_id') if param in ('product_id', 'order_id') else param]
+        return reverse(view_name, kwargs=kwargs)
+
+    def assertWithinBudget(self, view_name, user, method='get', path=None, guest_cart=(), **request):
+        if user is None:
+            self.client.logout()
+            for product_id in guest_cart:
+                self.client.post(reverse('shop:guest_cart_update', args=[product_id]))
+        else:
+            self.client.force_login(user)
+        cache.clear()
+        shapes = QueryCounter()
+        savepoint = transaction.savepoint()
+        try:
+            with CaptureQueriesContext(connection) as queries, connection.execute_wrapper(shapes):
+                response = getattr(self.client, method)(path or reverse(view_name), **request)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        finally:
+            transaction.savepoint_rollback(savepoint)
+
+        self.assertLess(response.status_code, 500)
+        if is_unbounded(view_name):
+            return response
+        budget = query_budget(view_name, method.upper())
+        statements = '\n'.join(query['sql'][:300] for query in queries.captured_queries)
+        self.assertIsNotNone(budget, f"no budget declared ({len(queries)} queries)")
+        self.assertLessEqual(len(queries), budget, f"over its budget of {budget}:\n{statements}")
+        self.assertEqual(shapes.repeated(N_PLUS_ONE_THRESHOLD), [], "same query repeated like an N+1")
+        return response
+
+    def test_every_view_is_within_budget(self):
+        for namespace, module in self.URL_MODULES:
+            users = [('staff', self.staff)] if namespace == 'customadmin' else [
+                ('anonymous', None), ('customer', self.customer),
+            ]
+            for pattern in module.urlpatterns:
+                view_name = f'{namespace}:{pattern.name}'
+                path = self.url(view_name, pattern.pattern.converters)
+                for label, user in users:
+                    with self.subTest(view=view_name, user=label):
+                        self.assertWithinBudget(view_name, user, path=path)
+
+    def test_form_submissions_are_within_budget(self):
+        cart_item = {'cart_item_id': self.cart[0].pk}
+        product = {'product_id': self.samples['product']}
+        order_details = {'first_name': 'Budget', 'last_name': 'Buyer', 'email': 'buyer@example.com', 'phone': '0',
+                         'address_line_1': 'Street 1', 'city': 'City', 'state': 'State', 'postal_code': '000000'}
+        batch = {str(item.pk): {'delta': 1} for item in self.cart}
+        upload = b'name,description,price,stock_quantity,image\nBudget product 1,Updated,120,4,\n'
+        sign_in = {'username': 'budget-shopper', 'password': 'budget-pass-1'}
+        sign_up = {'username': 'budget-newcomer', 'email': 'newcomer@example.com',
+                   'password1': 'budget-pass-2', 'password2': 'budget-pass-2'}
+        cases = [
+            ('accounts:login', 'anonymous', {}, {'data': sign_in}),
+            ('accounts:login', 'guest', {}, {'data': sign_in}),
+            ('accounts:register', 'anonymous', {}, {'data': sign_up}),
+            ('accounts:register', 'guest', {}, {'data': sign_up}),
+            ('shop:guest_cart_update', 'anonymous', product, {'data': {'delta': 2}}),
+            ('shop:update_cart', 'customer', cart_item, {'data': {'quantity': 3}}),
+            ('shop:increase_quantity', 'customer', cart_item, {}),
+            ('shop:decrease_quantity', 'customer', cart_item, {}),
+            ('shop:ajax_increase_quantity', 'customer', cart_item, {}),
+            ('shop:ajax_decrease_quantity', 'customer', cart_item, {}),
+            ('shop:ajax_cart_batch', 'customer', {}, {
+                'data': json.dumps({'operations': batch}), 'content_type': 'application/json'}),
+            ('shop:checkout', 'buyer', {}, {'data': order_details}),
+            ('shop:add_to_wishlist', 'buyer', product, {}),
+            ('customadmin:product_import', 'staff', {}, {
+                'data': {'file': ContentFile(upload, name='products.csv')}}),
+            ('customadmin:product_delete', 'staff', {'pk': self.samples['product']}, {}),
+            ('customadmin:category_create', 'staff', {}, {'data': {'name': 'Budget new category'}}),
+            ('customadmin:category_delete', 'staff', {'pk': self.samples['category']}, {}),
+            ('customadmin:order_update_status', 'staff', {'pk': self.samples['order']}, {
+                'data': {'status': 'processing'}}),
+            ('customadmin:order_bulk_status', 'staff', {}, {
+                'data': {'status': 'processing', 'orders': [order.pk for order in self.orders]}}),
+        ]
+        # A guest is an anonymous shopper with every sample product in the session cart
+        users = {'anonymous': None, 'guest': None, 'customer': self.customer, 'buyer': self.buyer, 'staff': self.staff}
+        for view_name, label, kwargs, request in cases:
+            request.setdefault('data', {})
+            if label == 'guest':
+                request['guest_cart'] = self.guest_cart
+            with self.subTest(view=view_name, user=label), mock.patch('customadmin.imports._executor'):
+                response = self.assertWithinBudget(
+                    view_name, users[label], method='post', path=reverse(view_name, kwargs=kwargs), **request
+                )
+                if view_name.startswith('accounts:'):
+                    # A rejected form would only measure the cheaper re-render
+                    self.assertEqual(response.status_code, 302)
+
+
+class PerfMiddlewareTests(TestCase):
+    def test_streamed_body_is_profiled(self):
+        self.client.force_login(get_user_model().objects.create_user('perf-staff', is_staff=True))
+        with mock.patch('shop.middleware.record_request') as record:
+            response = self.client.get(reverse('customadmin:order_export'))
+            record.assert_not_called()
+            b''.join(response.streaming_content)
+        record.assert_called_once()
+        view_queries = int(response['Server-Timing'].split('desc="')[1].split(' queries')[0])
+        profile = record.call_args.args[2]
+        self.assertGreater(profile.sql_count, view_queries)
+        self.assertTrue(any('shop_order' in sql for sql in profile.sql))
+
+
+class MetricsViewTests(TestCase):
+    def test_token_is_required_when_set(self):
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(reverse('shop:metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+            self.assertEqual(self.client.get(reverse('shop:metrics'), HTTP_AUTHORIZATION='Bearer é').status_code, 401)
+            response = self.client.get(reverse('shop:metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertIn(response.status_code, (200, 503))
+
+    def test_only_staff_without_token(self):
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(reverse('shop:metrics')).status_code, 403)
+            self.client.force_login(get_user_model().objects.create_user('metrics-customer'))
+            self.assertEqual(self.client.get(reverse('shop:metrics')).status_code, 403)
+            self.client.force_login(get_user_model().objects.create_user('metrics-staff', is_staff=True))
+            self.assertIn(self.client.get(reverse('shop:metrics')).status_code, (200, 503))
+
+    @skipUnless(metrics.enabled(), "prometheus_client is not installed")
+    def test_unknown_methods_share_one_series(self):
+        def methods():
+            return {
+                sample.labels['method']
+                for metric in metrics.REQUEST_DURATION.collect() for sample in metric.samples
+                if sample.name.endswith('_count') and sample.labels['view'] == 'shop:home'
+            }
+
+        self.client.get(reverse('shop:home'))
+        for method in ('FOOBAR', 'PROPFIND', 'X' * 40):
+            self.client.generic(method, reverse('shop:home'))
+        self.assertIn('other', methods())
+        self.assertLessEqual(methods(), metrics.REQUEST_METHODS | {'other'})
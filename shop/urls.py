@@ -5,12 +5,20 @@ app_name = 'shop'
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('catalog/', views.catalog_page, name='catalog_page'),
     path('product/<int:pk>/', views.product_detail, name='product_detail'),
+
+    # Search URLs
+    path('search/', views.search, name='search'),
+    path('api/search/', views.search_api, name='search_api'),
+    path('api/autocomplete/', views.autocomplete, name='autocomplete'),
     
     # Cart URLs
     path('cart/', views.cart_view, name='cart_view'),
     path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:cart_item_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/guest/<int:product_id>/update/', views.guest_cart_update, name='guest_cart_update'),
+    path('cart/guest/<int:product_id>/remove/', views.guest_cart_remove, name='guest_cart_remove'),
     path('cart/update/<int:cart_item_id>/', views.update_cart, name='update_cart'),  # Keep for backward compatibility
     
     # New plus/minus quantity controls
@@ -20,6 +28,7 @@ urlpatterns = [
     # Optional AJAX URLs for better UX
     path('cart/ajax/increase/<int:cart_item_id>/', views.ajax_increase_quantity, name='ajax_increase_quantity'),
     path('cart/ajax/decrease/<int:cart_item_id>/', views.ajax_decrease_quantity, name='ajax_decrease_quantity'),
+    path('cart/ajax/batch/', views.ajax_cart_batch, name='ajax_cart_batch'),
     
     # Wishlist URLs
     path('wishlist/', views.wishlist_view, name='wishlist_view'),
@@ -32,4 +41,7 @@ urlpatterns = [
 
     path('about/', views.about_us, name='about_us'),
     path('contact/', views.contact, name='contact'),
+
+    # Prometheus scrape endpoint
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,29 +1,127 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.db.models import Prefetch
 from .models import Product, Category, Cart, Wishlist, Order, OrderItem
 from django.contrib import messages
 from .forms import CheckoutForm
-from django.http import JsonResponse
+from .catalog import CATALOG_PAGE_SIZE, catalog_facets, catalog_filters, catalog_queryset
+from .pagination import InvalidCursor, keyset_page
+from .search import MAX_SEARCH_PAGE, search_products
+from .autocomplete import prefix_index
+from .checkout import InsufficientStock, place_order
+from .cart import MAX_LINE_QUANTITY, apply_cart_operations, cart_summary, merge_into_cart
+from .guest_cart import add_to_guest_cart, guest_cart_quantities, remove_from_guest_cart
+from .reservations import ReservationFailed, release_hold, reserve_cart
+from .category_cache import get_categories
+from .conditional import home_etag, home_last_modified, product_etag, product_last_modified
+from django.views.decorators.http import condition
+from .shopper import invalidate_shopper_state
+from . import metrics as shop_metrics
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from urllib.parse import urlencode
+import hmac
+import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+def _catalog_next_url(filters, next_cursor):
+    if not next_cursor:
+        return None
+    return f"{reverse('shop:catalog_page')}?{urlencode({**filters, 'cursor': next_cursor})}"
+
+@condition(etag_func=home_etag, last_modified_func=home_last_modified)
 def home(request):
-    products = Product.objects.filter(stock_quantity__gt=0)
-    categories = Category.objects.all()
+    filters = catalog_filters(request.GET)
+    products, next_cursor = keyset_page(catalog_queryset(filters), page_size=CATALOG_PAGE_SIZE)
+    categories = get_categories()
     return render(request, 'shop/home.html', {
         'products': products,
-        'categories': categories
+        'categories': categories,
+        'facets': catalog_facets(filters, categories),
+        'filters': filters,
+        'next_url': _catalog_next_url(filters, next_cursor),
+    })
+
+def catalog_page(request):
+    """JSON endpoint behind the home page infinite scroll"""
+    filters = catalog_filters(request.GET)
+    try:
+        products, next_cursor = keyset_page(
+            catalog_queryset(filters),
+            cursor=request.GET.get('cursor'),
+            page_size=CATALOG_PAGE_SIZE,
+        )
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+
+    html = render_to_string('shop/includes/product_cards.html', {'products': products}, request=request)
+    return JsonResponse({
+        'success': True,
+        'html': html,
+        'count': len(products),
+        'next_url': _catalog_next_url(filters, next_cursor),
+    })
+
+def _search_params(request):
+    query = request.GET.get('q', '').strip()
+    page = request.GET.get('page', '')
+    # isdecimal(), not isdigit(): int() rejects superscripts and the like
+    page = int(page) if page.isdecimal() else 1
+    return query, min(max(page, 1), MAX_SEARCH_PAGE)
+
+def search(request):
+    query, page = _search_params(request)
+    products, has_next = search_products(query, page=page)
+    return render(request, 'shop/search.html', {
+        'query': query,
+        'products': products,
+        'page': page,
+        'has_next': has_next,
+    })
+
+def search_api(request):
+    """JSON variant of the search page for client-side consumers"""
+    query, page = _search_params(request)
+    products, has_next = search_products(query, page=page)
+    return JsonResponse({
+        'success': True,
+        'query': query,
+        'page': page,
+        'has_next': has_next,
+        'results': [
+            {
+                'id': product.pk,
+                'name': product.name,
+                'price': float(product.price),
+                'in_stock': product.stock_quantity > 0,
+                'image': product.image.url if product.image else None,
+                'url': reverse('shop:product_detail', args=[product.pk]),
+            }
+            for product in products
+        ],
     })
 
+def autocomplete(request):
+    """Search-as-you-type suggestions, answered from the in-process prefix index"""
+    suggestions = []
+    for kind, pk, label in prefix_index.complete(request.GET.get('q', '')):
+        if kind == 'category':
+            url = f"{reverse('shop:home')}?category={pk}"
+        else:
+            url = reverse('shop:product_detail', args=[pk])
+        suggestions.append({'type': kind, 'id': pk, 'label': label, 'url': url})
+    return JsonResponse({'success': True, 'suggestions': suggestions})
+
+@condition(etag_func=product_etag, last_modified_func=product_last_modified)
 def product_detail(request, pk):
     product = get_object_or_404(Product, pk=pk)
-    in_cart = False
-    in_wishlist = False
-    
-    if request.user.is_authenticated:
-        in_cart = Cart.objects.filter(user=request.user, product=product).exists()
-        in_wishlist = Wishlist.objects.filter(user=request.user, product=product).exists()
+    in_cart = product.pk in request.shopper.cart_ids
+    in_wishlist = product.pk in request.shopper.wishlist_ids
     
     return render(request, 'shop/product_detail.html', {
         'product': product,
@@ -31,25 +129,48 @@ def product_detail(request, pk):
         'in_wishlist': in_wishlist
     })
 
-@login_required
 def add_to_cart(request, product_id):
     product = get_object_or_404(Product, pk=product_id)
-    cart_item, created = Cart.objects.get_or_create(
-        user=request.user,
-        product=product,
-        defaults={'quantity': 1}
-    )
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
+    if request.user.is_authenticated:
+        merge_into_cart(request.user, {product.pk: 1})
+    elif not add_to_guest_cart(request, product.pk):
+        messages.error(request, 'Your cart is full. Please log in to add more items.')
+        return redirect('shop:cart_view')
+    shop_metrics.record_cart_mutation(request, 'add')
+    invalidate_shopper_state(request)
     messages.success(request, f'{product.name} added to cart!')
     return redirect('shop:cart_view')
 
+def guest_cart_update(request, product_id):
+    """Quantity +/- for the session cart of a shopper who has not logged in"""
+    if request.method == 'POST':
+        get_object_or_404(Product.objects.only('pk'), pk=product_id)
+        try:
+            delta = int(request.POST.get('delta', 1))
+        except ValueError:
+            delta = 0
+        delta = max(min(delta, MAX_LINE_QUANTITY), -MAX_LINE_QUANTITY)
+        if delta:
+            if not add_to_guest_cart(request, product_id, delta):
+                messages.info(request, 'Item removed from cart')
+            shop_metrics.record_cart_mutation(request, 'quantity')
+        invalidate_shopper_state(request)
+    return redirect('shop:cart_view')
+
+def guest_cart_remove(request, product_id):
+    remove_from_guest_cart(request, product_id)
+    shop_metrics.record_cart_mutation(request, 'remove')
+    invalidate_shopper_state(request)
+    messages.success(request, 'Item removed from cart!')
+    return redirect('shop:cart_view')
+
 @login_required
 def remove_from_cart(request, cart_item_id):
     cart_item = get_object_or_404(Cart, pk=cart_item_id, user=request.user)
     product_name = cart_item.product.name
     cart_item.delete()
+    shop_metrics.record_cart_mutation(request, 'remove')
+    invalidate_shopper_state(request)
     messages.success(request, f'{product_name} removed from cart!')
     return redirect('shop:cart_view')
 
@@ -57,9 +178,10 @@ def remove_from_cart(request, cart_item_id):
 def increase_quantity(request, cart_item_id):
     """Increase the quantity of a cart item by 1"""
     if request.method == 'POST':
-        cart_item = get_object_or_404(Cart, pk=cart_item_id, user=request.user)
-        cart_item.quantity += 1
-        cart_item.save()
+        cart_item = get_object_or_404(Cart.objects.select_related('product'), pk=cart_item_id, user=request.user)
+        apply_cart_operations(request.user, deltas={cart_item.pk: 1})
+        shop_metrics.record_cart_mutation(request, 'quantity')
+        invalidate_shopper_state(request)
         messages.success(request, f'Quantity updated for {cart_item.product.name}')
     return redirect('shop:cart_view')
 
@@ -67,17 +189,15 @@ def increase_quantity(request, cart_item_id):
 def decrease_quantity(request, cart_item_id):
     """Decrease the quantity of a cart item by 1, remove if quantity becomes 0"""
     if request.method == 'POST':
-        cart_item = get_object_or_404(Cart, pk=cart_item_id, user=request.user)
-        
-        if cart_item.quantity > 1:
-            cart_item.quantity -= 1
-            cart_item.save()
-            messages.success(request, f'Quantity updated for {cart_item.product.name}')
+        cart_item = get_object_or_404(Cart.objects.select_related('product'), pk=cart_item_id, user=request.user)
+        # Removes the item when quantity becomes 0
+        _lines, removed, _summary = apply_cart_operations(request.user, deltas={cart_item.pk: -1})
+        shop_metrics.record_cart_mutation(request, 'quantity')
+        if removed:
+            messages.info(request, f'{cart_item.product.name} removed from cart')
         else:
-            # Remove item when quantity becomes 0
-            product_name = cart_item.product.name
-            cart_item.delete()
-            messages.info(request, f'{product_name} removed from cart')
+            messages.success(request, f'Quantity updated for {cart_item.product.name}')
+        invalidate_shopper_state(request)
     
     return redirect('shop:cart_view')
 
@@ -86,85 +206,135 @@ def decrease_quantity(request, cart_item_id):
 def update_cart(request, cart_item_id):
     cart_item = get_object_or_404(Cart, pk=cart_item_id, user=request.user)
     if request.method == 'POST':
-        quantity = int(request.POST.get('quantity', 1))
-        if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
-        else:
-            cart_item.delete()
+        try:
+            quantity = int(request.POST.get('quantity', 1))
+        except ValueError:
+            return redirect('shop:cart_view')
+        apply_cart_operations(request.user, quantities={cart_item.pk: quantity})
+        shop_metrics.record_cart_mutation(request, 'quantity')
+        invalidate_shopper_state(request)
     return redirect('shop:cart_view')
 
-@login_required
+def _guest_cart_lines(request):
+    quantities = guest_cart_quantities(request)
+    products = Product.objects.filter(pk__in=quantities).select_related('category')
+    return [Cart(id=product.pk, product=product, quantity=quantities[product.pk]) for product in products]
+
 def cart_view(request):
-    cart_items = Cart.objects.filter(user=request.user).select_related('product')
+    if request.user.is_authenticated:
+        cart_items = Cart.objects.filter(user=request.user).select_related('product__category')
+    else:
+        cart_items = _guest_cart_lines(request)
     # Calculate line totals for each item
     for item in cart_items:
         item.line_total = item.product.price * item.quantity
     total = sum(item.line_total for item in cart_items)
     return render(request, 'shop/cart.html', {
         'cart_items': cart_items,
-        'total': total
+        'total': total,
+        'guest': not request.user.is_authenticated,
     })
 
 # AJAX versions for better user experience (optional)
+def _cart_state_response(lines, removed, summary):
+    return JsonResponse({
+        'success': True,
+        'items': [
+            {
+                'id': line.pk,
+                'quantity': line.quantity,
+                'line_total': float(line.quantity * line.product.price),
+            }
+            for line in lines
+        ],
+        'removed': removed,
+        'cart_total': float(summary['subtotal']),
+        'item_count': summary['item_count'],
+    })
+
+def _ajax_step(request, cart_item_id, delta):
+    cart_item = get_object_or_404(Cart, pk=cart_item_id, user=request.user)
+    lines, removed, summary = apply_cart_operations(request.user, deltas={cart_item.pk: delta})
+    shop_metrics.record_cart_mutation(request, 'quantity')
+    invalidate_shopper_state(request)
+
+    if removed:
+        return JsonResponse({
+            'success': True,
+            'removed': True,
+            'cart_total': float(summary['subtotal']),
+            'item_count': summary['item_count']
+        })
+    line = lines[0]
+    return JsonResponse({
+        'success': True,
+        'new_quantity': line.quantity,
+        'line_total': float(line.quantity * line.product.price),
+        'cart_total': float(summary['subtotal']),
+        'item_count': summary['item_count'],
+        'removed': False
+    })
+
 @login_required
 def ajax_increase_quantity(request, cart_item_id):
     """AJAX version to increase quantity without page reload"""
     if request.method == 'POST':
-        cart_item = get_object_or_404(Cart, pk=cart_item_id, user=request.user)
-        cart_item.quantity += 1
-        cart_item.save()
-        
-        # Calculate new totals
-        line_total = cart_item.quantity * cart_item.product.price
-        cart_total = sum(item.quantity * item.product.price for item in Cart.objects.filter(user=request.user))
-        
-        return JsonResponse({
-            'success': True,
-            'new_quantity': cart_item.quantity,
-            'line_total': float(line_total),
-            'cart_total': float(cart_total)
-        })
+        return _ajax_step(request, cart_item_id, 1)
     return JsonResponse({'success': False})
 
 @login_required
 def ajax_decrease_quantity(request, cart_item_id):
     """AJAX version to decrease quantity without page reload"""
     if request.method == 'POST':
-        cart_item = get_object_or_404(Cart, pk=cart_item_id, user=request.user)
-        
-        if cart_item.quantity > 1:
-            cart_item.quantity -= 1
-            cart_item.save()
-            
-            line_total = cart_item.quantity * cart_item.product.price
-            cart_total = sum(item.quantity * item.product.price for item in Cart.objects.filter(user=request.user))
-            
-            return JsonResponse({
-                'success': True,
-                'new_quantity': cart_item.quantity,
-                'line_total': float(line_total),
-                'cart_total': float(cart_total),
-                'removed': False
-            })
-        else:
-            # Remove item when quantity becomes 0
-            cart_item.delete()
-            cart_total = sum(item.quantity * item.product.price for item in Cart.objects.filter(user=request.user))
-            
-            return JsonResponse({
-                'success': True,
-                'removed': True,
-                'cart_total': float(cart_total)
-            })
-    
+        # Removes the item when quantity becomes 0
+        return _ajax_step(request, cart_item_id, -1)
     return JsonResponse({'success': False})
 
+MAX_CART_OPERATIONS = 100
+
+@login_required
+def ajax_cart_batch(request):
+    """
+    Apply several quantity changes in one atomic call. The body is JSON:
+
+        {"operations": {"<cart_item_id>": {"delta": -1}, "<cart_item_id>": {"quantity": 3}}}
+
+    Quantities must lie in 0..MAX_LINE_QUANTITY and deltas within
+    +/-MAX_LINE_QUANTITY; a line never goes above the maximum. The
+    response carries the new quantity and line total of every touched
+    line, the removed line ids and the cart totals.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'POST required'}, status=405)
+    try:
+        operations = json.loads(request.body)['operations']
+        # Turn oversized batches away before parsing any of them
+        if len(operations) > MAX_CART_OPERATIONS:
+            return JsonResponse({'success': False, 'error': 'Too many operations'}, status=400)
+        deltas, quantities = {}, {}
+        for item_id, operation in operations.items():
+            if 'quantity' in operation:
+                quantities[int(item_id)] = int(operation['quantity'])
+            else:
+                deltas[int(item_id)] = int(operation['delta'])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid operations'}, status=400)
+    if any(not 0 <= quantity <= MAX_LINE_QUANTITY for quantity in quantities.values()) or any(
+        abs(delta) > MAX_LINE_QUANTITY for delta in deltas.values()
+    ):
+        return JsonResponse({'success': False, 'error': 'Quantity out of range'}, status=400)
+
+    lines, removed, summary = apply_cart_operations(request.user, deltas=deltas, quantities=quantities)
+    shop_metrics.record_cart_mutation(request, 'quantity', len(operations))
+    invalidate_shopper_state(request)
+    return _cart_state_response(lines, removed, summary)
+
 @login_required
 def add_to_wishlist(request, product_id):
     product = get_object_or_404(Product, pk=product_id)
     wishlist_item, created = Wishlist.objects.get_or_create(user=request.user, product=product)
     if created:
+        invalidate_shopper_state(request)
         messages.success(request, f'{product.name} added to wishlist!')
     else:
         messages.info(request, f'{product.name} is already in your wishlist!')
@@ -175,6 +345,7 @@ def remove_from_wishlist(request, wishlist_item_id):
     wishlist_item = get_object_or_404(Wishlist, pk=wishlist_item_id, user=request.user)
     product_name = wishlist_item.product.name
     wishlist_item.delete()
+    invalidate_shopper_state(request)
     messages.success(request, f'{product_name} removed from wishlist!')
     return redirect('shop:wishlist_view')
 
@@ -185,82 +356,60 @@ def wishlist_view(request):
 
 @login_required
 def checkout(request):
-    logger.info(f"Checkout view called by user: {request.user.username}")
+    started = time.perf_counter()
+    # One query for the cart; .exists() followed by iteration would cost two
+    cart_items = list(Cart.objects.filter(user=request.user).select_related('product'))
     
-    # Get cart items
-    cart_items = Cart.objects.filter(user=request.user).select_related('product')
-    
-    if not cart_items.exists():
+    if not cart_items:
         messages.warning(request, "Your cart is empty!")
         return redirect('shop:cart_view')
     
     # Calculate total
     total = sum(item.product.price * item.quantity for item in cart_items)
-    logger.info(f"Cart total: {total}")
-    
+
     if request.method == 'POST':
-        logger.info("Processing POST request for checkout")
-        
+        # Hold the stock only once the shopper submits, so reloading or
+        # prefetching the form takes nothing from other shoppers
         try:
-            # Create order directly from POST data instead of using form
-            order = Order.objects.create(
-                user=request.user,
-                first_name=request.POST.get('first_name', ''),
-                last_name=request.POST.get('last_name', ''),
-                email=request.POST.get('email', ''),
-                phone=request.POST.get('phone', ''),
-                address_line_1=request.POST.get('address_line_1', ''),
-                address_line_2=request.POST.get('address_line_2', ''),
-                city=request.POST.get('city', ''),
-                state=request.POST.get('state', ''),
-                postal_code=request.POST.get('postal_code', ''),
-                country=request.POST.get('country', ''),
-                special_instructions=request.POST.get('special_instructions', ''),
-                total_amount=total,
-                status='pending'  # Make sure status is set
-            )
-            
-            logger.info(f"Order created successfully with ID: {order.id}")
-            
-            # Create order items
-            for cart_item in cart_items:
-                order_item = OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    price=cart_item.product.price,
-                    quantity=cart_item.quantity
-                )
-                logger.info(f"Created order item: {order_item.id} for product: {cart_item.product.name}")
-                
-                # Update product stock
-                product = cart_item.product
-                if product.stock_quantity >= cart_item.quantity:
-                    product.stock_quantity -= cart_item.quantity
-                    product.save()
-                    logger.info(f"Updated stock for {product.name}: {product.stock_quantity}")
-                else:
-                    logger.warning(f"Insufficient stock for {product.name}")
-            
-            # Clear the cart
-            cart_items.delete()
-            logger.info("Cart cleared successfully")
-            
-            # Pass the order to template for confirmation display
-            messages.success(request, f"Order #{order.id} placed successfully! We will contact you soon.")
-            
-            return render(request, 'shop/checkout.html', {
-                'order': order,
-                'cart_items': [],
-                'total': 0
-            })
-            
+            reserve_cart(request.user, cart_items)
+        except ReservationFailed as e:
+            logger.info(f"Checkout by {request.user.username} could not reserve: {e}")
+            shop_metrics.record_checkout('reserved', time.perf_counter() - started)
+            for product in e.products:
+                messages.error(request, f"{product.name} is currently reserved by other shoppers. Please try again in a few minutes or reduce the quantity.")
+            return redirect('shop:cart_view')
+
+        try:
+            order = place_order(request.user, cart_items, request.POST)
+        except InsufficientStock as e:
+            release_hold(request.user)
+            shop_metrics.record_checkout('out_of_stock', time.perf_counter() - started)
+            logger.warning(f"Checkout by {request.user.username} blocked by insufficient stock: {e}")
+            for product in e.products:
+                messages.error(request, f"Only {product.stock_quantity} of {product.name} left in stock. Please update your cart.")
+            return redirect('shop:cart_view')
         except Exception as e:
+            shop_metrics.record_checkout('error', time.perf_counter() - started)
             logger.error(f"Error creating order: {str(e)}")
             messages.error(request, "There was an error processing your order. Please try again.")
             return render(request, 'shop/checkout.html', {
                 'cart_items': cart_items,
                 'total': total
             })
+
+        # Stock is now taken off the rows themselves
+        release_hold(request.user)
+        invalidate_shopper_state(request)
+        shop_metrics.record_checkout('placed', time.perf_counter() - started, cart_items, order)
+
+        # Pass the order to template for confirmation display
+        messages.success(request, f"Order #{order.id} placed successfully! We will contact you soon.")
+        
+        return render(request, 'shop/checkout.html', {
+            'order': order,
+            'cart_items': [],
+            'total': 0
+        })
     
     # GET request - show checkout form
     return render(request, 'shop/checkout.html', {
@@ -270,8 +419,28 @@ def checkout(request):
 
 @login_required
 def order_confirmation(request, order_id):
-    order = get_object_or_404(Order, pk=order_id, user=request.user)
+    order = get_object_or_404(
+        Order.objects.prefetch_related(Prefetch('items', OrderItem.objects.select_related('product'))),
+        pk=order_id, user=request.user,
+    )
     return render(request, 'shop/order_confirmation.html', {'order': order})
+
+def metrics(request):
+    """Prometheus scrape endpoint; see shop.metrics"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        # Bytes, since compare_digest rejects non-ASCII str
+        supplied = request.headers.get('Authorization', '').encode()
+        if not hmac.compare_digest(supplied, f'Bearer {token}'.encode()):
+            return HttpResponse("Unauthorized", status=401, content_type='text/plain')
+    elif not request.user.is_staff:
+        # The figures include order values and per-view traffic; without a token only staff may look
+        return HttpResponse("Forbidden", status=403, content_type='text/plain')
+    if not shop_metrics.enabled():
+        return HttpResponse("prometheus_client is not installed", status=503, content_type='text/plain')
+    body, content_type = shop_metrics.render_metrics()
+    return HttpResponse(body, content_type=content_type)
+
 # Add these views to your existing views.py file
 
 from django.shortcuts import render, redirect
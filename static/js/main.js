@@ -60,4 +60,201 @@ document.addEventListener('DOMContentLoaded', function() {
     tooltipTriggerList.map(function (tooltipTriggerEl) {
         return new bootstrap.Tooltip(tooltipTriggerEl);
     });
-});
\ No newline at end of file
+});
+// Catalog infinite scroll
+(function() {
+    const sentinel = document.getElementById('catalog-sentinel');
+    const grid = document.getElementById('catalog-grid');
+    if (!sentinel || !grid) {
+        return;
+    }
+
+    let loading = false;
+
+    function loadNextPage() {
+        const url = sentinel.dataset.nextUrl;
+        if (loading || !url) {
+            return;
+        }
+        loading = true;
+        fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    throw new Error(data.error);
+                }
+                grid.insertAdjacentHTML('beforeend', data.html);
+                if (data.next_url) {
+                    sentinel.dataset.nextUrl = data.next_url;
+                } else {
+                    sentinel.remove();
+                    observer.disconnect();
+                }
+            })
+            .catch(() => showToast('Could not load more products', 'danger'))
+            .finally(() => { loading = false; });
+    }
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadNextPage();
+        }
+    }, { rootMargin: '400px' });
+
+    observer.observe(sentinel);
+    sentinel.querySelector('button').addEventListener('click', loadNextPage);
+})();
+
+// Search-as-you-type suggestions
+(function() {
+    const input = document.getElementById('search-input');
+    const menu = document.getElementById('search-suggestions');
+    if (!input || !menu) {
+        return;
+    }
+
+    const cache = new Map();
+    let timer = null;
+
+    function render(suggestions) {
+        menu.innerHTML = '';
+        suggestions.forEach(suggestion => {
+            const item = document.createElement('li');
+            const link = document.createElement('a');
+            link.className = 'dropdown-item py-2 px-3 rounded-3';
+            link.href = suggestion.url;
+            link.textContent = suggestion.label;
+            if (suggestion.type === 'category') {
+                const badge = document.createElement('small');
+                badge.className = 'text-muted ms-2';
+                badge.textContent = 'Category';
+                link.appendChild(badge);
+            }
+            item.appendChild(link);
+            menu.appendChild(item);
+        });
+        menu.classList.toggle('show', suggestions.length > 0);
+    }
+
+    function suggest() {
+        const query = input.value.trim().toLowerCase();
+        if (!query) {
+            render([]);
+            return;
+        }
+        if (cache.has(query)) {
+            render(cache.get(query));
+            return;
+        }
+        fetch(`${input.dataset.autocompleteUrl}?q=${encodeURIComponent(query)}`)
+            .then(response => response.json())
+            .then(data => {
+                cache.set(query, data.suggestions);
+                if (input.value.trim().toLowerCase() === query) {
+                    render(data.suggestions);
+                }
+            })
+            .catch(() => render([]));
+    }
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(suggest, 120);
+    });
+
+    input.addEventListener('blur', function() {
+        setTimeout(() => menu.classList.remove('show'), 150);
+    });
+})();
+
+// Cart quantity buttons: clicks are collected for a moment and sent as one batch
+(function() {
+    const table = document.getElementById('cart-table');
+    if (!table) {
+        return;
+    }
+
+    const pending = new Map();
+    let timer = null;
+
+    function csrfToken() {
+        const field = table.querySelector('input[name="csrfmiddlewaretoken"]');
+        return field ? field.value : '';
+    }
+
+    function shownQuantity(row) {
+        return parseInt(row.querySelector('[data-quantity]').textContent, 10);
+    }
+
+    function applyState(data) {
+        data.items.forEach(item => {
+            const row = table.querySelector(`[data-cart-item="${item.id}"]`);
+            if (row) {
+                row.querySelector('[data-quantity]').textContent = item.quantity;
+                row.querySelector('[data-line-total]').textContent = item.line_total.toFixed(2);
+            }
+        });
+        data.removed.forEach(id => {
+            const row = table.querySelector(`[data-cart-item="${id}"]`);
+            if (row) {
+                row.remove();
+            }
+        });
+        document.getElementById('cart-grand-total').textContent = data.cart_total.toFixed(2);
+        const badge = document.getElementById('cart-count-badge');
+        if (badge) {
+            badge.textContent = data.item_count;
+        }
+        if (!table.querySelector('[data-cart-item]')) {
+            window.location.reload();
+        }
+    }
+
+    function flush() {
+        timer = null;
+        if (!pending.size) {
+            return;
+        }
+        const operations = {};
+        pending.forEach((delta, id) => { operations[id] = { delta: delta }; });
+        pending.clear();
+        fetch(table.dataset.batchUrl, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfToken(),
+                'X-Requested-With': 'XMLHttpRequest'
+            },
+            body: JSON.stringify({ operations: operations })
+        })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    throw new Error(data.error);
+                }
+                applyState(data);
+            })
+            .catch(() => {
+                showToast('Could not update your cart', 'danger');
+                window.location.reload();
+            });
+    }
+
+    table.querySelectorAll('form[data-delta]').forEach(form => {
+        form.addEventListener('submit', function(event) {
+            event.preventDefault();
+            const row = form.closest('[data-cart-item]');
+            const id = row.dataset.cartItem;
+            const delta = parseInt(form.dataset.delta, 10);
+            const quantity = shownQuantity(row);
+            if (quantity + delta <= 0 && !confirm('This will remove the item from cart. Continue?')) {
+                return;
+            }
+            // Optimistic update; the batch response is authoritative
+            row.querySelector('[data-quantity]').textContent = Math.max(quantity + delta, 0);
+            pending.set(id, (pending.get(id) || 0) + delta);
+            clearTimeout(timer);
+            timer = setTimeout(flush, 300);
+        });
+    });
+})();